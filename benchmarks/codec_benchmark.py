@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Compares the stdlib `json` module with the codec used by runes_client on reply payloads
+shaped like the ones ResultsHandler.send produces (large logs, a list of files).
+
+    python -m benchmarks.codec_benchmark    (from the root of the source code dir)
+"""
+import json
+import timeit
+
+from runes_client import codec
+
+
+def make_reply_payload(log_kb: int, file_count: int) -> dict:
+    log_line = "Step 123/1000 - loss=0.01234 - generating audio chunk for stem 'drums'\n"
+    logs = log_line * (log_kb * 1024 // len(log_line))
+    files = [
+        {
+            "name": f"variation_{i}.wav",
+            "url": f"https://storage.googleapis.com/byoc-file-transfer/variation_{i}.wav",
+            "type": "audio",
+        }
+        for i in range(file_count)
+    ]
+    return {
+        "token": "0715c132-0b31-406e-b562-9206c479a48a",
+        "type": "results",
+        "data": {
+            "response": {
+                "files": files,
+                "error": None,
+                "logs": logs,
+                "message": "Generated variations ✓",
+                "status": "completed",
+                "id": "6d1f3b9e-9b0a-4a4e-8d5b-2a7c1c0e4f11",
+            }
+        },
+    }
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {label:<22} {seconds * 1e6:10.1f} us")
+    return seconds
+
+
+def main():
+    print(f"codec backend: {codec.BACKEND}")
+    for log_kb, file_count in [(4, 2), (256, 10), (2048, 50)]:
+        payload = make_reply_payload(log_kb, file_count)
+        encoded = json.dumps(payload)
+        number = max(10, 20000 // log_kb)
+
+        print(f"\nreply with {log_kb} KB of logs and {file_count} files ({len(encoded)} bytes)")
+        stdlib_dumps = bench("json.dumps", lambda: json.dumps(payload).encode(), number)
+        codec_dumps = bench("codec.dumps_bytes", lambda: codec.dumps_bytes(payload), number)
+        stdlib_loads = bench("json.loads", lambda: json.loads(encoded), number)
+        codec_loads = bench("codec.loads", lambda: codec.loads(encoded), number)
+        print(
+            f"  speedup: dumps x{stdlib_dumps / codec_dumps:.1f}, loads x{stdlib_loads / codec_loads:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
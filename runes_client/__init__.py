@@ -1,8 +1,12 @@
 from .core import (
     connect_to_server,
+    attach_to_running_loop,
+    use_uvloop,
     make_imports_global,
     register_method,
+    register_batch_method,
     register_imports,
+    set_process_workers,
     set_token,
     set_author,
     set_name,
@@ -19,9 +23,27 @@ from .core import (
     set_output_target_bit_depth,
     set_output_target_sample_rate,
     output,
+    outputs,
+    set_http_pool_limits,
+    set_delivery_mode,
+    set_poll_interval_bounds,
+    get_metrics,
+    set_max_concurrent_jobs,
+    set_max_queued_jobs,
+    set_shutdown_grace_period,
+    set_download_concurrency,
+    request_shutdown,
+    set_method_thread_pool_size,
+    set_log_streaming,
+    set_job_deadline,
+    set_result_cache,
+    set_input_cache,
+    set_single_flight,
+    add_client,
     WebSocketClient,
 )
+from .runtime import RunesRuntime
 from .dn_tracer import SentryEventLogger, DNSystemType, DNMsgType, DNMsgStage, DNTag
 from . import utils
 from . import output
-from .decorators import ui_param
+from .decorators import ui_param, deadline, no_result_cache
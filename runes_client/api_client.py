@@ -1,87 +1,110 @@
-import asyncio
 import logging
 from urllib.parse import urljoin
 
-import aiohttp
-
 from .config import (
-    API_BASE_URL,
     URL_UPDATE_CONNECTION_STATUS,
     URL_UPDATE_CONNECTION_LOADED_STATUS,
     URL_CREATE_COMPUTE_CONTRACT,
     URL_ADD_CONNECTION_MAPPING,
     URL_GET_PENDING_MESSAGES,
+    URL_GET_PENDING_MESSAGES_SINCE,
+    PENDING_MESSAGES_PAGE_SIZE,
     URL_UPDATE_MESSAGE_STATUS,
     URL_SEND_MESSAGE_RESPONSE,
+    URL_APPEND_MESSAGE_LOGS,
+    URL_UPDATE_MESSAGE_PROGRESS,
+    URL_MESSAGE_LEASE,
 )
+from . import codec
+from .http_session import shared_session_manager
+from .retry_policy import shared_retry_policy, RetryableStatusError, RETRYABLE_STATUSES
 
 
 class APIClient:
     CONNECTED_STATUS = 1
+    # Statuses returned by hubs that predate the cursor based pending message endpoint
+    CURSOR_UNSUPPORTED_STATUSES = (404, 405, 501)
+    # Statuses returned by hubs without an endpoint (e.g. log streaming)
+    UNSUPPORTED_STATUSES = (404, 405, 501)
 
-    def __init__(self, api_url):
+    def __init__(self, api_url, session_manager=None, retry_policy=None):
         self.api_url = api_url
+        self.session_manager = session_manager or shared_session_manager
+        self.retry_policy = retry_policy or shared_retry_policy
+        # None until the first cursor based fetch tells us whether the hub supports it
+        self.supports_cursor_fetch = None
+        # Set to False once the hub rejects incremental log chunks
+        self.supports_log_streaming = None
+        # Set to False once the hub rejects progress updates
+        self.supports_progress_updates = None
+        # Set to False once the hub rejects message leases
+        self.supports_leases = None
+
+    async def _request(
+        self, endpoint: str, method: str, url: str, idempotent: bool = True, **kwargs
+    ):
+        """
+        Perform one hub call under the shared retry policy and return `(status, body)`.
+        Network errors, timeouts and 429/5xx responses are retried, other statuses are
+        returned to the caller to handle. Calls that must not run twice pass
+        `idempotent=False` and are only retried when the hub never got them.
+        """
+
+        if "json" in kwargs:
+            # Encode once with the fast codec instead of letting aiohttp use stdlib json
+            kwargs["data"] = codec.dumps_bytes(kwargs.pop("json"))
+            kwargs["headers"] = {
+                **kwargs.get("headers", {}),
+                "Content-Type": "application/json",
+            }
+
+        async def attempt():
+            session = await self.session_manager.get_session()
+            async with session.request(method, url, **kwargs) as response:
+                body = await response.text()
+                if response.status in RETRYABLE_STATUSES:
+                    raise RetryableStatusError(response.status, body)
+                return response.status, body
+
+        return await self.retry_policy.call(endpoint, attempt, idempotent=idempotent)
 
     async def connection_heartbeat(self, connection_token: str):
         heartbeat_url = urljoin(
-            API_BASE_URL,
+            self.api_url,
             URL_UPDATE_CONNECTION_STATUS.format(
                 token=connection_token, connection_status=self.CONNECTED_STATUS
             ),
         )
 
-        async with aiohttp.ClientSession() as session:
-            async with session.put(heartbeat_url) as response:
-                if response.status != 200:
-                    logging.info(
-                        f"Error updating status for client_id: {connection_token}. Status code: {response.status}"
-                    )
-                else:
-                    logging.info(
-                        f"Successfully updated status for client_id: {connection_token}"
-                    )
-                    return  # Exit the function on successful response
+        status, _ = await self._request("connection_heartbeat", "PUT", heartbeat_url)
+        if status != 200:
+            logging.info(
+                f"Error updating status for client_id: {connection_token}. Status code: {status}"
+            )
+        else:
+            logging.info(f"Successfully updated status for client_id: {connection_token}")
 
     async def create_compute_contract(self, token: str, data):
         print(f"CREATING CONTRACT {data}")
 
-        # dict_data = data.to_dict()
-
         json_data = {
             "id": token,
             "data": data,
         }
 
-        create_contract_url = urljoin(API_BASE_URL, URL_CREATE_COMPUTE_CONTRACT)
-
-        max_retries = 3  # Maximum number of retries
-        for attempt in range(max_retries):
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        create_contract_url,
-                        json=json_data,
-                    ) as response:
-                        response_data = await response.text()
-                        if response.status != 201:
-                            print(
-                                f"Error creating compute contract. Status code: {response.status}, Response: {response_data}"
-                            )
-                        else:
-                            print(
-                                f"Successfully created compute contract. Response: {response_data}"
-                            )
-                            return (
-                                response_data  # Successful response, exit the function
-                            )
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                logging.error(f"Compute Contract Attempt {attempt + 1} failed: {e}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2**attempt)  # Exponential backoff
-                else:
-                    raise  # Re-raise the last exception if all retries fail
-
-            # TODO: MOVE THIS TO BYOC_API.PY
+        create_contract_url = urljoin(self.api_url, URL_CREATE_COMPUTE_CONTRACT)
+
+        status, response_data = await self._request(
+            "create_compute_contract", "POST", create_contract_url, json=json_data
+        )
+        if status != 201:
+            print(
+                f"Error creating compute contract. Status code: {status}, Response: {response_data}"
+            )
+            return None
+
+        print(f"Successfully created compute contract. Response: {response_data}")
+        return response_data
 
     async def add_connection_mapping(
         self,
@@ -91,7 +114,7 @@ class APIClient:
         description: str,
         connection_type: str,
     ):
-        add_mapping_url = urljoin(API_BASE_URL, URL_ADD_CONNECTION_MAPPING)
+        add_mapping_url = urljoin(self.api_url, URL_ADD_CONNECTION_MAPPING)
 
         payload = {
             "master_token": master_token,
@@ -101,114 +124,294 @@ class APIClient:
             "description": description,
         }
 
-        max_retries = 3  # Define the maximum number of retries
-        for attempt in range(max_retries):
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(add_mapping_url, json=payload) as response:
-                        response_data = await response.text()
-                        print("ADD_MAPPING_RES: " + str(response_data))
-                        if response.status != 201:
-                            print(
-                                f"Error adding connection mapping. Status code: {response.status}, Response: {response_data}"
-                            )
-                        else:
-                            print(
-                                f"Successfully added connection mapping. Response: {response_data}"
-                            )
-                            return response_data  # Break out of the loop on success
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                logging.error(
-                    f"Add Connection Mapping Attempt {attempt + 1} failed: {e}"
-                )
-                if attempt < max_retries - 1:  # Check if we've reached the max retries
-                    await asyncio.sleep(2**attempt)  # Exponential backoff
-                else:
-                    raise  # Re-raise the last exception if all retries fail
+        status, response_data = await self._request(
+            "add_connection_mapping", "POST", add_mapping_url, json=payload
+        )
+        print("ADD_MAPPING_RES: " + str(response_data))
+        if status != 201:
+            print(
+                f"Error adding connection mapping. Status code: {status}, Response: {response_data}"
+            )
+            return None
+
+        print(f"Successfully added connection mapping. Response: {response_data}")
+        return response_data
 
     async def fetch_pending_requests(self, connection_token: str):
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(
-                    urljoin(
-                        API_BASE_URL,
-                        URL_GET_PENDING_MESSAGES.format(
-                            connection_token=connection_token
-                        ),
+        try:
+            status, body = await self._request(
+                "fetch_pending_requests",
+                "GET",
+                urljoin(
+                    self.api_url,
+                    URL_GET_PENDING_MESSAGES.format(connection_token=connection_token),
+                ),
+            )
+            # Check response status. If not 200 OK, print error and continue.
+            if status != 200:
+                print(f"Error fetching connection statuses. HTTP status: {status}")
+                return None
+
+            return codec.loads(body)
+
+        except Exception as e:
+            print(f"Unexpected error during check_connection_statuses: {e}")
+
+    async def fetch_pending_requests_since(
+        self,
+        connection_token: str,
+        cursor=None,
+        page_size: int = PENDING_MESSAGES_PAGE_SIZE,
+    ):
+        """
+        Fetch only the pending messages for `connection_token` that are newer than `cursor`,
+        following the hub's pagination. Returns a `(records, cursor)` tuple where `cursor`
+        is passed back on the next call.
+
+        Falls back to the full `get_latest_pending_messages` listing (filtered to this token)
+        when the hub does not support the cursor protocol.
+        """
+        if self.supports_cursor_fetch is False:
+            return await self._fetch_pending_requests_fallback(connection_token), cursor
+
+        url = urljoin(
+            self.api_url,
+            URL_GET_PENDING_MESSAGES_SINCE.format(connection_token=connection_token),
+        )
+        records = []
+        since = cursor
+        page_cursor = None
+
+        try:
+            while True:
+                params = {"limit": page_size}
+                if since is not None:
+                    params["since"] = since
+                if page_cursor is not None:
+                    params["page"] = page_cursor
+
+                status, body = await self._request(
+                    "fetch_pending_requests", "GET", url, params=params
+                )
+                if status in self.CURSOR_UNSUPPORTED_STATUSES:
+                    print(
+                        f"Cursor based pending message fetch not supported by the hub (HTTP {status}). Falling back."
+                    )
+                    self.supports_cursor_fetch = False
+                    return (
+                        await self._fetch_pending_requests_fallback(connection_token),
+                        cursor,
                     )
-                ) as response:
-                    # Check response status. If not 200 OK, print error and continue.
-                    if response.status != 200:
-                        print(
-                            f"Error fetching connection statuses. HTTP status: {response.status}"
-                        )
-                        return None
 
-                    # Try parsing the response to JSON
-                    data = await response.json()
+                if status != 200:
+                    print(f"Error fetching pending messages. HTTP status: {status}")
+                    return records, cursor
 
-                    return data
+                data = codec.loads(body)
+                self.supports_cursor_fetch = True
+                records.extend(data.get("results", []))
+                # The hub returns the resume point after the messages it handed out
+                cursor = data.get("cursor", cursor)
+                page_cursor = data.get("next")
 
-            except Exception as e:
-                print(f"Unexpected error during check_connection_statuses: {e}")
+                if not page_cursor:
+                    return records, cursor
+
+        except Exception as e:
+            print(f"Unexpected error during fetch_pending_requests_since: {e}")
+            return records, cursor
+
+    async def _fetch_pending_requests_fallback(self, connection_token: str):
+        pending_requests = await self.fetch_pending_requests(connection_token)
+        if not pending_requests:
+            return []
+
+        # The legacy endpoint can return messages for other tokens
+        return [
+            record
+            for record in pending_requests
+            if record.get("token") == connection_token
+        ]
 
     async def update_connection_loaded_status(
         self, connection_token: str, loaded: bool
     ) -> bool:
         update_url = urljoin(
-            API_BASE_URL,
+            self.api_url,
             URL_UPDATE_CONNECTION_LOADED_STATUS.format(token=connection_token),
         )
 
         data = {"loaded": loaded}
 
-        async with aiohttp.ClientSession() as session:
-            async with session.put(update_url, json=data) as response:
-                if response.status != 200:
-                    logging.info(
-                        f"Error updating status for client_id: {connection_token}."
-                    )
-                    return False
-                else:
-                    logging.info(
-                        f"Successfully updated status for client_id: {connection_token}"
-                    )
-                    return True
+        status, _ = await self._request(
+            "update_connection_loaded_status", "PUT", update_url, json=data
+        )
+        if status != 200:
+            logging.info(f"Error updating status for client_id: {connection_token}.")
+            return False
+
+        logging.info(f"Successfully updated status for client_id: {connection_token}")
+        return True
 
     async def update_message_status(self, token: str, message_id: str, new_status: str):
         print(f"UPDATING MESSAGE STATUS for id {message_id}")
         update_url = urljoin(
-            API_BASE_URL,
+            self.api_url,
             URL_UPDATE_MESSAGE_STATUS.format(token=token, message_id=message_id),
         )
         payload = {"status": new_status}
 
-        max_retries = 3  # Define the maximum number of retries
-        for attempt in range(max_retries):
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.patch(update_url, json=payload) as response:
-                        response_data = await response.text()
-                        if response.status != 200:
-                            print(
-                                f"Error updating status for message_id: {message_id} with token: {token}. Status code: {response.status}, Response: {response_data}"
-                            )
-                        else:
-                            print(
-                                f"Successfully updated status for message_id: {message_id} with token: {token}. Response: {response_data}"
-                            )
-                            return  # Exit the function on successful response
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                logging.error(
-                    f"Update Message Status Attempt {attempt + 1} failed: {e}"
-                )
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2**attempt)  # Exponential backoff
-                else:
-                    raise  # Re-raise the last exception if all retries fail
+        status, response_data = await self._request(
+            "update_message_status", "PATCH", update_url, json=payload
+        )
+        if status != 200:
+            print(
+                f"Error updating status for message_id: {message_id} with token: {token}. Status code: {status}, Response: {response_data}"
+            )
+            return False
+
+        print(
+            f"Successfully updated status for message_id: {message_id} with token: {token}. Response: {response_data}"
+        )
+        return True
+
+    async def append_message_logs(
+        self, token: str, message_id: str, logs: str, sequence: int
+    ) -> bool:
+        """Append a chunk of a running job's logs. `sequence` orders the chunks of a message."""
+        append_url = urljoin(
+            self.api_url,
+            URL_APPEND_MESSAGE_LOGS.format(token=token, message_id=message_id),
+        )
+        payload = {"logs": logs, "sequence": sequence}
+
+        status, response_data = await self._request(
+            "append_message_logs", "POST", append_url, json=payload
+        )
+        if status in self.UNSUPPORTED_STATUSES:
+            print(
+                f"Log streaming not supported by the hub (HTTP {status}). Logs are sent with the reply."
+            )
+            self.supports_log_streaming = False
+            return False
+
+        if status not in (200, 201):
+            print(
+                f"Error appending logs for message_id: {message_id}. Status code: {status}, Response: {response_data}"
+            )
+            return False
+
+        self.supports_log_streaming = True
+        return True
+
+    async def update_message_progress(
+        self, token: str, message_id: str, progress: float, note: str = None
+    ) -> bool:
+        progress_url = urljoin(
+            self.api_url,
+            URL_UPDATE_MESSAGE_PROGRESS.format(token=token, message_id=message_id),
+        )
+        payload = {"progress": progress, "note": note}
+
+        status, response_data = await self._request(
+            "update_message_progress", "POST", progress_url, json=payload
+        )
+        if status in self.UNSUPPORTED_STATUSES:
+            print(f"Progress updates not supported by the hub (HTTP {status}).")
+            self.supports_progress_updates = False
+            return False
+
+        if status not in (200, 201):
+            print(
+                f"Error updating progress for message_id: {message_id}. Status code: {status}, Response: {response_data}"
+            )
+            return False
+
+        self.supports_progress_updates = True
+        return True
+
+    async def claim_message(
+        self, token: str, message_id: str, replica_id: str, lease_seconds: float
+    ):
+        """
+        Atomically lease a pending message to `replica_id`. Returns True when this replica
+        holds the lease, False when another replica does (or the message is no longer
+        pending) and None when the outcome is unknown, in which case the message should be
+        left for a later poll. Claiming again with the same `replica_id` is idempotent, so
+        retried requests are safe.
+
+        Hubs without leases get True, the message is then claimed by the processing
+        status update as before.
+        """
+        if self.supports_leases is False:
+            return True
+
+        lease_url = urljoin(
+            self.api_url, URL_MESSAGE_LEASE.format(token=token, message_id=message_id)
+        )
+        payload = {"replica_id": replica_id, "lease_seconds": lease_seconds}
+
+        try:
+            status, response_data = await self._request(
+                "claim_message", "POST", lease_url, json=payload
+            )
+        except Exception as e:
+            print(f"Error claiming message_id: {message_id}: {e}")
+            return None
+
+        if status in self.UNSUPPORTED_STATUSES:
+            print(
+                f"Message leases not supported by the hub (HTTP {status}). Claiming by status update."
+            )
+            self.supports_leases = False
+            return True
+
+        if status == 409:
+            return False
+
+        if status not in (200, 201):
+            print(
+                f"Error claiming message_id: {message_id}. Status code: {status}, Response: {response_data}"
+            )
+            return None
+
+        self.supports_leases = True
+        return True
+
+    async def renew_message_lease(
+        self, token: str, message_id: str, replica_id: str, lease_seconds: float
+    ):
+        """
+        Extend the lease `replica_id` holds on a message. Returns True when renewed, False
+        when the lease was lost (it expired and the message went to another replica) and
+        None when the hub could not be reached.
+        """
+        lease_url = urljoin(
+            self.api_url, URL_MESSAGE_LEASE.format(token=token, message_id=message_id)
+        )
+        payload = {"replica_id": replica_id, "lease_seconds": lease_seconds}
+
+        try:
+            status, response_data = await self._request(
+                "renew_message_lease", "PUT", lease_url, json=payload
+            )
+        except Exception as e:
+            print(f"Error renewing the lease of message_id: {message_id}: {e}")
+            return None
+
+        if status in (404, 409, 410):
+            return False
+
+        if status != 200:
+            print(
+                f"Error renewing the lease of message_id: {message_id}. Status code: {status}, Response: {response_data}"
+            )
+            return None
+
+        return True
 
     async def send_message_response(self, token: str, message_id: str, response: str):
-        send_response_url = urljoin(API_BASE_URL, URL_SEND_MESSAGE_RESPONSE)
+        send_response_url = urljoin(self.api_url, URL_SEND_MESSAGE_RESPONSE)
 
         payload = {
             "id": message_id,
@@ -220,29 +423,22 @@ class APIClient:
         print("SENDING RESPONSE TO: " + str(send_response_url))
         print("SENDING RESPONSE: " + str(payload))
 
-        max_retries = 3  # Define the maximum number of retries
-        for attempt in range(max_retries):
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        send_response_url, json=payload
-                    ) as response:
-                        response_data = await response.text()
-                        print("SEND_RESPONSE_STATUS: " + str(response_data))
-                        if response.status != 200:
-                            print(
-                                f"Error responding to message_id: {message_id} with token: {token}. Status code: {response.status}, Response: {response_data}"
-                            )
-                        else:
-                            print(
-                                f"Successfully responded to message_id: {message_id} with token: {token}. Response: {response_data}"
-                            )
-                            return response_data  # Break out of the loop on success
-            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-                logging.error(
-                    f"Send Message Response Attempt {attempt + 1} failed: {e}"
-                )
-                if attempt < max_retries - 1:  # Check if we've reached the max retries
-                    await asyncio.sleep(2**attempt)  # Exponential backoff
-                else:
-                    raise  # Re-raise the last exception if all retries fail
+        # A timed out reply may still have been recorded, sending it again would reply twice
+        status, response_data = await self._request(
+            "send_message_response",
+            "POST",
+            send_response_url,
+            idempotent=False,
+            json=payload,
+        )
+        print("SEND_RESPONSE_STATUS: " + str(response_data))
+        if status != 200:
+            print(
+                f"Error responding to message_id: {message_id} with token: {token}. Status code: {status}, Response: {response_data}"
+            )
+            return None
+
+        print(
+            f"Successfully responded to message_id: {message_id} with token: {token}. Response: {response_data}"
+        )
+        return response_data
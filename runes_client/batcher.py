@@ -0,0 +1,44 @@
+import asyncio
+
+from .config import BATCH_MAX_SIZE, BATCH_WINDOW_SECONDS
+from .metrics import metrics
+
+
+class MicroBatcher:
+    """
+    Collects requests for one batch method. A batch is dispatched once `max_batch_size`
+    requests are waiting or `window` seconds after its first request arrived, so no
+    request waits longer than the window.
+    """
+
+    def __init__(self, dispatch, max_batch_size=BATCH_MAX_SIZE, window=BATCH_WINDOW_SECONDS):
+        if max_batch_size < 1:
+            raise ValueError(
+                f"Invalid max batch size: '{max_batch_size}'. Must be at least 1."
+            )
+        if window < 0:
+            raise ValueError(f"Invalid batch window: '{window}'. Must be 0 or more.")
+        # dispatch(batch) is called with the list of collected items
+        self.dispatch = dispatch
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.pending = []
+        self._timer = None
+
+    def add(self, item):
+        self.pending.append(item)
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self.pending = self.pending, []
+        if batch:
+            metrics.increment("batches_dispatched_total")
+            metrics.set_gauge("last_batch_size", len(batch))
+            self.dispatch(batch)
@@ -0,0 +1,44 @@
+"""
+JSON codec used for every request/response body, socket message and trace payload.
+
+Uses `orjson` when it is installed (`pip install runes-client[fast-json]`) and falls
+back to the standard library `json` module otherwise.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps_bytes(obj) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Types orjson does not know about are left to the stdlib encoder
+            pass
+    return json.dumps(obj).encode("utf-8")
+
+
+def dumps(obj) -> str:
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def canonical_dumps(obj) -> str:
+    """
+    Stable, key-sorted encoding. Always produced by the stdlib encoder because the
+    output feeds connection token derivation and must not change with the backend.
+    """
+    return json.dumps(obj, sort_keys=True)
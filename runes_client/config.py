@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 # --------- PRODUCTION SETTINGS ----------------
 SOCKET_IP = os.getenv("DN_CLIENT_SOCKET_IP", "signalsandsorceryapi.com")
@@ -8,6 +9,9 @@ SENTRY_API_KEY = os.getenv(
     "https://dbbf2855a707e0448957ad77111449c3@o4506379662131200.ingest.sentry.io/4506379670847488",
 )
 SOCKET_PORT = os.getenv("DN_CLIENT_SOCKET_PORT", "8765")
+SOCKET_SCHEME = os.getenv("DN_CLIENT_SOCKET_SCHEME", "ws")
+# How jobs are delivered: "poll" (HTTP polling) or "websocket" (pushed, with polling as fallback)
+DELIVERY_MODE = os.getenv("DN_CLIENT_DELIVERY_MODE", "poll")
 STORAGE_BUCKET_PATH = os.getenv(
     "DN_CLIENT_STORAGE_BUCKET", "https://storage.googleapis.com/byoc-file-transfer/"
 )
@@ -20,5 +24,128 @@ URL_ADD_CONNECTION_MAPPING = "api/hub/connection_mappings/"
 URL_CREATE_COMPUTE_CONTRACT = "api/hub/compute/contract/"
 URL_GET_COMPUTE_CONTRACT = "api/hub/compute/contract/{token}/"
 URL_GET_PENDING_MESSAGES = "api/hub/get_latest_pending_messages/{connection_token}/"
+URL_GET_PENDING_MESSAGES_SINCE = "api/hub/pending_messages/{connection_token}/"
 URL_UPDATE_MESSAGE_STATUS = "api/hub/update_message_status/{token}/{message_id}/"
 URL_SEND_MESSAGE_RESPONSE = "api/hub/reply_to_message/"
+URL_APPEND_MESSAGE_LOGS = "api/hub/message_logs/{token}/{message_id}/"
+URL_UPDATE_MESSAGE_PROGRESS = "api/hub/message_progress/{token}/{message_id}/"
+URL_MESSAGE_LEASE = "api/hub/message_lease/{token}/{message_id}/"
+
+# HTTP connection pool settings
+HTTP_POOL_LIMIT = int(os.getenv("DN_CLIENT_HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("DN_CLIENT_HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("DN_CLIENT_HTTP_DNS_CACHE_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("DN_CLIENT_HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("DN_CLIENT_HTTP_CONNECT_TIMEOUT", "10"))
+
+# Adaptive poll loop bounds (seconds)
+POLL_MIN_INTERVAL = float(os.getenv("DN_CLIENT_POLL_MIN_INTERVAL", "0.5"))
+POLL_MAX_INTERVAL = float(os.getenv("DN_CLIENT_POLL_MAX_INTERVAL", "5"))
+
+# Max number of pending messages requested per page by the cursor based fetch
+PENDING_MESSAGES_PAGE_SIZE = int(os.getenv("DN_CLIENT_PENDING_MESSAGES_PAGE_SIZE", "50"))
+
+# Threads shared by all clients of a runtime for blocking work such as audio conversion
+WORKER_POOL_SIZE = int(os.getenv("DN_CLIENT_WORKER_POOL_SIZE", "4"))
+
+# Retry, backoff and circuit breaker policy for hub/storage calls
+RETRY_MAX_ATTEMPTS = int(os.getenv("DN_CLIENT_RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("DN_CLIENT_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("DN_CLIENT_RETRY_MAX_DELAY", "10"))
+# Retries allowed per call made, on top of a small floor per second
+RETRY_BUDGET_RATIO = float(os.getenv("DN_CLIENT_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("DN_CLIENT_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("DN_CLIENT_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("DN_CLIENT_CIRCUIT_RESET_TIMEOUT", "30"))
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("DN_CLIENT_HTTP_TIMEOUT", "30"))
+# Per-endpoint timeouts in seconds. None disables the timeout (large file transfers).
+ENDPOINT_TIMEOUTS = {
+    "connection_heartbeat": 5,
+    "fetch_pending_requests": 10,
+    "update_message_status": 10,
+    "append_message_logs": 10,
+    "update_message_progress": 5,
+    "claim_message": 5,
+    "renew_message_lease": 5,
+    "upload_file": None,
+    "download_file": None,
+}
+
+# Number of jobs that may run at the same time, further jobs wait for a free slot
+MAX_CONCURRENT_JOBS = int(os.getenv("DN_CLIENT_MAX_CONCURRENT_JOBS", "1"))
+
+# Jobs that may be claimed from the hub on top of the free slots and wait locally for
+# one. Messages beyond that stay pending for other replicas or the next poll.
+MAX_QUEUED_JOBS = int(os.getenv("DN_CLIENT_MAX_QUEUED_JOBS", "0"))
+
+# Seconds a claimed message stays leased to this replica without a renewal. Leases are
+# renewed every third of that while the job is queued or running, and the hub hands
+# the message to another replica once a lease runs out.
+MESSAGE_LEASE_SECONDS = float(os.getenv("DN_CLIENT_MESSAGE_LEASE_SECONDS", "30"))
+
+# Threads that run plain (non async) registered methods
+METHOD_THREAD_POOL_SIZE = int(os.getenv("DN_CLIENT_METHOD_THREAD_POOL_SIZE", "4"))
+
+# Forked worker processes that run registered methods, 0 runs them in the main process
+PROCESS_WORKERS = int(os.getenv("DN_CLIENT_PROCESS_WORKERS", "0"))
+
+# Most characters of stdout (and of stderr) kept per job, older output is dropped first
+OUTPUT_CAPTURE_MAX_CHARS = int(os.getenv("DN_CLIENT_OUTPUT_CAPTURE_MAX_CHARS", "1000000"))
+
+# Ship a running job's logs to the hub in chunks instead of only with the final reply
+LOG_STREAMING = os.getenv("DN_CLIENT_LOG_STREAMING", "false").lower() in ("1", "true", "yes")
+# Seconds between chunks, a chunk is sent early once it reaches LOG_STREAM_MAX_CHUNK_CHARS
+LOG_STREAM_INTERVAL = float(os.getenv("DN_CLIENT_LOG_STREAM_INTERVAL", "1"))
+LOG_STREAM_MAX_CHUNK_CHARS = int(os.getenv("DN_CLIENT_LOG_STREAM_MAX_CHUNK_CHARS", "16384"))
+# Characters of the end of the logs still sent with the final reply when streaming
+LOG_STREAM_TAIL_CHARS = int(os.getenv("DN_CLIENT_LOG_STREAM_TAIL_CHARS", "4000"))
+
+# Most progress updates sent to the hub per second and job, reports in between are coalesced
+PROGRESS_MAX_UPDATES_PER_SECOND = float(
+    os.getenv("DN_CLIENT_PROGRESS_MAX_UPDATES_PER_SECOND", "4")
+)
+
+# Default seconds a job may run before it is stopped with an error reply, 0 disables it
+JOB_DEADLINE_SECONDS = float(os.getenv("DN_CLIENT_JOB_DEADLINE_SECONDS", "0")) or None
+
+# Micro-batching of batch methods: most requests per call and longest wait for more requests
+BATCH_MAX_SIZE = int(os.getenv("DN_CLIENT_BATCH_MAX_SIZE", "8"))
+BATCH_WINDOW_SECONDS = float(os.getenv("DN_CLIENT_BATCH_WINDOW_SECONDS", "0.05"))
+
+# Opt-in cache of job results keyed by method, params and input file contents
+RESULT_CACHE = os.getenv("DN_CLIENT_RESULT_CACHE", "false").lower() in ("1", "true", "yes")
+RESULT_CACHE_TTL = float(os.getenv("DN_CLIENT_RESULT_CACHE_TTL", "86400"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("DN_CLIENT_RESULT_CACHE_MAX_ENTRIES", "1000"))
+# Directory of the disk tier, empty keeps results in memory only
+RESULT_CACHE_DIR = os.getenv("DN_CLIENT_RESULT_CACHE_DIR", "") or None
+RESULT_CACHE_DISK_MAX_BYTES = int(
+    os.getenv("DN_CLIENT_RESULT_CACHE_DISK_MAX_BYTES", str(50 * 1024 * 1024))
+)
+
+# Opt-in: let identical requests that arrive while one of them runs share its result
+SINGLE_FLIGHT = os.getenv("DN_CLIENT_SINGLE_FLIGHT", "false").lower() in ("1", "true", "yes")
+
+# Input files downloaded at the same time for one message, and across all jobs
+DOWNLOAD_CONCURRENCY_PER_MESSAGE = int(
+    os.getenv("DN_CLIENT_DOWNLOAD_CONCURRENCY_PER_MESSAGE", "4")
+)
+DOWNLOAD_CONCURRENCY = int(os.getenv("DN_CLIENT_DOWNLOAD_CONCURRENCY", "8"))
+
+# Bytes of a download held in memory and written to disk at a time
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DN_CLIENT_DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Opt-in on-disk cache of input files, shared by the processes of a host that use the same directory
+INPUT_CACHE = os.getenv("DN_CLIENT_INPUT_CACHE", "false").lower() in ("1", "true", "yes")
+# Keep it on the filesystem of the job directories so inputs are hardlinked, not copied
+INPUT_CACHE_DIR = os.getenv("DN_CLIENT_INPUT_CACHE_DIR", "") or os.path.join(
+    tempfile.gettempdir(), "runes_client_inputs"
+)
+INPUT_CACHE_MAX_BYTES = int(
+    os.getenv("DN_CLIENT_INPUT_CACHE_MAX_BYTES", str(10 * 1024 * 1024 * 1024))
+)
+
+# Run connect_to_server() on uvloop (pip install runes-client[uvloop]) instead of asyncio's loop
+UVLOOP = os.getenv("DN_CLIENT_UVLOOP", "false").lower() in ("1", "true", "yes")
+
+# Seconds in-flight jobs get to finish after SIGTERM/SIGINT before they are failed
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("DN_CLIENT_SHUTDOWN_GRACE_SECONDS", "30"))
@@ -1,46 +1,86 @@
 import asyncio
-import importlib
-import io
+import contextvars
+import functools
 import sys
-import threading
 import uuid
 
-import websockets
-import nest_asyncio
-import json
 import logging
 import os
+import shutil
 import tempfile
-import aiohttp
 
+from . import codec
 from .api_client import APIClient
+from .http_session import shared_session_manager
 from .utils import process_audio_file
-from .output import ResultsHandler
-from .config import SOCKET_IP, SOCKET_PORT, API_BASE_URL
+from .output import ResultsHandler, ThreadSafeResults
+from .config import (
+    SOCKET_IP,
+    SOCKET_PORT,
+    SOCKET_SCHEME,
+    API_BASE_URL,
+    DELIVERY_MODE,
+    METHOD_THREAD_POOL_SIZE,
+    LOG_STREAMING,
+    LOG_STREAM_INTERVAL,
+    JOB_DEADLINE_SECONDS,
+    BATCH_MAX_SIZE,
+    BATCH_WINDOW_SECONDS,
+    RESULT_CACHE,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_DISK_MAX_BYTES,
+    INPUT_CACHE,
+    INPUT_CACHE_DIR,
+    INPUT_CACHE_MAX_BYTES,
+    SINGLE_FLIGHT,
+    MESSAGE_LEASE_SECONDS,
+    DOWNLOAD_CONCURRENCY,
+    DOWNLOAD_CONCURRENCY_PER_MESSAGE,
+)
 from .dn_tracer import SentryEventLogger, DNSystemType, DNTag, DNMsgStage
+from .ws_transport import WebSocketTransport
+from .poll_scheduler import AdaptivePollScheduler
+from .metrics import metrics
+from .retry_policy import shared_retry_policy
+from .runtime import RunesRuntime, new_event_loop
+from .executor import JobExecutor, ContextThreadPoolExecutor
+from .job import Job
+from .process_pool import current_worker_job
+from .output_capture import OutputCapture, capture_output
+from .log_streamer import LogStreamer
+from .batcher import MicroBatcher
+from .result_cache import ResultCache, make_key, hash_file
+from .file_downloader import FileDownloader
+from .input_cache import InputCache
 from inspect import signature, Parameter
 
-# Apply nest_asyncio to allow nested running of event loops
-nest_asyncio.apply()
-
 logging.basicConfig(
     level=logging.DEBUG, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 
 
-class RunStatus:
-    def __init__(self):
-        self.status = "idle"
+# The job running in the current task/context. Lets output() and the DAW accessors
+# resolve the right results and client when several jobs or clients are active.
+_current_job = contextvars.ContextVar("current_job", default=None)
 
+# The jobs of the batch running in the current task/context, see outputs()
+_current_batch = contextvars.ContextVar("current_batch", default=None)
 
-run_status = RunStatus()
+# Limit on downloads running at once across every job and client, one per event loop
+_download_concurrency = DOWNLOAD_CONCURRENCY
+_download_slots = {}
 
-# Method registry for the client
-method_registry_local = {}
-method_details_local = {}
 
-# This is hold the registered imports function provided by the user
-registered_imports_func = None
+def get_download_slots():
+    loop = asyncio.get_running_loop()
+    slots = _download_slots.get(loop)
+    if slots is None:
+        for stale_loop in [l for l in _download_slots if l.is_closed()]:
+            del _download_slots[stale_loop]
+        slots = _download_slots[loop] = asyncio.Semaphore(_download_concurrency)
+    return slots
 
 
 class WebSocketClient:
@@ -49,20 +89,57 @@ class WebSocketClient:
         self.server_ip = server_ip
         self.server_port = server_port
         self.websocket = None
+        self.delivery_mode = DELIVERY_MODE
         self.method_registry = {}
         self.method_details = {}
-        self.run_status = "idle"
+        # This holds the registered imports function provided by the user
+        self.imports_func = None
         self.connection_token = None
         self.connection_type = "unknown"
         self.master_token = None
         self.message_id = None
+        # Connection token (and with it the contract) of each registered method
+        self.method_tokens = {}
+        # Resume point of the cursor based pending message fetch, per connection token
+        self.message_cursors = {}
         self.results = None
+        self.temp_dir = None
         self.author = "Default Author"
         self.name = "Default Name"
         self.description = "Default Description"
         self.version = "0.0.0"
         self.logger = logging.getLogger(__name__)
         self.dn_tracer = SentryEventLogger(service_name=DNSystemType.DN_CLIENT.value)
+        self.poll_scheduler = AdaptivePollScheduler()
+        self.job_executor = JobExecutor()
+        self.method_thread_pool = None
+        self.process_farm = None
+        # Results of earlier jobs, None unless the result cache is enabled
+        self.result_cache = ResultCache() if RESULT_CACHE else None
+        # Downloaded input files kept on disk, None unless the input cache is enabled
+        self.input_cache = InputCache() if INPUT_CACHE else None
+        # Micro-batchers of the methods registered with register_batch_method()
+        self.batchers = {}
+        # Queued and running jobs by message id, so they can be aborted
+        self.jobs = {}
+        # Batched jobs that were claimed and have not finished yet, by message id
+        self.batched_jobs = {}
+        # Single-flight: the queued or running job of each request key
+        self.single_flight = SINGLE_FLIGHT
+        self.in_flight = {}
+        self.job_deadline_seconds = JOB_DEADLINE_SECONDS
+        self.log_streaming = LOG_STREAMING
+        self.log_stream_interval = LOG_STREAM_INTERVAL
+        # Replicas sharing a connection token lease each message before running it
+        self.replica_id = str(uuid.uuid4())
+        self.lease_seconds = MESSAGE_LEASE_SECONDS
+        # Connection token of each message leased to this replica, by message id
+        self.leases = {}
+        self.lease_task = None
+        # Set on shutdown: no new messages are claimed, running jobs may finish
+        self.draining = False
+        # Input files of one message downloaded at the same time
+        self.download_concurrency = DOWNLOAD_CONCURRENCY_PER_MESSAGE
 
         # Default input target audio settings
         self.input_sample_rate = 44100
@@ -85,18 +162,25 @@ class WebSocketClient:
         if dn_client_token:
             self.master_token = dn_client_token
 
+    @property
+    def connection_tokens(self):
+        """The connection tokens this client serves, one per registered method."""
+        tokens = list(dict.fromkeys(self.method_tokens.values()))
+        if not tokens and self.connection_token is not None:
+            tokens = [self.connection_token]
+        return tokens
+
     async def initialize_dependencies(self):
-        await self.api_client.update_connection_loaded_status(
-            self.connection_token, False
-        )
+        for token in self.connection_tokens:
+            await self.api_client.update_connection_loaded_status(token, False)
         print("INSTALLING DEPENDENCIES - START")
 
-        if registered_imports_func is not None:
-            await registered_imports_func()
+        # The imports are loaded once and shared by every registered method
+        if self.imports_func is not None:
+            await self.imports_func()
 
-        await self.api_client.update_connection_loaded_status(
-            self.connection_token, True
-        )
+        for token in self.connection_tokens:
+            await self.api_client.update_connection_loaded_status(token, True)
         print("INSTALLING DEPENDENCIES - COMPLETE")
 
     async def send_registered_methods_to_server(self):
@@ -110,18 +194,15 @@ class WebSocketClient:
                 "Master Token not set. Please call set_token(token) before calling send_registered_methods_to_server()."
             )
 
-        # FIRST REGISTER THE METHOD
-        if self.method_registry:
-            last_method_name, last_method = next(reversed(self.method_registry.items()))
-            last_method_details = self.method_details[last_method_name]
-
+        # FIRST REGISTER THE METHODS, each one is published as its own contract
+        for method_name, token in self.method_tokens.items():
             await self.api_client.create_compute_contract(
-                token=self.connection_token, data=last_method_details
+                token=token, data=self.method_details[method_name]
             )
 
             await self.api_client.add_connection_mapping(
                 master_token=self.master_token,
-                connection_token=self.connection_token,
+                connection_token=token,
                 name=self.name,
                 description=self.description,
                 connection_type=self.connection_type,
@@ -141,22 +222,23 @@ class WebSocketClient:
                 "Master Token not set. Please call set_token(token) before registering a method."
             )
 
-        # Construct the message to register the compute instance
-        register_compute_instance_msg = {
-            "token": self.connection_token,
-            "type": "register",
-            "data": {
-                "master_token": self.master_token,
-                "name": self.name,
-                "description": self.description,
-                "status": 1,  # Assuming 'status': 1 indicates a successful registration
-            },
-        }
+        for token in self.connection_tokens:
+            # Construct the message to register the compute instance
+            register_compute_instance_msg = {
+                "token": token,
+                "type": "register",
+                "data": {
+                    "master_token": self.master_token,
+                    "name": self.name,
+                    "description": self.description,
+                    "status": 1,  # Assuming 'status': 1 indicates a successful registration
+                },
+            }
 
-        # Send the registration message to the server
-        await self.websocket.send(json.dumps(register_compute_instance_msg))
+            # Send the registration message to the server
+            await self.websocket.send(register_compute_instance_msg)
 
-    async def validate_and_process_parameters(self, method):
+    def validate_and_process_parameters(self, method):
         params = []
         param_names = set()
         sig = signature(method)
@@ -189,7 +271,7 @@ class WebSocketClient:
                 )
 
             default_value = None if param.default is Parameter.empty else param.default
-            default_value = await self.set_default_for_types(
+            default_value = self.set_default_for_types(
                 default_value, param_type_name
             )
 
@@ -270,10 +352,10 @@ class WebSocketClient:
         return method_details
 
     def generate_uuid(self, method_details):
-        method_details_str = json.dumps(method_details, sort_keys=True)
+        method_details_str = codec.canonical_dumps(method_details)
         return str(uuid.uuid5(uuid.UUID(self.master_token), method_details_str))
 
-    async def set_default_for_types(self, default_value, param_type_name):
+    def set_default_for_types(self, default_value, param_type_name):
         # if the type is bool and the default value is None, set it to False
         if param_type_name == "bool" and default_value is None:
             default_value = False
@@ -286,22 +368,24 @@ class WebSocketClient:
         return default_value
 
     async def register_method(self, method):
+        self.add_method(method)
+
+    def add_method(self, method):
+        """Register `method`. Needs no event loop, so it also works inside Jupyter's."""
         if self.master_token is None:
             raise Exception(
                 "Master Token not set. Please call set_token(token) before registering a method."
             )
 
-        if not asyncio.iscoroutinefunction(method):
-            raise ValueError("The method must be asynchronous (async).")
-
         method_name = method.__name__
-        params = await self.validate_and_process_parameters(method)
+        params = self.validate_and_process_parameters(method)
         method_details = self.create_json_payload(method_name, params)
         self.method_details[method_name] = method_details
-        self.method_registry = {method_name: method}
+        # Messages are dispatched on data["method_name"]
+        self.method_registry[method_name] = method
 
         # TODO: there should be a better way to do this:
-        self.connection_token = self.generate_uuid(
+        self.method_tokens[method_name] = self.generate_uuid(
             str(method_details)
             + str(self.master_token)
             + str(self.name)
@@ -309,6 +393,8 @@ class WebSocketClient:
             + str(self.author)
             + str(self.description)
         )
+        # The first registered method's token identifies the client (socket, traces)
+        self.connection_token = next(iter(self.method_tokens.values()))
 
         self.results = ResultsHandler(
             websocket=self.websocket,
@@ -317,6 +403,7 @@ class WebSocketClient:
             target_bit_depth=self.output_bit_depth,
             target_channels=self.output_channels,
             target_format=self.output_format,
+            api_client=self.api_client,
         )
 
         # await self.connect()  # Ensure we're connected
@@ -329,270 +416,796 @@ class WebSocketClient:
             },
         )
 
-    async def run_method(self, name, **kwargs):
-        run_status.status = "running"
-        if name in self.method_registry:
-            method = self.method_registry[name]
-            if asyncio.iscoroutinefunction(method):
-                print("IS COROUTINE")
-                # If the method is a coroutine, await it directly
-                try:
-                    # Capture stdout and stderr
-                    stdout_buffer = io.StringIO()
-                    stderr_buffer = io.StringIO()
-                    sys.stdout = stdout_buffer
-                    sys.stderr = stderr_buffer
+    async def register_batch_method(
+        self, method, max_batch_size=BATCH_MAX_SIZE, window=BATCH_WINDOW_SECONDS
+    ):
+        """
+        Register a method that is called once for a batch of requests. Parameters are type
+        hinted per request, but the method receives one list per parameter holding the
+        values of every request in the batch, and replies through outputs().
+        """
+        self.add_batch_method(method, max_batch_size, window)
+
+    def add_batch_method(
+        self, method, max_batch_size=BATCH_MAX_SIZE, window=BATCH_WINDOW_SECONDS
+    ):
+        self.add_method(method)
+        self.batchers[method.__name__] = MicroBatcher(
+            self.submit_batch, max_batch_size=max_batch_size, window=window
+        )
 
-                    await method(**kwargs)
+    def register_imports(self, func):
+        self.imports_func = func
+
+    def get_method_thread_pool(self):
+        # Kept apart from the worker pool so methods blocking on output() calls can never
+        # starve the audio conversions those calls wait for
+        if self.method_thread_pool is None:
+            self.method_thread_pool = ContextThreadPoolExecutor(
+                max_workers=METHOD_THREAD_POOL_SIZE, thread_name_prefix="runes-method"
+            )
+        return self.method_thread_pool
+
+    def create_results_handler(self, token, message_id):
+        results = ResultsHandler(
+            websocket=self.websocket,
+            token=token,
+            target_sample_rate=self.output_sample_rate,
+            target_bit_depth=self.output_bit_depth,
+            target_channels=self.output_channels,
+            target_format=self.output_format,
+            api_client=self.api_client,
+        )
+        results.set_message_id(message_id)
+        return results
+
+    def job_deadline(self, job):
+        """Seconds the job may run: the shortest of the message's, the method's and the default deadline."""
+        method = self.method_registry.get(job.method_name)
+        deadlines = [
+            job.msg.get("data", {}).get("deadline_seconds"),
+            getattr(method, "_deadline", None),
+            self.job_deadline_seconds,
+        ]
+        deadlines = [deadline for deadline in deadlines if deadline]
+        return min(deadlines) if deadlines else None
+
+    async def run_job(self, job, on_start=None):
+        """Runs inside an executor slot: claim the message, fetch its inputs and run the method."""
+        _current_job.set(job)
+        job.loop = asyncio.get_running_loop()
+        deadline = self.job_deadline(job)
+        try:
+            try:
+                await asyncio.wait_for(self.execute_job(job, on_start), deadline)
+            except asyncio.TimeoutError:
+                metrics.increment("jobs_timed_out_total")
+                await self.reply_job_ended(job, f"Deadline of {deadline} seconds exceeded")
+            except asyncio.CancelledError:
+                if job.cancel_reason is None:
+                    # Not aborted on request (e.g. shutting down), nothing to reply
+                    raise
+                await self.reply_job_ended(job, job.cancel_reason)
+                # Identical requests that were not aborted still want a result
+                self.release_single_flight(job, promote=True)
+        finally:
+            followers = self.release_single_flight(job)
+            self.jobs.pop(job.message_id, None)
+            if job.temp_dir is not None:
+                shutil.rmtree(job.temp_dir, ignore_errors=True)
+            # The plugin that sent this job is likely to send another one soon
+            self.poll_scheduler.wake()
+
+        await self.reply_followers(job, followers)
+
+    def start_job(self, job):
+        self.jobs[job.message_id] = job
+        job.task = self.job_executor.submit(
+            functools.partial(self.run_job, job, job.on_start)
+        )
+
+    def single_flight_key(self, job):
+        """Key shared by identical requests, None when the method must always run."""
+        method = self.method_registry.get(job.method_name)
+        if (
+            not self.single_flight
+            or method is None
+            or getattr(method, "_result_cache", True) is False
+        ):
+            return None
+        # Identical messages carry the same input file URLs, so no download is needed
+        return make_key(
+            {
+                "method": job.method_name,
+                "token": job.token,
+                "params": job.params,
+                # Methods may read the plugin's tempo and rate through get_daw_bpm()
+                "daw": [job.daw_bpm, job.daw_sample_rate],
+                "output": [
+                    self.output_format,
+                    self.output_sample_rate,
+                    self.output_bit_depth,
+                    self.output_channels,
+                ],
+            }
+        )
+
+    def release_single_flight(self, job, promote=False):
+        """
+        Stop routing duplicates to `job` and return the jobs waiting for its result. With
+        `promote` the first of them is started in its place and gets the others.
+        """
+        key = job.single_flight_key
+        if key is not None and self.in_flight.get(key) is job:
+            del self.in_flight[key]
+
+        followers, job.followers = job.followers, []
+        if promote and followers:
+            leader = followers[0]
+            leader.leader = None
+            leader.followers = followers[1:]
+            for follower in leader.followers:
+                follower.leader = leader
+            leader.single_flight_key = key
+            if key is not None:
+                self.in_flight[key] = leader
+            self.start_job(leader)
+            return []
+        return followers
+
+    async def reply_followers(self, job, followers):
+        """Send the result of `job` to the identical requests that waited for it."""
+        for follower in followers:
+            self.jobs.pop(follower.message_id, None)
+            follower.leader = None
+            results = self.create_results_handler(follower.token, follower.message_id)
+            if job.results is not None:
+                results.files = list(job.results.files)
+                results.messages = list(job.results.messages)
+                results.errors = list(job.results.errors)
+                results.logs = job.results.logs
+            else:
+                await results.add_error("The identical request this one waited for failed.")
+            try:
+                if follower.on_start is not None:
+                    await follower.on_start()
+                await results.send()
+            except Exception as e:
+                print(f"Could not reply to message {follower.message_id}: {e}")
+
+    async def result_cache_key(self, job):
+        """Cache key of the job's result, None when its result must not be cached."""
+        method = self.method_registry.get(job.method_name)
+        if (
+            self.result_cache is None
+            or method is None
+            or getattr(method, "_result_cache", True) is False
+        ):
+            return None
+
+        params = job.params
+
+        def hash_inputs():
+            # Downloaded files are identified by their content, not their temp path
+            return {
+                name: {"sha256": hash_file(value)}
+                if isinstance(value, str)
+                and job.temp_dir is not None
+                and value.startswith(job.temp_dir)
+                and os.path.isfile(value)
+                else value
+                for name, value in params.items()
+            }
+
+        key_params = await asyncio.get_running_loop().run_in_executor(None, hash_inputs)
+        return make_key(
+            {
+                "method": job.method_name,
+                "version": self.version,
+                "params": key_params,
+                # Methods may read the plugin's tempo and rate through get_daw_bpm()
+                "daw": [job.daw_bpm, job.daw_sample_rate],
+                "output": [
+                    self.output_format,
+                    self.output_sample_rate,
+                    self.output_bit_depth,
+                    self.output_channels,
+                ],
+            }
+        )
 
-                    # Restore the original stdout and stderr
-                    sys.stdout = sys.__stdout__
-                    sys.stderr = sys.__stderr__
+    async def reply_from_cache(self, job, cache_key):
+        cached = self.result_cache.get(cache_key)
+        if cached is None:
+            return False
 
-                    # Get the captured output as strings
-                    stdout_output = stdout_buffer.getvalue()
-                    stderr_output = stderr_buffer.getvalue()
+        print(f"RESULT CACHE HIT for message {job.message_id}")
+        job.results.files = list(cached["files"])
+        job.results.messages = list(cached["messages"])
+        await job.results.send()
+        return True
 
-                    # Now you can do whatever you want with the output
-                    print("Captured stdout:")
-                    print(stdout_output)
-                    print("Captured stderr:")
-                    print(stderr_output)
+    async def prepare_job(self, job, on_start=None):
+        """Claim the message, create its results and download its input files."""
+        if on_start is not None:
+            await on_start()
 
-                    await self.results.add_log(stdout_output)
-                    await self.results.add_log(stderr_output)
+        job.results = self.create_results_handler(job.token, job.message_id)
 
-                    # If you want to save the output to a file, you can do so here
-                    # with open("stdout.log", "w") as stdout_file:
-                    #     stdout_file.write(stdout_output)
-                    #
-                    # with open("stderr.log", "w") as stderr_file:
-                    #     stderr_file.write(stderr_output)
+        # Download GCP-hosted files and update the JSON
+        try:
+            job.temp_dir = tempfile.mkdtemp()
+            self.logger.info(f"Created a temporary directory: {job.temp_dir}")
+
+            session = await shared_session_manager.get_session()
+            await self.download_gcp_files(job.msg, session, temp_dir=job.temp_dir)
+        except Exception as e:
+            self.dn_tracer.log_error(
+                self.connection_token,
+                {
+                    DNTag.DNMsgStage.value: DNMsgStage.CLIENT_DOWNLOAD_ASSET.value,
+                    DNTag.DNMsg.value: f"Error downloading GCP files: {e}",
+                },
+            )
 
-                    # if self.results.errors is None:
-                    #     self.results.add_error("ENCOUNTERED AN ERROR")
+    async def execute_job(self, job, on_start=None):
+        try:
+            await self.prepare_job(job, on_start)
 
-                    print("ERRORS: " + str(self.results.errors))
+            cache_key = await self.result_cache_key(job)
+            if cache_key is not None and await self.reply_from_cache(job, cache_key):
+                return
 
-                    await self.results.send()
+            await self.run_method(job)
 
-                    self.dn_tracer.log_event(
-                        self.connection_token,
-                        {
-                            DNTag.DNMsgStage.value: DNMsgStage.CLIENT_RUN_METHOD.value,
-                            DNTag.DNMsg.value: f"Ran method: {name}",
-                        },
-                    )
-                except Exception as e:
-                    await self.results.add_error("ERROR:" + str(e))
-                    print(f"IM IN THE EXCEPTION: {e}")
-                    await self.results.send()
+            if cache_key is not None and not job.results.errors:
+                self.result_cache.put(
+                    cache_key,
+                    {"files": job.results.files, "messages": job.results.messages},
+                )
+        except Exception as e:
+            print(f"Unexpected error while running message {job.message_id}: {e}")
+            await self.api_client.update_message_status(
+                token=job.token, message_id=job.message_id, new_status="error"
+            )
 
-                    self.dn_tracer.log_error(
-                        self.connection_token,
-                        {
-                            DNTag.DNMsgStage.value: DNMsgStage.CLIENT_RUN_METHOD.value,
-                            DNTag.DNMsg.value: f"Error running method: {e}",
-                        },
+    def submit_batch(self, batch):
+        """Run a batch of (job, on_start) items collected by a MicroBatcher as one executor job."""
+        jobs = [job for job, _ in batch]
+        task = self.job_executor.submit(functools.partial(self.run_batch, batch))
+        for job in jobs:
+            job.task = task
+
+    async def run_batch(self, batch):
+        jobs = [job for job, _ in batch]
+        _current_batch.set(jobs)
+        loop = asyncio.get_running_loop()
+        for job in jobs:
+            job.loop = loop
+        deadline = self.job_deadline(jobs[0])
+        try:
+            await asyncio.wait_for(self.execute_batch(batch), deadline)
+        except asyncio.TimeoutError:
+            metrics.increment("jobs_timed_out_total", len(jobs))
+            for job in jobs:
+                await self.reply_job_ended(job, f"Deadline of {deadline} seconds exceeded")
+        finally:
+            for job in jobs:
+                self.batched_jobs.pop(job.message_id, None)
+                if job.temp_dir is not None:
+                    shutil.rmtree(job.temp_dir, ignore_errors=True)
+            self.poll_scheduler.wake()
+
+    async def execute_batch(self, batch):
+        name = batch[0][0].method_name
+        method = self.method_registry[name]
+
+        jobs = []
+        for job, on_start in batch:
+            try:
+                await self.prepare_job(job, on_start)
+                jobs.append(job)
+            except Exception as e:
+                print(f"Unexpected error while preparing message {job.message_id}: {e}")
+                await self.api_client.update_message_status(
+                    token=job.token, message_id=job.message_id, new_status="error"
+                )
+        if not jobs:
+            return
+        # outputs() only covers the jobs that made it into the call
+        _current_batch.set(jobs)
+        print(f"RUNNING BATCH OF {len(jobs)} FOR {name}")
+
+        # One list per parameter, in the order of the jobs
+        param_names = list(
+            dict.fromkeys(param_name for job in jobs for param_name in job.params)
+        )
+        kwargs = {
+            param_name: [job.params.get(param_name) for job in jobs]
+            for param_name in param_names
+        }
+
+        captured = OutputCapture()
+        try:
+            with capture_output(captured):
+                if asyncio.iscoroutinefunction(method):
+                    await method(**kwargs)
+                else:
+                    await asyncio.get_running_loop().run_in_executor(
+                        self.get_method_thread_pool(),
+                        functools.partial(method, **kwargs),
                     )
-            else:
-                print("IS NOT COROUTINE")
-                # If the method is not a coroutine, run it in an executor
-                # loop = asyncio.get_running_loop()
-                # try:
-                #     func = lambda: method(**kwargs)
-                #     result = await loop.run_in_executor(None, func)
-                #     self.dn_tracer.log_event(self.connection_token, {
-                #         DNTag.DNMsgStage.value: DNMsgStage.CLIENT_RUN_METHOD.value,
-                #         DNTag.DNMsg.value: f"Ran method: {name}",
-                #     })
-                # except Exception as e:
-                #     self.dn_tracer.log_error(self.connection_token, {
-                #         DNTag.DNMsgStage.value: DNMsgStage.CLIENT_RUN_METHOD.value,
-                #         DNTag.DNMsg.value: f"Error running method: {e}",
-                #     })
-
-            run_status.status = "stopped"
-            return True
-        else:
-            run_status.status = "stopped"
-            raise Exception("Method not registered")
+        except Exception as e:
+            print(f"Error running batch of {name}: {e}")
+            for job in jobs:
+                await job.results.add_error("ERROR:" + str(e))
+
+        # The batch shares one output, every reply carries it
+        for job in jobs:
+            await self.add_captured_logs(job.results, captured)
+            try:
+                await job.results.send()
+            except Exception as e:
+                print(f"Could not reply to message {job.message_id}: {e}")
+
+        self.dn_tracer.log_event(
+            self.connection_token,
+            {
+                DNTag.DNMsgStage.value: DNMsgStage.CLIENT_RUN_METHOD.value,
+                DNTag.DNMsg.value: f"Ran batch of {len(jobs)}: {name}",
+            },
+        )
+
+    async def reply_job_ended(self, job, reason):
+        """Send the error reply of a job that was aborted or ran out of time."""
+        print(f"Job {job.message_id} ended early: {reason}")
+        if job.results is None:
+            job.results = self.create_results_handler(job.token, job.message_id)
+        try:
+            await job.results.add_error(reason)
+            await job.results.send()
+        except Exception as e:
+            print(f"Could not reply to ended job {job.message_id}: {e}")
 
-    async def download_gcp_files(self, obj, session):
+    async def claim_record(self, record):
         """
-        Recursively search for GCP URLs in a JSON object and download the files.
+        Lease a fetched run_method message to this replica, so no other replica sharing
+        the token runs it too. Returns the result of APIClient.claim_message().
         """
+        claimed = await self.api_client.claim_message(
+            record["token"], record["id"], self.replica_id, self.lease_seconds
+        )
+        if claimed is False:
+            metrics.increment("message_claims_conflicted_total")
+        elif claimed and self.api_client.supports_leases:
+            self.leases[record["id"]] = record["token"]
+            if self.lease_task is None or self.lease_task.done():
+                self.lease_task = asyncio.create_task(self.renew_leases())
+        return claimed
+
+    async def renew_leases(self):
+        """Keep the leases of queued and running jobs alive until every one has ended."""
+        while self.leases:
+            await asyncio.sleep(self.lease_seconds / 3)
+            for message_id, token in list(self.leases.items()):
+                if message_id not in self.jobs and message_id not in self.batched_jobs:
+                    # Ended, the reply or status update released the message
+                    self.leases.pop(message_id, None)
+                    continue
+
+                renewed = await self.api_client.renew_message_lease(
+                    token, message_id, self.replica_id, self.lease_seconds
+                )
+                if renewed is False:
+                    # Expired and handed to another replica, which now owns the result
+                    self.leases.pop(message_id, None)
+                    metrics.increment("message_leases_lost_total")
+                    self.abandon_job(message_id)
+                elif renewed:
+                    metrics.increment("message_leases_renewed_total")
+
+    def abandon_job(self, message_id):
+        """Stop a job without replying, once another replica took over its message."""
+        job = self.jobs.pop(message_id, None)
+        if job is None:
+            # Batched requests run together and cannot be stopped on their own
+            return False
+
+        if job.leader is not None:
+            job.leader.followers.remove(job)
+            job.leader = None
+            return True
+
+        # Identical requests leased by this replica still want a result
+        self.release_single_flight(job, promote=True)
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+        return True
+
+    async def start_draining(self):
+        """Stop claiming messages and tell the hub this connection is going away."""
+        self.draining = True
+        # Requests already claimed for a batch still run
+        for batcher in self.batchers.values():
+            batcher.flush()
+        for token in self.connection_tokens:
+            try:
+                await self.api_client.update_connection_loaded_status(token, False)
+            except Exception as e:
+                print(f"Could not mark token {token} as not loaded: {e}")
+
+    async def fail_jobs(self, reason):
+        """End every queued and running job with an error reply."""
+        for message_id in list(self.jobs):
+            await self.cancel_job(message_id, reason=reason)
+        for message_id, job in list(self.batched_jobs.items()):
+            self.batched_jobs.pop(message_id, None)
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+            metrics.increment("jobs_cancelled_total")
+            await self.reply_job_ended(job, reason)
+
+    def finish_draining(self):
+        """Release what is left once every job has ended."""
+        if self.lease_task is not None:
+            self.lease_task.cancel()
+        self.leases.clear()
+        for job in [*self.jobs.values(), *self.batched_jobs.values()]:
+            if job.temp_dir is not None:
+                shutil.rmtree(job.temp_dir, ignore_errors=True)
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+
+    async def cancel_job(self, message_id, reason="Aborted"):
+        """Stop a queued or running job. Returns False if no such job is known."""
+        job = self.jobs.get(message_id)
+        if job is None:
+            return False
+
+        if job.leader is not None:
+            # Only waiting for an identical request, just stop waiting
+            job.leader.followers.remove(job)
+            job.leader = None
+            self.jobs.pop(message_id, None)
+            metrics.increment("jobs_cancelled_total")
+            await self.reply_job_ended(job, reason)
+            return True
+
+        if job.task is None or job.task.done():
+            return False
+
+        job.cancel_reason = reason
+        metrics.increment("jobs_cancelled_total")
+        started = job.loop is not None
+        job.task.cancel()
+        if not started:
+            # A queued job never reaches run_job, so reply for it here
+            self.jobs.pop(message_id, None)
+            self.release_single_flight(job, promote=True)
+            await self.reply_job_ended(job, reason)
+        return True
+
+    async def run_method(self, job):
+        name = job.method_name
+        kwargs = job.params
+        results = job.results
+        if name in self.method_registry:
+            method = self.method_registry[name]
+            is_coroutine = asyncio.iscoroutinefunction(method)
+            print("IS COROUTINE" if is_coroutine else "IS NOT COROUTINE")
+            # Only this job's writes (including those of threads it runs on) land in here
+            captured = OutputCapture()
+            log_streamer = self.create_log_streamer(job)
+            if log_streamer is not None:
+                log_streamer.start(captured)
+            try:
+                with capture_output(captured):
+                    if self.process_farm is not None and self.process_farm.started:
+                        await self.run_method_in_process(job, results)
+                    elif is_coroutine:
+                        # If the method is a coroutine, await it directly
+                        await method(**kwargs)
+                    else:
+                        # Threads cannot be stopped: on cancellation the job ends right away
+                        # but the method keeps running until it returns.
+                        # Plain functions run on the method thread pool so they do not block
+                        # heartbeats and polling. The pool runs them in a copy of this context,
+                        # which keeps output() and the output capture bound to this job.
+                        await asyncio.get_running_loop().run_in_executor(
+                            self.get_method_thread_pool(),
+                            functools.partial(method, **kwargs),
+                        )
+
+                # Get the captured output as strings
+                stdout_output = captured.stdout.getvalue()
+                stderr_output = captured.stderr.getvalue()
+
+                # Now you can do whatever you want with the output
+                print("Captured stdout:")
+                print(stdout_output)
+                print("Captured stderr:")
+                print(stderr_output)
+
+                await self.add_captured_logs(results, captured, log_streamer)
+
+                # If you want to save the output to a file, you can do so here
+                # with open("stdout.log", "w") as stdout_file:
+                #     stdout_file.write(stdout_output)
+                #
+                # with open("stderr.log", "w") as stderr_file:
+                #     stderr_file.write(stderr_output)
+
+                # if results.errors is None:
+                #     results.add_error("ENCOUNTERED AN ERROR")
+
+                print("ERRORS: " + str(results.errors))
+
+                await results.send()
+
+                self.dn_tracer.log_event(
+                    self.connection_token,
+                    {
+                        DNTag.DNMsgStage.value: DNMsgStage.CLIENT_RUN_METHOD.value,
+                        DNTag.DNMsg.value: f"Ran method: {name}",
+                    },
+                )
+            except asyncio.CancelledError:
+                # Aborted or out of time, the caller sends the error reply
+                if log_streamer is not None:
+                    await log_streamer.close()
+                raise
+            except Exception as e:
+                await results.add_error("ERROR:" + str(e))
+                print(f"IM IN THE EXCEPTION: {e}")
+                await self.add_captured_logs(results, captured, log_streamer)
+                await results.send()
+
+                self.dn_tracer.log_error(
+                    self.connection_token,
+                    {
+                        DNTag.DNMsgStage.value: DNMsgStage.CLIENT_RUN_METHOD.value,
+                        DNTag.DNMsg.value: f"Error running method: {e}",
+                    },
+                )
+
+            return True
+        else:
+            await results.add_error(f"Method not registered: {name}")
+            await results.send()
+            return False
+
+    def create_log_streamer(self, job):
+        if not self.log_streaming or self.api_client.supports_log_streaming is False:
+            return None
+        return LogStreamer(
+            self.api_client,
+            job.token,
+            job.message_id,
+            interval=self.log_stream_interval,
+        )
+
+    async def add_captured_logs(self, results, captured, log_streamer=None):
+        stdout_output = captured.stdout.getvalue()
+        stderr_output = captured.stderr.getvalue()
+
+        if log_streamer is not None:
+            await log_streamer.close()
+            if log_streamer.delivered:
+                # The hub already has the full logs, the reply only carries the tail
+                await results.add_log(log_streamer.reply_logs(stdout_output + stderr_output))
+                return
+
+        await results.add_log(stdout_output)
+        await results.add_log(stderr_output)
+
+    async def run_method_in_process(self, job, results):
+        # Cancelling this kills the worker running the method
+        descriptor = await self.process_farm.run(
+            self,
+            job.method_name,
+            job.params,
+            job.daw_bpm,
+            job.daw_sample_rate,
+        )
+        # Hand the worker's output to the capture buffers of run_method
+        sys.stdout.write(descriptor["stdout"])
+        sys.stderr.write(descriptor["stderr"])
+
+        # Uploads and the reply happen here in the parent
+        for op, args in descriptor["ops"]:
+            if op == "progress":
+                results.progress(*args)
+            else:
+                await getattr(results, op)(*args)
+
+        if descriptor["error"] is not None:
+            raise Exception(descriptor["error"])
+
+    def find_gcp_urls(self, obj, found):
+        """Append (container, key, url) for every GCP URL in a JSON object, depth first."""
         if isinstance(obj, dict):
             for key, value in obj.items():
                 if isinstance(value, str) and value.startswith(
                     "https://storage.googleapis.com"
                 ):
-                    # Download and replace the URL with a local file path
-                    try:
-                        obj[key] = await self.download_file(value, session)
-
-                        self.dn_tracer.log_event(
-                            self.connection_token,
-                            {
-                                DNTag.DNMsgStage.value: DNMsgStage.CLIENT_DOWNLOAD_ASSET.value,
-                                DNTag.DNMsg.value: f"Downloaded: {str(obj[key])}",
-                            },
-                        )
-                    except Exception as e:
-                        self.dn_tracer.log_error(
-                            self.connection_token,
-                            {
-                                DNTag.DNMsgStage.value: DNMsgStage.CLIENT_DOWNLOAD_ASSET.value,
-                                DNTag.DNMsg.value: f"Error downloading: {e}",
-                            },
-                        )
+                    found.append((obj, key, value))
                 elif isinstance(value, (dict, list)):
-                    await self.download_gcp_files(value, session)
+                    self.find_gcp_urls(value, found)
         elif isinstance(obj, list):
             for item in obj:
-                await self.download_gcp_files(item, session)
+                self.find_gcp_urls(item, found)
+        return found
+
+    @staticmethod
+    def local_file_names(urls):
+        """
+        File name for each URL, in order. Different URLs ending in the same name, or in
+        the same name with another extension, get a prefix: converted audio inputs are
+        written as resampled/<name>.<format> and must not overwrite each other.
+        """
+        names = {}
+        used = set()
+        for index, url in enumerate(urls):
+            name = url.split("/")[-1]
+            while os.path.splitext(name)[0] in used:
+                name = f"{index}_{name}"
+            used.add(os.path.splitext(name)[0])
+            names[url] = name
+        return names
+
+    async def download_gcp_files(self, obj, session, temp_dir=None):
+        """
+        Download every GCP URL in a JSON object concurrently and replace it with the local
+        file path. A URL appearing several times is downloaded once.
+        """
+        found = self.find_gcp_urls(obj, [])
+        urls = list(dict.fromkeys(url for _, _, url in found))
+        if not urls:
+            return
+        names = self.local_file_names(urls)
+        message_slots = asyncio.Semaphore(self.download_concurrency)
+        process_slots = get_download_slots()
+
+        async def resolve(url):
+            async with message_slots, process_slots:
+                try:
+                    local_path = await self.download_file(
+                        url, session, temp_dir=temp_dir, local_filename=names[url]
+                    )
+                except Exception as e:
+                    self.dn_tracer.log_error(
+                        self.connection_token,
+                        {
+                            DNTag.DNMsgStage.value: DNMsgStage.CLIENT_DOWNLOAD_ASSET.value,
+                            DNTag.DNMsg.value: f"Error downloading: {e}",
+                        },
+                    )
+                    return None
+
+            self.dn_tracer.log_event(
+                self.connection_token,
+                {
+                    DNTag.DNMsgStage.value: DNMsgStage.CLIENT_DOWNLOAD_ASSET.value,
+                    DNTag.DNMsg.value: f"Downloaded: {str(local_path)}",
+                },
+            )
+            return local_path
+
+        local_paths = dict(zip(urls, await asyncio.gather(*map(resolve, urls))))
+        metrics.increment("asset_downloads_total", len(urls))
+        metrics.increment("asset_downloads_deduplicated_total", len(found) - len(urls))
+
+        # Replaced in message order, so the message does not depend on which download finished first
+        for container, key, url in found:
+            if local_paths[url] is not None:
+                container[key] = local_paths[url]
 
-    async def download_file(self, url, session):
+    async def download_file(self, url, session, temp_dir=None, local_filename=None):
         """
         Download a file from a URL, save it to a temporary directory, and process if it's an audio file.
         """
-        local_filename = url.split("/")[-1]
-        local_path = os.path.join(self.temp_dir, local_filename)
-
-        async with session.get(url) as response:
-            if response.status == 200:
-                with open(local_path, "wb") as f:
-                    f.write(await response.read())
-
-                # Check if the file is an audio file
-                if os.path.splitext(local_path)[1][1:] in [
-                    "wav",
-                    "mp3",
-                    "aif",
-                    "aiff",
-                    "flac",
-                    "ogg",
-                ]:
-                    try:
-                        local_path = process_audio_file(
-                            local_path,
-                            self.input_format,
-                            self.input_sample_rate,
-                            self.input_bit_depth,
-                            self.input_channels,
-                        )
+        local_filename = local_filename or url.split("/")[-1]
+        local_path = os.path.join(temp_dir or self.temp_dir, local_filename)
 
-                        self.dn_tracer.log_event(
-                            self.connection_token,
-                            {
-                                DNTag.DNMsgStage.value: DNMsgStage.CLIENT_CONVERT_DOWNLOAD.value,
-                                DNTag.DNMsg.value: f"Converted download: {local_path}",
-                            },
-                        )
-                    except Exception as e:
-                        self.dn_tracer.log_error(
-                            self.connection_token,
-                            {
-                                DNTag.DNMsgStage.value: DNMsgStage.CLIENT_CONVERT_DOWNLOAD.value,
-                                DNTag.DNMsg.value: f"Error converting downloading: {e}",
-                            },
-                        )
+        downloader = FileDownloader(retry_policy=self.api_client.retry_policy)
+        if self.input_cache is not None:
+            # Read-only hardlink of the cached content, never modify inputs in place
+            await self.input_cache.fetch(url, local_path, downloader, session=session)
+        else:
+            await downloader.download(url, local_path, session=session)
+
+        # Check if the file is an audio file
+        if os.path.splitext(local_path)[1][1:] in [
+            "wav",
+            "mp3",
+            "aif",
+            "aiff",
+            "flac",
+            "ogg",
+        ]:
+            try:
+                # Conversion is CPU bound, keep it off the event loop
+                local_path = await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    functools.partial(
+                        process_audio_file,
+                        local_path,
+                        self.input_format,
+                        self.input_sample_rate,
+                        self.input_bit_depth,
+                        self.input_channels,
+                    ),
+                )
 
-                return local_path
-            else:
-                raise Exception(f"Failed to download file: {url}")
-
-    # async def listen(self):
-    #     if self.connection_token is None:
-    #         raise Exception(
-    #             "Token not set. Please call set_token(token) before starting to listen."
-    #         )
-    #
-    #     await self.connect()  # Ensure we're connected
-    #
-    #     try:
-    #         # Create a temporary directory
-    #         self.temp_dir = tempfile.mkdtemp()
-    #         self.logger.info(f"Created a temporary directory: {self.temp_dir}")
-    #
-    #         async with aiohttp.ClientSession() as session:
-    #             # Continuous listening loop
-    #             while True:
-    #                 print("LISTENING")
-    #                 # register_compute_instance_msg = await self.websocket.recv()
-    #                 #
-    #                 # msg = json.loads(register_compute_instance_msg)
-    #                 #
-    #                 # # Download GCP-hosted files and update the JSON
-    #                 # try:
-    #                 #     await self.download_gcp_files(msg, session)
-    #                 # except Exception as e:
-    #                 #     self.dn_tracer.log_error(
-    #                 #         _client.connection_token,
-    #                 #         {
-    #                 #             DNTag.DNMsgStage.value: DNMsgStage.CLIENT_DOWNLOAD_ASSET.value,
-    #                 #             DNTag.DNMsg.value: f"Error downloading GCP files: {e}",
-    #                 #         },
-    #                 #     )
-    #                 #
-    #                 # if "type" in msg:
-    #                 #     print(
-    #                 #         "HANDLE MSG TYPE: " + str(msg)
-    #                 #     )  # investigate why this prevents a race condition!!!!
-    #                 #     if msg["type"] == "run_method":
-    #                 #         print(
-    #                 #             "RUN METHOD RECEIVED"
-    #                 #         )  # investigate why this prevents a race condition!!!!
-    #                 #         # Check if the status is already "running"
-    #                 #         if run_status.status == "running":
-    #                 #             await self.websocket.send("Plugin already started!")
-    #                 #         else:
-    #                 #             self.results.clear_outputs()  # Clear previous outputs before running the method
-    #                 #             self.message_id = msg["message_id"]
-    #                 #             self.results.set_message_id(self.message_id)
-    #                 #             self.daw_bpm = msg["bpm"]
-    #                 #             self.daw_sample_rate = msg["sample_rate"]
-    #                 #
-    #                 #             data = msg["data"]
-    #                 #             method_name = data["method_name"]
-    #                 #             # Extract 'value' for each parameter to build kwargs
-    #                 #             params = {
-    #                 #                 param_name: param_details["value"]
-    #                 #                 for param_name, param_details in data[
-    #                 #                     "params"
-    #                 #                 ].items()
-    #                 #             }
-    #                 #
-    #                 #             # Now you can call run_method using argument unpacking
-    #                 #             asyncio.create_task(
-    #                 #                 self.run_method(method_name, **params)
-    #                 #             )
-    #                 #     elif msg["type"] == "close_connection":
-    #                 #         try:
-    #                 #             await self.websocket.close()
-    #                 #         except Exception as e:
-    #                 #             print("Error closing connection: ", e)
-    #                 #
-    #                 #         print("Connection closed by server")
-    #                 #         break  # Exit the while loop
-    #                 #
-    #                 # else:
-    #                 #     self.dn_tracer.log_error(
-    #                 #         _client.connection_token,
-    #                 #         {
-    #                 #             DNTag.DNMsgStage.value: DNMsgStage.CLIENT_CONNECTION.value,
-    #                 #             DNTag.DNMsg.value: "UNKNOWN MESSAGE TYPE",
-    #                 #         },
-    #                 #     )
-    #
-    #     except websockets.exceptions.ConnectionClosedOK:
-    #         self.dn_tracer.log_error(
-    #             _client.connection_token,
-    #             {
-    #                 DNTag.DNMsgStage.value: DNMsgStage.CLIENT_CONNECTION.value,
-    #                 DNTag.DNMsg.value: "Connection was closed.",
-    #             },
-    #         )
+                self.dn_tracer.log_event(
+                    self.connection_token,
+                    {
+                        DNTag.DNMsgStage.value: DNMsgStage.CLIENT_CONVERT_DOWNLOAD.value,
+                        DNTag.DNMsg.value: f"Converted download: {local_path}",
+                    },
+                )
+            except Exception as e:
+                self.dn_tracer.log_error(
+                    self.connection_token,
+                    {
+                        DNTag.DNMsgStage.value: DNMsgStage.CLIENT_CONVERT_DOWNLOAD.value,
+                        DNTag.DNMsg.value: f"Error converting downloading: {e}",
+                    },
+                )
+
+        return local_path
+
+    def websocket_uri(self):
+        return f"{SOCKET_SCHEME}://{self.server_ip}:{self.server_port}"
+
+    async def listen(self):
+        """
+        Receive jobs pushed over a persistent WebSocket instead of waiting for the next poll.
+        Polling stays active as a fallback while the socket is disconnected.
+        """
+        if self.connection_token is None:
+            raise Exception(
+                "Token not set. Please call set_token(token) before starting to listen."
+            )
+
+        self.websocket = WebSocketTransport(
+            self.websocket_uri(),
+            on_message=self.handle_pushed_message,
+            on_connect=self.register_compute_instance,
+        )
+        if self.results is not None:
+            self.results.websocket = self.websocket
+
+        try:
+            await self.websocket.run()
+        finally:
+            self.dn_tracer.log_event(
+                self.connection_token,
+                {
+                    DNTag.DNMsgStage.value: DNMsgStage.CLIENT_CONNECTION.value,
+                    DNTag.DNMsg.value: "Connection was closed.",
+                },
+            )
+
+    async def handle_pushed_message(self, msg):
+        message_id = msg.get("message_id")
+        token = msg.get("token") or self.connection_token
+
+        async def acknowledge():
+            # Acknowledge on the same socket once a slot is taken
+            await self.websocket.send(
+                {
+                    "token": token,
+                    "type": "update_message_status",
+                    "message_id": message_id,
+                    "status": "processing",
+                }
+            )
+
+        await self.handle_pending_requests(
+            message_id=message_id, msg=msg, on_start=acknowledge, token=token
+        )
 
     def set_token(self, token):
         dn_client_token = os.getenv("DN_CLIENT_TOKEN")
@@ -620,6 +1233,9 @@ class WebSocketClient:
     def set_connection_type(self, connection_type):
         self.connection_type = connection_type
 
+    def set_delivery_mode(self, delivery_mode):
+        self.delivery_mode = delivery_mode
+
     def update_all_method_details(self):
         for method_name, method_detail in self.method_details.items():
             # If method_detail is already a dict, no need to load it
@@ -639,41 +1255,15 @@ class WebSocketClient:
     # NEW POLLING METHODS
     # NEW POLLING METHODS
 
-    HEARTBEAT_INTERVAL = 2
-    POLL_UPDATES_INTERVAL = 2
-
-    async def heartbeat(self):
-        while True:
-            try:
-                await self.api_client.connection_heartbeat(self.connection_token)
-                print("Heartbeat successful.")
-            except Exception as e:
-                print(f"An error occurred in heartbeat: {e}")
-            await asyncio.sleep(
-                self.HEARTBEAT_INTERVAL
-            )  # Wait for 10 seconds before the next heartbeat
-
-    async def handle_pending_requests(self, message_id, msg):
-        # register_compute_instance_msg = await self.websocket.recv()
-
-        # msg = json.loads(register_compute_instance_msg)
-
-        # Download GCP-hosted files and update the JSON
+    async def send_heartbeat(self):
         try:
-            self.temp_dir = tempfile.mkdtemp()
-            self.logger.info(f"Created a temporary directory: {self.temp_dir}")
-
-            async with aiohttp.ClientSession() as session:
-                await self.download_gcp_files(msg, session)
+            for token in self.connection_tokens:
+                await self.api_client.connection_heartbeat(token)
+            print("Heartbeat successful.")
         except Exception as e:
-            self.dn_tracer.log_error(
-                _client.connection_token,
-                {
-                    DNTag.DNMsgStage.value: DNMsgStage.CLIENT_DOWNLOAD_ASSET.value,
-                    DNTag.DNMsg.value: f"Error downloading GCP files: {e}",
-                },
-            )
+            print(f"An error occurred in heartbeat: {e}")
 
+    async def handle_pending_requests(self, message_id, msg, on_start=None, token=None):
         print(f"MSG: {msg}  ")
 
         if "type" in msg:
@@ -684,115 +1274,263 @@ class WebSocketClient:
                 print(
                     "RUN METHOD RECEIVED"
                 )  # investigate why this prevents a race condition!!!!
-                # Check if the status is already "running"
-                if run_status.status == "running":
-                    await self.websocket.send("Plugin already started!")
-                else:
-                    self.results.clear_outputs()  # Clear previous outputs before running the method
-                    self.message_id = message_id
-                    self.results.set_message_id(message_id)
-                    self.daw_bpm = msg["bpm"]
-                    self.daw_sample_rate = msg["sample_rate"]
-
-                    data = msg["data"]
-                    method_name = data["method_name"]
-                    # Extract 'value' for each parameter to build kwargs
-                    params = {
-                        param_name: param_details["value"]
-                        for param_name, param_details in data["params"].items()
-                    }
-
-                    # Now you can call run_method using argument unpacking
-                    asyncio.create_task(self.run_method(method_name, **params))
+                # Each message gets its own job and results; it waits for a free slot
+                job = Job(self, token or self.connection_token, message_id, msg)
+                job.on_start = on_start
+                batcher = self.batchers.get(job.method_name)
+                if batcher is not None:
+                    # Runs together with other requests for the same method
+                    self.batched_jobs[message_id] = job
+                    batcher.add((job, on_start))
+                    return job
+
+                key = self.single_flight_key(job)
+                leader = self.in_flight.get(key) if key is not None else None
+                if leader is not None:
+                    # An identical request is already queued or running, share its result
+                    job.leader = leader
+                    leader.followers.append(job)
+                    self.jobs[message_id] = job
+                    metrics.increment("single_flight_coalesced_total")
+                    return job
+
+                if key is not None:
+                    job.single_flight_key = key
+                    self.in_flight[key] = job
+                self.start_job(job)
+                return job
+            elif msg["type"] == "abort" or (
+                msg["type"] == "close_connection"
+                and msg.get("data", {}).get("message_id") is not None
+            ):
+                # The plugin abandoned the request, free its slot for other work
+                target_id = msg.get("data", {}).get("message_id")
+                self.dn_tracer.log_event(
+                    self.connection_token,
+                    {
+                        DNTag.DNMsgStage.value: DNMsgStage.ABORT_MSG.value,
+                        DNTag.DNMsg.value: f"Abort requested for message: {target_id}",
+                    },
+                )
+                await self.cancel_job(target_id, reason="Aborted by the plugin")
+                await self.complete_message(message_id, token)
             elif msg["type"] == "close_connection":
+                await self.complete_message(message_id, token)
                 try:
                     await self.websocket.close()
                 except Exception as e:
                     print("Error closing connection: ", e)
 
                 print("Connection closed by server")
+            else:
+                await self.reject_unknown_message(message_id, token)
 
         else:
-            self.dn_tracer.log_error(
-                _client.connection_token,
-                {
-                    DNTag.DNMsgStage.value: DNMsgStage.CLIENT_CONNECTION.value,
-                    DNTag.DNMsg.value: "UNKNOWN MESSAGE TYPE",
-                },
+            await self.reject_unknown_message(message_id, token)
+
+    async def complete_message(self, message_id, token=None):
+        """Take a message that needs no job out of pending, so it is not fetched again."""
+        if message_id is not None:
+            await self.api_client.update_message_status(
+                token=token or self.connection_token,
+                message_id=message_id,
+                new_status="completed",
             )
 
-    async def poll_updates(self):
-        while True:
-            try:
-                pending_requests = await self.api_client.fetch_pending_requests(
-                    connection_token=str(self.connection_token)
-                )
+    async def reject_unknown_message(self, message_id, token=None):
+        self.dn_tracer.log_error(
+            self.connection_token,
+            {
+                DNTag.DNMsgStage.value: DNMsgStage.CLIENT_CONNECTION.value,
+                DNTag.DNMsg.value: "UNKNOWN MESSAGE TYPE",
+            },
+        )
+        if message_id is not None:
+            await self.api_client.update_message_status(
+                token=token or self.connection_token,
+                message_id=message_id,
+                new_status="error",
+            )
 
-                # Loop through the connections and send the message to each one
-                for record in pending_requests:
-                    print(f"PENDNG_TOKEN: {record['token']}")
-                    print(f"CONNECTION_TOKEN: {self.connection_token}")
-                    if self.connection_token != record["token"]:
-                        # Skip the request if its not for this client
-                        # TODO: fetch pending requests should only return requests for this client
-                        continue
+    @staticmethod
+    def is_well_formed(msg):
+        """Whether `msg` has the fields a Job reads, run_method messages need a method name."""
+        if not isinstance(msg, dict):
+            return False
+        if msg.get("type") != "run_method":
+            return True
+        data = msg.get("data")
+        return isinstance(data, dict) and isinstance(data.get("method_name"), str)
 
-                    print("ID: ", record["id"])
-                    print("TOKEN: ", record["token"])
-                    print("REQUEST: ", record["request"])
-                    try:
-                        await self.api_client.update_message_status(
-                            token=record["token"],
-                            message_id=record["id"],
-                            new_status="processing",
-                        )
+    def can_claim(self, msg, token=None):
+        """
+        Whether this replica has room for `msg` right now. Only run_method messages take
+        a job slot, and neither do requests that join a batch being collected or an
+        identical request that is already in flight.
+        """
+        if msg.get("type") != "run_method":
+            return True
+        if self.job_executor.claimable > 0:
+            return True
 
-                        await self.handle_pending_requests(
-                            message_id=record["id"], msg=record["request"]
-                        )
-                        # result = await connection_manager.send_message_to_token(
-                        #     token=record["token"],
-                        #     message_id=record["id"],
-                        #     message=record["request"],
-                        # )
-
-                        # print("RESULT: " + str(result))
-                        #
-                        # if result is True:
-                        #     await update_message_status(
-                        #         token=record["token"],
-                        #         message_id=record["id"],
-                        #         new_status="processing",
-                        #     )
-                        # else:
-                        #     await update_message_status(
-                        #         token=record["token"],
-                        #         message_id=record["id"],
-                        #         new_status="error",
-                        #     )
-                    except Exception as e:
+        job = Job(self, token or self.connection_token, None, msg)
+        batcher = self.batchers.get(job.method_name)
+        if batcher is not None:
+            return 0 < len(batcher.pending) < batcher.max_batch_size
+        key = self.single_flight_key(job)
+        return key is not None and key in self.in_flight
+
+    async def poll_once(self):
+        """
+        Fetch this client's pending messages and dispatch as many as there is room for.
+        The rest stay pending, for other replicas or the next poll. Returns True if any
+        message was dispatched.
+        """
+        found_work = False
+        if self.draining:
+            return found_work
+        try:
+            pending_requests = []
+            for token in self.connection_tokens:
+                records, cursor = await self.api_client.fetch_pending_requests_since(
+                    connection_token=str(token),
+                    cursor=self.message_cursors.get(token),
+                )
+                left_pending = False
+                for record in records:
+                    if record["id"] in self.jobs or record["id"] in self.batched_jobs:
+                        # Claimed by an earlier poll that could not advance the cursor
+                        continue
+                    if not self.is_well_formed(record["request"]):
+                        # Would fail on every poll, error it as dispatch_record does
                         await self.api_client.update_message_status(
                             token=record["token"],
                             message_id=record["id"],
                             new_status="error",
                         )
-                        print(
-                            f"Unexpected error during the forwarding of a pending request: {e}"
-                        )
-                print(f"PENDING REQUESTS: {pending_requests}")
-            except Exception as e:
-                print(f"An error occurred in check_status: {e}")
-            await asyncio.sleep(
-                self.POLL_UPDATES_INTERVAL
-            )  # Wait for 5 seconds before checking the status again
+                        continue
+                    if not self.can_claim(record["request"], record["token"]):
+                        left_pending = True
+                        metrics.increment("poll_messages_left_pending_total")
+                        continue
+                    if record["request"].get("type") == "run_method":
+                        claimed = await self.claim_record(record)
+                        if claimed is None:
+                            left_pending = True
+                            continue
+                        if not claimed:
+                            # Another replica sharing the token runs it
+                            continue
+                    pending_requests.append(record)
+                    found_work = True
+                    # Dispatched right away, so the next record sees the slot as taken
+                    await self.dispatch_record(record)
+
+                # Messages left pending must come back on the next poll
+                if not left_pending:
+                    self.message_cursors[token] = cursor
+            metrics.increment("poll_requests_total")
+            print(f"PENDING REQUESTS: {pending_requests}")
+        except Exception as e:
+            print(f"An error occurred in check_status: {e}")
+
+        return found_work
+
+    async def dispatch_record(self, record):
+        """Hand one message fetched from the hub to handle_pending_requests."""
+        print("ID: ", record["id"])
+        print("TOKEN: ", record["token"])
+        print("REQUEST: ", record["request"])
+        try:
+            # The message only moves to processing once a job slot is taken
+            await self.handle_pending_requests(
+                message_id=record["id"],
+                msg=record["request"],
+                on_start=functools.partial(
+                    self.api_client.update_message_status,
+                    token=record["token"],
+                    message_id=record["id"],
+                    new_status="processing",
+                ),
+                token=record["token"],
+            )
+            # result = await connection_manager.send_message_to_token(
+            #     token=record["token"],
+            #     message_id=record["id"],
+            #     message=record["request"],
+            # )
+
+            # print("RESULT: " + str(result))
+            #
+            # if result is True:
+            #     await update_message_status(
+            #         token=record["token"],
+            #         message_id=record["id"],
+            #         new_status="processing",
+            #     )
+            # else:
+            #     await update_message_status(
+            #         token=record["token"],
+            #         message_id=record["id"],
+            #         new_status="error",
+            #     )
+        except Exception as e:
+            await self.api_client.update_message_status(
+                token=record["token"],
+                message_id=record["id"],
+                new_status="error",
+            )
+            print(f"Unexpected error during the forwarding of a pending request: {e}")
 
 
 # Create a single WebSocketClient instance
 _client = WebSocketClient(SOCKET_IP, SOCKET_PORT)
 
+# The runtime hosting _client and any client added through add_client()
+_runtime = RunesRuntime()
+_runtime.add_client(_client)
+
 
 def output():
-    return _client.results
+    worker_job = current_worker_job()
+    if worker_job is not None:
+        # Inside a process worker, results are recorded and replayed by the parent
+        return worker_job.results
+
+    job = _current_job.get()
+    if job is None:
+        return _client.results
+
+    try:
+        on_job_loop = asyncio.get_running_loop() is job.loop
+    except RuntimeError:
+        on_job_loop = False
+
+    if not on_job_loop:
+        # Called from a plain (non async) method running on a worker thread
+        return ThreadSafeResults(job.results, job.loop)
+    return job.results
+
+
+def outputs():
+    """Results of every request in the running batch, in the order of the batch's input lists."""
+    jobs = _current_batch.get()
+    if jobs is None:
+        raise RuntimeError("outputs() can only be used inside a batch method.")
+
+    try:
+        on_job_loop = asyncio.get_running_loop() is jobs[0].loop
+    except RuntimeError:
+        on_job_loop = False
+
+    if not on_job_loop:
+        return [ThreadSafeResults(job.results, job.loop) for job in jobs]
+    return [job.results for job in jobs]
+
+
+def add_client(client):
+    """Serve another WebSocketClient (connection token) from this process when connect_to_server() runs."""
+    _runtime.add_client(client)
 
 
 # Define the functions that will interact with the WebSocketClient instance
@@ -817,13 +1555,9 @@ def set_token(token):
     _client.set_token(token)
 
 
-async def _register_method(method):
-    await _client.register_method(method)
-
-
 def register_method(method):
     try:
-        asyncio.run(_register_method(method))
+        _client.add_method(method)
     except Exception as e:
         dn_tracer = SentryEventLogger(service_name=DNSystemType.DN_CLIENT.value)
         dn_tracer.log_error(
@@ -835,9 +1569,47 @@ def register_method(method):
         )
 
 
+def register_batch_method(
+    method, max_batch_size: int = BATCH_MAX_SIZE, window: float = BATCH_WINDOW_SECONDS
+):
+    """
+    Register a method that processes several requests per call. Requests arriving within
+    `window` seconds of each other (at most `max_batch_size`) are passed as lists.
+    """
+    try:
+        _client.add_batch_method(method, max_batch_size, window)
+    except Exception as e:
+        dn_tracer = SentryEventLogger(service_name=DNSystemType.DN_CLIENT.value)
+        dn_tracer.log_error(
+            _client.connection_token,
+            {
+                DNTag.DNMsgStage.value: DNMsgStage.CLIENT_REG_METHOD.value,
+                DNTag.DNMsg.value: f"Error registering batch method: {e}",
+            },
+        )
+
+
 def register_imports(func):
-    global registered_imports_func
-    registered_imports_func = func
+    _client.register_imports(func)
+
+
+def set_process_workers(num_workers: int):
+    """
+    Run the registered methods in `num_workers` forked processes for CPU-bound work.
+    The processes are forked after the imports function has run so loaded models are
+    shared with them. 0 (the default) runs methods in this process.
+    """
+    _runtime.set_process_workers(num_workers)
+
+
+def set_delivery_mode(mode: str):
+    valid_modes = ["poll", "websocket"]
+    if mode in valid_modes:
+        _client.set_delivery_mode(mode)
+    else:
+        raise ValueError(
+            f"Invalid delivery mode: '{mode}'. Valid modes: {valid_modes}"
+        )
 
 
 def set_author(author: str):
@@ -964,12 +1736,153 @@ def set_output_target_format(format: str):
         )
 
 
+def set_http_pool_limits(limit: int = None, limit_per_host: int = None):
+    """Configure the size of the shared HTTP connection pool used for hub and storage calls."""
+    shared_session_manager.configure(limit=limit, limit_per_host=limit_per_host)
+
+
+def set_poll_interval_bounds(min_interval: float, max_interval: float):
+    """Bounds (in seconds) between which the poll loop adapts its interval."""
+    _client.poll_scheduler.set_bounds(min_interval, max_interval)
+
+
+def set_log_streaming(enabled: bool, interval: float = None):
+    """
+    Ship a job's logs to the hub every `interval` seconds while it runs instead of only
+    with the final reply, which then carries just the end of the logs.
+    """
+    if interval is not None and interval <= 0:
+        raise ValueError(f"Invalid log streaming interval: '{interval}'. Must be positive.")
+    _client.log_streaming = enabled
+    if interval is not None:
+        _client.log_stream_interval = interval
+
+
+def set_result_cache(
+    enabled: bool = True,
+    ttl: float = RESULT_CACHE_TTL,
+    max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+    disk_dir: str = RESULT_CACHE_DIR,
+    disk_max_bytes: int = RESULT_CACHE_DISK_MAX_BYTES,
+):
+    """
+    Reply to repeated requests (same method, params and input files) with the earlier
+    result instead of running the method again. Results are kept in memory and, when
+    `disk_dir` is given, on disk. Use @no_result_cache on non-deterministic methods.
+    """
+    _client.result_cache = (
+        ResultCache(
+            ttl=ttl,
+            max_entries=max_entries,
+            disk_dir=disk_dir,
+            disk_max_bytes=disk_max_bytes,
+        )
+        if enabled
+        else None
+    )
+
+
+def set_input_cache(
+    enabled: bool = True,
+    cache_dir: str = INPUT_CACHE_DIR,
+    max_bytes: int = INPUT_CACHE_MAX_BYTES,
+):
+    """
+    Keep downloaded input files in `cache_dir` and reuse them across jobs, and across the
+    processes of the host that use the same directory. Jobs get read-only hardlinks of
+    the cached files; the least recently used files are removed beyond `max_bytes`.
+    """
+    if max_bytes < 0:
+        raise ValueError(f"Invalid input cache size: '{max_bytes}'. Must be 0 or more.")
+    _client.input_cache = (
+        InputCache(cache_dir=cache_dir, max_bytes=max_bytes) if enabled else None
+    )
+
+
+def set_single_flight(enabled: bool):
+    """
+    Let identical requests (same method, params, DAW tempo and sample rate) that arrive while one of them is
+    queued or running share its result instead of running again. Off by default, only
+    for deterministic methods; @no_result_cache opts a method out.
+    """
+    _client.single_flight = enabled
+
+
+def set_job_deadline(seconds: float = None):
+    """
+    Default number of seconds a job may run before it is stopped with an error reply.
+    None disables the default; @deadline() on a method and the message's own deadline
+    still apply.
+    """
+    if seconds is not None and seconds <= 0:
+        raise ValueError(f"Invalid job deadline: '{seconds}'. Must be positive.")
+    _client.job_deadline_seconds = seconds
+
+
+def set_method_thread_pool_size(size: int):
+    """Number of threads that run plain (non async) registered methods."""
+    _runtime.set_method_thread_pool_size(size)
+
+
+def set_max_concurrent_jobs(max_concurrent_jobs: int):
+    """Number of jobs that may run at the same time. Further jobs wait for a free slot."""
+    _runtime.job_executor.set_max_concurrent_jobs(max_concurrent_jobs)
+
+
+def set_max_queued_jobs(max_queued_jobs: int):
+    """
+    Number of jobs claimed from the hub on top of the free slots, to wait locally for a
+    slot. Further messages stay pending for other replicas or a later poll.
+    """
+    _runtime.job_executor.set_max_queued_jobs(max_queued_jobs)
+
+
+def set_download_concurrency(per_message: int = None, total: int = None):
+    """
+    Input files downloaded at the same time for one message (`per_message`) and across
+    every job (`total`). The total applies to downloads started afterwards.
+    """
+    global _download_concurrency
+    for name, value in (("per message", per_message), ("total", total)):
+        if value is not None and value < 1:
+            raise ValueError(
+                f"Invalid {name} download concurrency: '{value}'. Must be at least 1."
+            )
+    if per_message is not None:
+        for client in _runtime.clients:
+            client.download_concurrency = per_message
+    if total is not None:
+        _download_concurrency = total
+        _download_slots.clear()
+
+
+def set_shutdown_grace_period(seconds: float):
+    """Seconds in-flight jobs get to finish on SIGTERM/SIGINT before they are failed."""
+    if seconds < 0:
+        raise ValueError(f"Invalid shutdown grace period: '{seconds}'. Must be 0 or more.")
+    _runtime.shutdown_grace_seconds = seconds
+
+
+def request_shutdown():
+    """Drain and stop connect_to_server() as on SIGTERM. Safe to call from any thread."""
+    _runtime.request_shutdown()
+
+
+def get_metrics():
+    """Snapshot of the client's runtime gauges and counters."""
+    snapshot = metrics.snapshot()
+    snapshot["retry_policy"] = shared_retry_policy.snapshot()
+    return snapshot
+
+
 def get_daw_bpm():
-    return _client.daw_bpm
+    job = current_worker_job() or _current_job.get()
+    return job.daw_bpm if job is not None else _client.daw_bpm
 
 
 def get_daw_sample_rate():
-    return _client.daw_sample_rate
+    job = current_worker_job() or _current_job.get()
+    return job.daw_sample_rate if job is not None else _client.daw_sample_rate
 
 
 def make_imports_global(modules):
@@ -993,34 +1906,46 @@ def make_imports_global(modules):
             logging.error(f"An error occurred while importing {module}: {str(e)}")
 
 
-def run_heartbeat():
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(_client.heartbeat())
-    finally:
-        loop.close()
+async def async_main(handle_signals=True):
+    await _runtime.run(handle_signals=handle_signals)
 
 
-async def async_main():
-    thread = threading.Thread(target=run_heartbeat)
-    thread.start()
+def use_uvloop(enabled: bool = True):
+    """Run connect_to_server() on uvloop. Needs `pip install runes-client[uvloop]`."""
+    _runtime.use_uvloop = enabled
 
-    task1 = asyncio.create_task(_client.send_registered_methods_to_server())
-    task2 = asyncio.create_task(_client.poll_updates())
 
-    await asyncio.gather(task1, task2)
+def attach_to_running_loop():
+    """
+    Serve from the event loop already running in this thread, e.g. a Jupyter kernel's,
+    without blocking it. Returns the task serving the runes; request_shutdown() drains
+    and stops it. Signals are left to the loop's owner.
+    """
+    loop = asyncio.get_running_loop()
+    return loop.create_task(async_main(handle_signals=False))
 
 
 def connect_to_server():
-    loop = asyncio.new_event_loop()
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError(
+            "An event loop is already running in this thread (e.g. in Jupyter). "
+            "Use runes.attach_to_running_loop() instead of connect_to_server()."
+        )
+
+    loop = new_event_loop(_runtime.use_uvloop)
     asyncio.set_event_loop(loop)
     try:
         # Run the async main function within the event loop
         loop.run_until_complete(async_main())
     finally:
-        # Close the loop when done
+        # Close the pooled HTTP session and then the loop when done
+        loop.run_until_complete(shared_session_manager.close())
         loop.close()
+        _runtime.process_farm.shutdown()
 
 
 # THIS IS A SPECIAL TYPE THAT WILL BE USED TO REPRESENT FILE UPLOADS
@@ -7,3 +7,22 @@ def ui_param(name, ui_component, **kwargs):
         return func
 
     return decorator
+
+
+def deadline(seconds):
+    """Stop the method with an error reply once it has run for `seconds`."""
+
+    def decorator(func):
+        func._deadline = seconds
+        return func
+
+    return decorator
+
+
+def no_result_cache(func):
+    """
+    Never reuse another request's result for this method, neither from the result cache
+    nor from an identical request in flight. For non-deterministic methods.
+    """
+    func._result_cache = False
+    return func
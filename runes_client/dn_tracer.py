@@ -88,20 +88,33 @@ class SentryEventLogger:
         logging.basicConfig(level=logging.INFO)
         self.service_name = service_name
         self.logger = logging.getLogger(service_name)
+        self.threads = set()
+
+    def _start(self, thread: Thread) -> None:
+        self.threads = {t for t in self.threads if t.is_alive()}
+        self.threads.add(thread)
+        thread.start()
 
     def log_event(self, dn_token: str, event_info: Dict[str, Any]) -> None:
         thread = Thread(
             target=self._handle_event,
             args=(dn_token, DNMsgType.DN_EVENT.value, event_info),
         )
-        thread.start()
+        self._start(thread)
 
     def log_error(self, dn_token: str, event_info: Dict[str, Any]) -> None:
         thread = Thread(
             target=self._handle_event,
             args=(dn_token, DNMsgType.DN_ERROR.value, event_info),
         )
-        thread.start()
+        self._start(thread)
+
+    def flush(self, timeout: float = 2.0) -> None:
+        """Wait for events still being handled and send whatever Sentry has queued."""
+        for thread in list(self.threads):
+            thread.join(timeout)
+        self.threads.clear()
+        sentry_sdk.flush(timeout=timeout)
 
     def _handle_event(
         self, dn_token: str, dn_msg_type: str, event_info: Dict[str, Any]
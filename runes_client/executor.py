@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS
+from .metrics import metrics
+
+
+class JobExecutor:
+    """
+    Runs jobs with at most `max_concurrent_jobs` in flight. Jobs submitted while every
+    slot is taken wait in FIFO order instead of being rejected. Pollers claim at most
+    `claimable` new jobs, so no more than `max_queued_jobs` wait for a slot.
+    """
+
+    def __init__(
+        self, max_concurrent_jobs=MAX_CONCURRENT_JOBS, max_queued_jobs=MAX_QUEUED_JOBS
+    ):
+        if max_concurrent_jobs < 1:
+            raise ValueError(
+                f"Invalid max concurrent jobs: '{max_concurrent_jobs}'. Must be at least 1."
+            )
+        if max_queued_jobs < 0:
+            raise ValueError(
+                f"Invalid max queued jobs: '{max_queued_jobs}'. Must be 0 or more."
+            )
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_queued_jobs = max_queued_jobs
+        self.running = 0
+        self.queued = 0
+        self.tasks = set()
+        self._condition = None
+        self.logger = logging.getLogger(__name__)
+        self._report()
+
+    @property
+    def free_slots(self) -> int:
+        return max(0, self.max_concurrent_jobs - self.running - self.queued)
+
+    @property
+    def claimable(self) -> int:
+        """How many more jobs may be claimed right now, counting jobs not yet started."""
+        in_flight = max(len(self.tasks), self.running + self.queued)
+        return max(0, self.max_concurrent_jobs + self.max_queued_jobs - in_flight)
+
+    def set_max_concurrent_jobs(self, max_concurrent_jobs):
+        if max_concurrent_jobs < 1:
+            raise ValueError(
+                f"Invalid max concurrent jobs: '{max_concurrent_jobs}'. Must be at least 1."
+            )
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self._report()
+
+    def set_max_queued_jobs(self, max_queued_jobs):
+        if max_queued_jobs < 0:
+            raise ValueError(
+                f"Invalid max queued jobs: '{max_queued_jobs}'. Must be 0 or more."
+            )
+        self.max_queued_jobs = max_queued_jobs
+        self._report()
+
+    def _get_condition(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def _acquire_slot(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.running < self.max_concurrent_jobs)
+            self.running += 1
+
+    async def _release_slot(self):
+        condition = self._get_condition()
+        async with condition:
+            self.running -= 1
+            condition.notify()
+
+    async def _run(self, job_func):
+        self.queued += 1
+        self._report()
+        try:
+            await self._acquire_slot()
+        finally:
+            self.queued -= 1
+        self._report()
+
+        try:
+            return await job_func()
+        finally:
+            await self._release_slot()
+            self._report()
+
+    def submit(self, job_func) -> asyncio.Task:
+        """Schedule `job_func` (a coroutine function) to run once a slot is free."""
+        task = asyncio.create_task(self._run(job_func))
+        self.tasks.add(task)
+        task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.info(f"Job failed: {task.exception()}")
+
+    async def join(self):
+        """Wait until every submitted job has finished."""
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+
+    def _report(self):
+        metrics.set_gauge("jobs_running", self.running)
+        metrics.set_gauge("jobs_queued", self.queued)
+        metrics.set_gauge("job_slots_free", self.free_slots)
+        metrics.set_gauge("jobs_claimable", self.claimable)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor that runs each call in a copy of the submitting context, so work a
+    job hands to a thread (e.g. via run_in_executor) keeps its output capture and output().
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
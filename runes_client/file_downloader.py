@@ -0,0 +1,227 @@
+import asyncio
+import base64
+import hashlib
+import os
+
+import aiohttp
+
+try:
+    import google_crc32c
+except ImportError:  # pragma: no cover - depends on the environment
+    google_crc32c = None
+
+from .config import DOWNLOAD_CHUNK_SIZE
+from .http_session import shared_session_manager
+from .metrics import metrics
+from .retry_policy import shared_retry_policy, RetryableStatusError, RETRYABLE_STATUSES
+
+
+class IntegrityError(Exception):
+    pass
+
+
+class DownloadResult:
+    def __init__(self, sha256=None, size=0, etag=None, generation=None, not_modified=False):
+        # sha256 hex digest of the content, None when not_modified
+        self.sha256 = sha256
+        self.size = size
+        self.etag = etag
+        self.generation = generation
+        # True when the server answered 304 to the `etag` passed to fetch()
+        self.not_modified = not_modified
+
+
+def parse_goog_hash(values):
+    """Checksums of an `x-goog-hash` header (e.g. `crc32c=n03x6A==,md5=Ojk9c...`), base64 by name."""
+    checksums = {}
+    for value in values:
+        for part in value.split(","):
+            name, _, digest = part.strip().partition("=")
+            if digest:
+                checksums[name.lower()] = digest
+    return checksums
+
+
+class _Download:
+    """State of one download, kept across the attempts of the retry policy."""
+
+    def __init__(self, local_path):
+        self.local_path = local_path
+        self.file = open(local_path, "wb")
+        self.total = None
+        self.expected = {}
+        self.verifiable = True
+        self.etag = None
+        self.generation = None
+        self.not_modified = False
+        self.reset()
+
+    def reset(self):
+        self.written = 0
+        self.sha256 = hashlib.sha256()
+        self.md5 = hashlib.md5()
+        self.crc32c = google_crc32c.Checksum() if google_crc32c is not None else None
+
+    def restart(self):
+        self.file.seek(0)
+        self.file.truncate()
+        self.reset()
+
+    def write(self, chunk):
+        # Runs on a worker thread: disk write and hashing in one pass over the chunk
+        self.file.write(chunk)
+        self.sha256.update(chunk)
+        self.md5.update(chunk)
+        if self.crc32c is not None:
+            self.crc32c.update(chunk)
+        self.written += len(chunk)
+
+    def close(self):
+        self.file.close()
+
+    def mismatches(self):
+        """Names of the server checksums the downloaded bytes do not match."""
+        if not self.verifiable:
+            return []
+        actual = {"md5": self.md5.digest()}
+        if self.crc32c is not None:
+            actual["crc32c"] = self.crc32c.digest()
+        else:
+            metrics.increment("download_crc32c_unchecked_total")
+        return [
+            name
+            for name, digest in actual.items()
+            if name in self.expected
+            and base64.b64encode(digest).decode("ascii") != self.expected[name]
+        ]
+
+
+class FileDownloader:
+    """
+    Streams a download to disk in chunks of `chunk_size` bytes. The chunks are written
+    and hashed on a worker thread so the event loop never blocks on disk or hashing, and
+    at most one chunk is held in memory.
+
+    GCS `x-goog-hash` checksums (CRC32C and MD5) are verified when present; CRC32C needs
+    the optional `google-crc32c` package. A connection dropped mid-download is retried
+    under the retry policy with a Range request for the missing bytes only.
+    """
+
+    def __init__(
+        self, session_manager=None, retry_policy=None, chunk_size=DOWNLOAD_CHUNK_SIZE
+    ):
+        self.session_manager = session_manager or shared_session_manager
+        self.retry_policy = retry_policy or shared_retry_policy
+        self.chunk_size = chunk_size
+
+    async def download(self, url, local_path, session=None) -> str:
+        """Download `url` to `local_path`. Returns the sha256 hex digest of the content."""
+        return (await self.fetch(url, local_path, session=session)).sha256
+
+    async def fetch(self, url, local_path, session=None, etag=None) -> DownloadResult:
+        """
+        Download `url` to `local_path`. With `etag` the download is conditional: when the
+        object did not change nothing is written and the result is `not_modified`.
+        """
+        loop = asyncio.get_running_loop()
+        download = await loop.run_in_executor(None, _Download, local_path)
+
+        async def attempt():
+            nonlocal session
+            if session is None:
+                session = await self.session_manager.get_session()
+            headers = {}
+            if download.written:
+                headers["Range"] = f"bytes={download.written}-"
+                metrics.increment("download_resumes_total")
+            elif etag is not None:
+                headers["If-None-Match"] = etag
+
+            async with session.get(url, headers=headers) as response:
+                if response.status in RETRYABLE_STATUSES:
+                    raise RetryableStatusError(response.status)
+                if response.status == 304 and etag is not None:
+                    download.not_modified = True
+                    return
+                if response.status == 416 and download.written == download.total:
+                    # Everything arrived before the connection dropped
+                    return
+                if response.status not in (200, 206):
+                    raise Exception(
+                        f"Failed to download file: {url} (HTTP {response.status})"
+                    )
+                await self._start_response(download, response, loop)
+
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    await loop.run_in_executor(None, download.write, chunk)
+
+            if download.total is not None and download.written < download.total:
+                raise aiohttp.ClientPayloadError(
+                    f"Connection closed after {download.written} of {download.total} bytes"
+                )
+
+        try:
+            await self.retry_policy.call("download_file", attempt, target="storage")
+        except BaseException:
+            await loop.run_in_executor(None, download.close)
+            await loop.run_in_executor(None, self._remove, local_path)
+            raise
+        await loop.run_in_executor(None, download.close)
+
+        if download.not_modified:
+            await loop.run_in_executor(None, self._remove, local_path)
+            return DownloadResult(etag=etag, not_modified=True)
+
+        mismatches = download.mismatches()
+        if mismatches:
+            await loop.run_in_executor(None, self._remove, local_path)
+            metrics.increment("download_integrity_failures_total")
+            raise IntegrityError(
+                f"Downloaded file {url} does not match its {', '.join(mismatches)} checksum"
+            )
+        metrics.increment("download_bytes_total", download.written)
+        return DownloadResult(
+            sha256=download.sha256.hexdigest(),
+            size=download.written,
+            etag=download.etag,
+            generation=download.generation,
+        )
+
+    async def _start_response(self, download, response, loop):
+        if response.status == 206:
+            start, total = self._parse_content_range(response.headers.get("Content-Range"))
+            if start != download.written:
+                raise Exception(
+                    f"Resumed download starts at byte {start} instead of {download.written}"
+                )
+            download.total = total
+        else:
+            if download.written:
+                # The server ignored the Range header and sent the whole file again
+                await loop.run_in_executor(None, download.restart)
+            download.total = response.content_length
+
+        if not download.expected:
+            download.expected = parse_goog_hash(response.headers.getall("x-goog-hash", []))
+        download.etag = response.headers.get("ETag", download.etag)
+        download.generation = response.headers.get("x-goog-generation", download.generation)
+        if response.headers.get("Content-Encoding"):
+            # Decompressed on the fly, the bytes on disk are not what the checksums cover
+            download.verifiable = False
+
+    @staticmethod
+    def _parse_content_range(value):
+        # "bytes 100-199/1000"
+        try:
+            byte_range, _, total = value.split(" ", 1)[1].partition("/")
+            start = int(byte_range.split("-")[0])
+            return start, None if total == "*" else int(total)
+        except (AttributeError, IndexError, ValueError):
+            raise Exception(f"Invalid Content-Range in resumed download: {value}")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
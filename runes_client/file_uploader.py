@@ -1,30 +1,65 @@
+import asyncio
 import os
 
-from aiohttp import ClientSession
+from . import codec
 from .config import API_BASE_URL, STORAGE_BUCKET_PATH
+from .http_session import shared_session_manager
+from .result_cache import hash_file
+from .retry_policy import shared_retry_policy, RetryableStatusError, RETRYABLE_STATUSES
+
+
+def object_name(file_path):
+    """
+    Bucket object name of an upload: the file name with a hash of its content, so a later
+    job writing a file of the same name never overwrites an object another reply (or a
+    cached result) points to.
+    """
+    stem, extension = os.path.splitext(os.path.basename(file_path))
+    return f"{stem}-{hash_file(file_path)[:16]}{extension}"
 
 
 class FileUploader:
+    def __init__(self, session_manager=None, retry_policy=None):
+        self.session_manager = session_manager or shared_session_manager
+        self.retry_policy = retry_policy or shared_retry_policy
+
     async def get_signed_url(self, filename, token) -> str:
         url = (
             f"{API_BASE_URL}/api/hub/get_signed_url/?token={token}&filename={filename}"
         )
-        async with ClientSession() as session:
+
+        async def attempt():
+            session = await self.session_manager.get_session()
             async with session.get(url) as response:
-                # TODO: Check if response is ok
-                data = await response.json()
-                return data["signed_url"]
+                body = await response.text()
+                if response.status in RETRYABLE_STATUSES:
+                    raise RetryableStatusError(response.status, body)
+                if response.status != 200:
+                    raise Exception(
+                        f"Failed to get signed url. Status code: {response.status}, Response: {body}"
+                    )
+                return codec.loads(body)["signed_url"]
+
+        return await self.retry_policy.call("get_signed_url", attempt)
 
     async def upload_file_to_gcp(self, file_path, signed_url, file_type) -> bool:
-        async with ClientSession() as session:
+        async def attempt():
+            session = await self.session_manager.get_session()
+            # Re-opened on every attempt so a retry uploads the whole file again
             with open(file_path, "rb") as file:
                 async with session.put(
                     signed_url, data=file, headers={"Content-Type": file_type}
                 ) as response:
+                    if response.status in RETRYABLE_STATUSES:
+                        raise RetryableStatusError(response.status)
                     return response.status == 200
 
+        return await self.retry_policy.call("upload_file", attempt, target="storage")
+
     async def upload(self, file_path, file_type) -> str:
-        file_name = os.path.basename(file_path)
+        file_name = await asyncio.get_running_loop().run_in_executor(
+            None, object_name, file_path
+        )
         storage_bucket_path = STORAGE_BUCKET_PATH.rstrip('/')
         file_url = f"{storage_bucket_path}/{file_name}"
         signed_url = await self.get_signed_url(file_name, "myToken")
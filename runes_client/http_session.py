@@ -0,0 +1,96 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from .config import (
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+)
+
+
+class HTTPSessionManager:
+    """
+    Owns the pooled aiohttp sessions shared by the API client, the file uploader and
+    the asset downloads, so that hub/storage calls reuse kept-alive connections instead
+    of paying a new TCP+TLS handshake per request.
+
+    aiohttp sessions are bound to the event loop that created them, so one session is
+    kept per running loop.
+    """
+
+    def __init__(
+        self,
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self._sessions = {}
+        self.logger = logging.getLogger(__name__)
+
+    def configure(
+        self,
+        limit=None,
+        limit_per_host=None,
+        ttl_dns_cache=None,
+        keepalive_timeout=None,
+        connect_timeout=None,
+    ):
+        """Update the connector settings. Only sessions created afterwards are affected."""
+        if limit is not None:
+            self.limit = limit
+        if limit_per_host is not None:
+            self.limit_per_host = limit_per_host
+        if ttl_dns_cache is not None:
+            self.ttl_dns_cache = ttl_dns_cache
+        if keepalive_timeout is not None:
+            self.keepalive_timeout = keepalive_timeout
+        if connect_timeout is not None:
+            self.connect_timeout = connect_timeout
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.ttl_dns_cache,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        # No total timeout: uploads and downloads of large stems can legitimately take minutes
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = self._create_session()
+            self._sessions[loop] = session
+            self.logger.debug(
+                f"Created pooled HTTP session (limit={self.limit}, limit_per_host={self.limit_per_host})"
+            )
+        return session
+
+    async def close(self):
+        """Close the session owned by the running loop and forget sessions of closed loops."""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+        for stale_loop in [l for l in self._sessions if l.is_closed()]:
+            del self._sessions[stale_loop]
+
+
+# Shared by every APIClient, FileUploader and WebSocketClient in the process
+shared_session_manager = HTTPSessionManager()
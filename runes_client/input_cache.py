@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from urllib.parse import urlsplit, parse_qsl, urlencode, urlunsplit
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from .config import INPUT_CACHE_DIR, INPUT_CACHE_MAX_BYTES
+from .metrics import metrics
+
+# Query parameters of signed URLs that change on every request for the same object
+SIGNATURE_PARAMS = ("x-goog-", "x-amz-", "signature", "expires", "googleaccessid")
+
+
+def url_key(url):
+    """Cache key of `url`, the same for every signed URL of one object (and generation)."""
+    parts = urlsplit(url)
+    query = [
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith(SIGNATURE_PARAMS)
+    ]
+    stable = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ""))
+    return hashlib.sha256(stable.encode("utf-8")).hexdigest()
+
+
+def is_immutable(url):
+    """GCS URLs pinned to a `generation` always return the same bytes."""
+    return any(name == "generation" for name, _ in parse_qsl(urlsplit(url).query))
+
+
+class _FileLock:
+    """Exclusive flock() on `path`, shared with the other processes of the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    # Seconds between attempts of acquire_async() while another process holds the lock
+    POLL_INTERVAL = 0.05
+
+    def acquire(self):
+        # Blocking, run it on a worker thread
+        self.file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def try_acquire(self) -> bool:
+        """Take the lock if it is free, without blocking."""
+        self.file = open(self.path, "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.file.close()
+                self.file = None
+                return False
+        return True
+
+    async def acquire_async(self):
+        # Polled on the loop: a cancelled job never leaves a thread behind to take the lock
+        while not self.try_acquire():
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+class InputCache:
+    """
+    On-disk cache of downloaded input files, shared by every job and every process on
+    the host that uses the same `cache_dir`.
+
+    Contents are stored once per sha256 under `blobs/`, read-only, and handed to jobs as
+    hardlinks into their scratch directory (a copy when the job directory is on another
+    filesystem). An index under `urls/` maps each URL to the ETag and hash it had when it
+    was downloaded: a known URL is revalidated with a conditional request and only
+    downloaded again when it changed, URLs pinned to a GCS `generation` are not
+    revalidated at all. Blobs beyond `max_bytes` are removed least recently used first.
+    """
+
+    def __init__(self, cache_dir=INPUT_CACHE_DIR, max_bytes=INPUT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        # One download per URL at a time in this process, the lock files cover other processes
+        self._url_locks = {}
+        for name in ("blobs", "urls", "locks", "tmp"):
+            os.makedirs(os.path.join(self.cache_dir, name), exist_ok=True)
+
+    def _blob_path(self, sha256):
+        return os.path.join(self.cache_dir, "blobs", sha256)
+
+    def _index_path(self, key):
+        return os.path.join(self.cache_dir, "urls", f"{key}.json")
+
+    async def fetch(self, url, local_path, downloader, session=None) -> str:
+        """
+        Place the content of `url` at `local_path`, downloading it with `downloader` (a
+        FileDownloader) only when the cache does not hold the current version. Returns
+        the sha256 hex digest of the content.
+        """
+        loop = asyncio.get_running_loop()
+        key = url_key(url)
+        lock = self._url_locks.setdefault(key, [asyncio.Lock(), 0])
+        lock[1] += 1
+        try:
+            async with lock[0]:
+                file_lock = _FileLock(os.path.join(self.cache_dir, "locks", f"{key}.lock"))
+                await file_lock.acquire_async()
+                try:
+                    for _ in range(3):
+                        sha256 = await self._fetch_locked(url, key, downloader, session, loop)
+                        if await loop.run_in_executor(None, self._link, sha256, local_path):
+                            break
+                        # Evicted by another process in the meantime
+                    else:
+                        raise Exception(f"Input cache evicted {url} before it could be used")
+                finally:
+                    file_lock.release()
+        finally:
+            lock[1] -= 1
+            if not lock[1]:
+                del self._url_locks[key]
+
+        await loop.run_in_executor(None, self.evict)
+        return sha256
+
+    async def _fetch_locked(self, url, key, downloader, session, loop):
+        entry = await loop.run_in_executor(None, self._read_entry, key)
+        if entry is not None and is_immutable(url):
+            metrics.increment("input_cache_hits_total")
+            return entry["sha256"]
+
+        tmp_path = os.path.join(self.cache_dir, "tmp", uuid.uuid4().hex)
+        etag = entry.get("etag") if entry is not None else None
+        try:
+            result = await downloader.fetch(url, tmp_path, session=session, etag=etag)
+            if result.not_modified:
+                metrics.increment("input_cache_hits_total")
+                metrics.increment("input_cache_revalidations_total")
+                return entry["sha256"]
+
+            metrics.increment("input_cache_misses_total")
+            await loop.run_in_executor(None, self._store, key, tmp_path, result)
+            return result.sha256
+        finally:
+            await loop.run_in_executor(None, self._remove, tmp_path)
+
+    def _read_entry(self, key):
+        path = self._index_path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"Dropping unreadable input cache entry {path}: {e}")
+            self._remove(path)
+            return None
+        if not os.path.exists(self._blob_path(entry["sha256"])):
+            # Evicted since, download again
+            return None
+        return entry
+
+    def _store(self, key, tmp_path, result):
+        blob_path = self._blob_path(result.sha256)
+        if os.path.exists(blob_path):
+            # Same content under another URL or generation
+            metrics.increment("input_cache_deduplicated_total")
+        else:
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, blob_path)
+
+        index_path = self._index_path(key)
+        index_tmp_path = f"{index_path}.{uuid.uuid4().hex}.tmp"
+        with open(index_tmp_path, "w") as f:
+            json.dump(
+                {"sha256": result.sha256, "etag": result.etag, "generation": result.generation},
+                f,
+            )
+        os.replace(index_tmp_path, index_path)
+
+    def _link(self, sha256, local_path):
+        blob_path = self._blob_path(sha256)
+        try:
+            # Mark as recently used for the LRU, the mtime is shared by every hardlink
+            os.utime(blob_path)
+            os.link(blob_path, local_path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            # Job directory on another filesystem (or no hardlinks), hand out a copy
+            try:
+                shutil.copyfile(blob_path, local_path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def evict(self):
+        """Remove the least recently used blobs until at most `max_bytes` are left."""
+        lock = _FileLock(os.path.join(self.cache_dir, "locks", "evict.lock"))
+        lock.acquire()
+        try:
+            blobs_dir = os.path.join(self.cache_dir, "blobs")
+            entries = []
+            total = 0
+            for name in os.listdir(blobs_dir):
+                path = os.path.join(blobs_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                # Jobs holding a hardlink keep their copy, only the cache forgets it
+                self._remove(path)
+                metrics.increment("input_cache_evictions_total")
+                total -= size
+        finally:
+            lock.release()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
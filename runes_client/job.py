@@ -0,0 +1,35 @@
+class Job:
+    """State of one run_method message while it is queued and running."""
+
+    def __init__(self, client, token, message_id, msg):
+        self.client = client
+        self.token = token
+        self.message_id = message_id
+        self.msg = msg
+        self.results = None
+        self.temp_dir = None
+        self.task = None
+        # Event loop the job's async work runs on, used by worker threads to reach it
+        self.loop = None
+        # Set when the job is aborted on request, used as the error of its reply
+        self.cancel_reason = None
+        # Claims the message once the job starts
+        self.on_start = None
+        # Single-flight: identical jobs waiting for this one's result, or the job this one waits for
+        self.single_flight_key = None
+        self.followers = []
+        self.leader = None
+        self.daw_bpm = msg.get("bpm", 0)
+        self.daw_sample_rate = msg.get("sample_rate", 0)
+
+    @property
+    def method_name(self):
+        return self.msg["data"]["method_name"]
+
+    @property
+    def params(self):
+        # Read on demand, downloads replace file URLs in the message with local paths
+        return {
+            param_name: param_details["value"]
+            for param_name, param_details in self.msg["data"]["params"].items()
+        }
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+
+from .config import (
+    LOG_STREAM_INTERVAL,
+    LOG_STREAM_MAX_CHUNK_CHARS,
+    LOG_STREAM_TAIL_CHARS,
+    OUTPUT_CAPTURE_MAX_CHARS,
+)
+from .metrics import metrics
+from .output_capture import OutputBuffer
+
+
+class LogStreamer:
+    """
+    Ships the output of a running job to the hub in chunks. Writes are coalesced for
+    `interval` seconds or until `max_chunk_chars` are pending, and sent from a background
+    task so the job never waits on the hub. When the hub falls behind by more than
+    `max_pending_chars` the oldest unsent text is dropped, and the next chunk starts
+    with a marker saying how much.
+    """
+
+    def __init__(
+        self,
+        api_client,
+        token,
+        message_id,
+        interval=LOG_STREAM_INTERVAL,
+        max_chunk_chars=LOG_STREAM_MAX_CHUNK_CHARS,
+        max_pending_chars=OUTPUT_CAPTURE_MAX_CHARS,
+    ):
+        self.api_client = api_client
+        self.token = token
+        self.message_id = message_id
+        self.interval = interval
+        self.max_chunk_chars = max_chunk_chars
+        self.pending = OutputBuffer(max_pending_chars)
+        self.sequence = 0
+        # Characters dropped from `pending` before they could be sent
+        self.dropped_chars = 0
+        # False once a chunk could not be delivered, the reply then carries the full logs
+        self.delivered = True
+        self.capture = None
+        self.loop = None
+        self.task = None
+        self._wake = None
+        self._closing = False
+        self.logger = logging.getLogger(__name__)
+
+    def _on_write(self, text):
+        # Called from whichever thread wrote the text
+        if not self.delivered:
+            return
+        self.pending.write(text)
+        if self.pending.size >= self.max_chunk_chars:
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self, capture):
+        """Start streaming everything written to the stdout and stderr of `capture`."""
+        self.loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.capture = capture
+        capture.stdout.add_listener(self._on_write)
+        capture.stderr.add_listener(self._on_write)
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+            if self._closing or not self.delivered:
+                return
+
+    async def flush(self):
+        logs = self.pending.drain()
+        dropped = self.pending.total_dropped_chars - self.dropped_chars
+        if dropped:
+            # drain() put the marker in front of what is left
+            self.dropped_chars += dropped
+            metrics.increment("log_stream_dropped_chars_total", dropped)
+            self.logger.warning(
+                f"Dropped {dropped} characters of the logs of {self.message_id}, "
+                "the hub is not keeping up"
+            )
+        for start in range(0, len(logs), self.max_chunk_chars):
+            if not self.delivered:
+                return
+            chunk = logs[start : start + self.max_chunk_chars]
+            try:
+                delivered = await self.api_client.append_message_logs(
+                    self.token, self.message_id, chunk, self.sequence
+                )
+            except Exception as e:
+                self.logger.warning(f"Could not stream logs of {self.message_id}: {e}")
+                delivered = False
+
+            if not delivered:
+                self.delivered = False
+                return
+            self.sequence += 1
+            metrics.increment("log_chunks_sent_total")
+
+    async def close(self):
+        """Stop streaming once whatever is still pending has been sent."""
+        self.capture.stdout.remove_listener(self._on_write)
+        self.capture.stderr.remove_listener(self._on_write)
+        self._closing = True
+        self._wake.set()
+        await self.task
+        # Writes that raced with the last flush of the task
+        if self.delivered:
+            await self.flush()
+
+    def reply_logs(self, logs):
+        """Logs for the final reply: only the tail once everything has been streamed."""
+        if not self.delivered or len(logs) <= LOG_STREAM_TAIL_CHARS:
+            return logs
+        return (
+            f"[... {len(logs) - LOG_STREAM_TAIL_CHARS} characters streamed earlier ...]\n"
+            + logs[-LOG_STREAM_TAIL_CHARS:]
+        )
@@ -0,0 +1,37 @@
+import threading
+
+
+class Metrics:
+    """Minimal in-process registry of gauges and counters, read back through snapshot()."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gauges = {}
+        self._counters = {}
+
+    def set_gauge(self, name: str, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def increment(self, name: str, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def get(self, name: str, default=None):
+        with self._lock:
+            if name in self._gauges:
+                return self._gauges[name]
+            return self._counters.get(name, default)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"gauges": dict(self._gauges), "counters": dict(self._counters)}
+
+    def reset(self):
+        with self._lock:
+            self._gauges = {}
+            self._counters = {}
+
+
+# Shared by every component of the client in the process
+metrics = Metrics()
@@ -1 +1,2 @@
-from .results_handler import ResultsHandler, handle_the_results
\ No newline at end of file
+from .results_handler import ResultsHandler, handle_the_results
+from .thread_safe_results import ThreadSafeResults
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import threading
+import time
+
+from ..config import PROGRESS_MAX_UPDATES_PER_SECOND
+from ..metrics import metrics
+
+
+class ProgressReporter:
+    """
+    Coalesces progress reports into at most `max_updates_per_second` sends.
+
+    `report()` only records the latest value and never waits, so it can be called from
+    tight loops on the event loop or on worker threads. A background task on `loop` sends
+    the most recent value whenever the rate allows, so the last reported value always
+    reaches the hub.
+    """
+
+    def __init__(
+        self, send_func, loop=None, max_updates_per_second=PROGRESS_MAX_UPDATES_PER_SECOND
+    ):
+        if max_updates_per_second <= 0:
+            raise ValueError(
+                f"Invalid max progress updates per second: '{max_updates_per_second}'. Must be positive."
+            )
+        # async send_func(fraction, note) -> False once the hub will not take progress updates
+        self.send_func = send_func
+        self.loop = loop
+        self.min_interval = 1.0 / max_updates_per_second
+        self.latest = None
+        self.version = 0
+        self.sent_version = 0
+        self.last_sent_at = None
+        self.enabled = True
+        self.task = None
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def report(self, fraction, note=None):
+        fraction = min(1.0, max(0.0, float(fraction)))
+        with self._lock:
+            self.latest = (fraction, note)
+            self.version += 1
+            if (
+                self._scheduled
+                or not self.enabled
+                or self.loop is None
+                or self.loop.is_closed()
+            ):
+                return
+            self._scheduled = True
+
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+
+        if on_loop:
+            self._start()
+        else:
+            self.loop.call_soon_threadsafe(self._start)
+
+    def _start(self):
+        self.task = self.loop.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while True:
+                if self.last_sent_at is not None:
+                    delay = self.last_sent_at + self.min_interval - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                with self._lock:
+                    latest, version = self.latest, self.version
+
+                self.last_sent_at = time.monotonic()
+                if await self.send_func(*latest) is False:
+                    self.enabled = False
+                metrics.increment("progress_updates_sent_total")
+
+                with self._lock:
+                    self.sent_version = version
+                    if self.version == version or not self.enabled:
+                        self._scheduled = False
+                        return
+        except Exception as e:
+            self.logger.warning(f"Could not send progress: {e}")
+            with self._lock:
+                self._scheduled = False
+
+    async def flush(self):
+        """Wait until the latest reported value has been sent."""
+        while self.task is not None and not self.task.done():
+            await self.task
+        if self.enabled and self.latest is not None and self.sent_version != self.version:
+            version = self.version
+            if await self.send_func(*self.latest) is False:
+                self.enabled = False
+            self.sent_version = version
@@ -1,17 +1,29 @@
 # Existing imports...
-import json
+import asyncio
+import functools
 import os
-import subprocess
+import shutil
 from urllib.parse import urlparse, urlsplit
 
+from .. import codec
 from ..api_client import APIClient
 from ..config import API_BASE_URL
 from ..dn_tracer import SentryEventLogger, DNSystemType, DNMsgStage, DNTag
 from ..file_uploader import FileUploader
+from .progress_reporter import ProgressReporter
 from ..utils.audio_utils import process_audio_file
 from ..utils.file_type_classifier import FileTypeClassifier
 
 
+@functools.lru_cache(maxsize=None)
+def ffmpeg_installed():
+    """Looked up once per process: a handler is created for every job, on the event loop."""
+    if shutil.which("ffmpeg") is None:
+        print("ffmpeg is not installed. Please install ffmpeg for audio processing.")
+        return False
+    return True
+
+
 # ResultsHandler class to handle the results
 class ResultsHandler:
     def __init__(
@@ -22,6 +34,7 @@ class ResultsHandler:
         target_bit_depth=16,
         target_channels=2,
         target_format="wav",
+        api_client=None,
     ):
         self.websocket = websocket
         self.token = token
@@ -30,8 +43,10 @@ class ResultsHandler:
         self.files = []
         self.logs = ""
         self.messages = []
+        self.api_client = api_client or APIClient(API_BASE_URL)
         self.file_uploader = FileUploader()
         self.dn_tracer = SentryEventLogger(DNSystemType.DN_CLIENT.value)
+        self.progress_reporter = self.create_progress_reporter()
 
         # Check if ffmpeg is installed
         self.ffmpeg_installed = self.check_ffmpeg()
@@ -43,18 +58,14 @@ class ResultsHandler:
         self.target_format = target_format
 
     def check_ffmpeg(self):
+        return ffmpeg_installed()
+
+    def create_progress_reporter(self):
         try:
-            subprocess.run(
-                ["ffmpeg", "-version"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.STDOUT,
-            )
-            return True
-        except FileNotFoundError:
-            print(
-                "ffmpeg is not installed. Please install ffmpeg for audio processing."
-            )
-            return False
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        return ProgressReporter(self.send_progress, loop)
 
     def update_token(self, token):
         self.token = token
@@ -129,13 +140,17 @@ class ResultsHandler:
 
             converted_file_path = None
             try:
-                # Check and convert audio file if necessary
-                converted_file_path = process_audio_file(
-                    file_path,
-                    target_format=self.target_format,
-                    target_sample_rate=self.target_sample_rate,
-                    target_bit_depth=self.target_bit_depth,
-                    target_channels=self.target_channels,
+                # Check and convert audio file if necessary (CPU bound, keep it off the event loop)
+                converted_file_path = await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    functools.partial(
+                        process_audio_file,
+                        file_path,
+                        target_format=self.target_format,
+                        target_sample_rate=self.target_sample_rate,
+                        target_bit_depth=self.target_bit_depth,
+                        target_channels=self.target_channels,
+                    ),
                 )
 
                 self.dn_tracer.log_event(
@@ -203,6 +218,28 @@ class ResultsHandler:
         self.logs += log
         return True
 
+    def progress(self, fraction: float, note: str = None):
+        """
+        Report how far the job is (0.0 - 1.0). Safe to call at any frequency, also from
+        threads: the calls are coalesced and never wait for the hub.
+        """
+        self.progress_reporter.report(fraction, note)
+
+    async def send_progress(self, fraction, note=None):
+        if self.websocket is not None and self.websocket.connected:
+            progress_msg = {
+                "token": self.token,
+                "type": "progress",
+                "data": {"id": self.message_id, "progress": fraction, "note": note},
+            }
+            if await self.websocket.send(progress_msg):
+                return True
+
+        await self.api_client.update_message_progress(
+            self.token, self.message_id, fraction, note
+        )
+        return self.api_client.supports_progress_updates is not False
+
     def clear_outputs(self):
         """Clears the output attributes of the ResultsHandler instance."""
         self.message_id = None
@@ -210,8 +247,12 @@ class ResultsHandler:
         self.files = []
         self.logs = ""
         self.messages = []
+        self.progress_reporter = self.create_progress_reporter()
 
     async def send(self):
+        # The last reported progress goes out before the results
+        await self.progress_reporter.flush()
+
         status = "completed" if not self.errors else "error"
 
         print("STATUS: " + status)
@@ -231,20 +272,23 @@ class ResultsHandler:
 
         send_msg = {"token": self.token, "type": "results", "data": data}
 
-        print("API_CLIENT- start")
-        api_client = APIClient(API_BASE_URL)
-        await api_client.send_message_response(
-            self.token, self.message_id, data["response"]
-        )
-        print("API_CLIENT- end")
+        # Reply on the push socket when it is up, otherwise through the HTTP API
+        sent_on_websocket = False
+        if self.websocket is not None and self.websocket.connected:
+            sent_on_websocket = await self.websocket.send(send_msg)
 
-        # await self.websocket.send(json.dumps(send_msg))
+        if not sent_on_websocket:
+            print("API_CLIENT- start")
+            await self.api_client.send_message_response(
+                self.token, self.message_id, data["response"]
+            )
+            print("API_CLIENT- end")
 
         self.dn_tracer.log_event(
             self.token,
             {
                 DNTag.DNMsgStage.value: DNMsgStage.CLIENT_SEND_RESULTS_MSG.value,
-                DNTag.DNMsg.value: json.dumps(send_msg),
+                DNTag.DNMsg.value: codec.dumps(send_msg),
             },
         )
 
@@ -0,0 +1,43 @@
+import asyncio
+
+
+class ThreadSafeResults:
+    """
+    Synchronous view of a job's ResultsHandler for plain (non async) methods that run on
+    a worker thread. Every call is executed on the job's event loop and blocks the
+    calling thread until it has completed, e.g. `rune.output().add_file(path)`.
+    """
+
+    def __init__(self, results, loop):
+        self.results = results
+        self.loop = loop
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def add_file(self, file_path):
+        return self._call(self.results.add_file(file_path))
+
+    def add_file_url(self, file_url: str, file_type: str):
+        return self._call(self.results.add_file_url(file_url, file_type))
+
+    def add_message(self, message):
+        return self._call(self.results.add_message(message))
+
+    def add_error(self, error):
+        return self._call(self.results.add_error(error))
+
+    def add_log(self, log):
+        return self._call(self.results.add_log(log))
+
+    def progress(self, fraction: float, note: str = None):
+        # Already thread-safe and never blocks
+        self.results.progress(fraction, note)
+
+    @property
+    def errors(self):
+        return self.results.errors
+
+    @property
+    def message_id(self):
+        return self.results.message_id
@@ -0,0 +1,149 @@
+import contextlib
+import contextvars
+import sys
+import threading
+
+from .config import OUTPUT_CAPTURE_MAX_CHARS
+
+# The capture of the job running in the current task/context, None outside of jobs
+_current_capture = contextvars.ContextVar("current_capture", default=None)
+
+_install_lock = threading.Lock()
+
+
+class OutputBuffer:
+    """
+    Thread-safe text buffer that keeps at most `max_chars` characters. When full the
+    oldest text is dropped, and listeners are told about every write as it happens.
+    """
+
+    def __init__(self, max_chars=OUTPUT_CAPTURE_MAX_CHARS):
+        self.max_chars = max_chars
+        self.chunks = []
+        self.size = 0
+        self.dropped_chars = 0
+        # Not reset by drain(), for readers that need to know how much never reached them
+        self.total_dropped_chars = 0
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """`listener(text)` is called from the writing thread for every write."""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def write(self, text):
+        if not text:
+            return 0
+        with self._lock:
+            self.chunks.append(text)
+            self.size += len(text)
+            while self.size > self.max_chars:
+                overflow = self.size - self.max_chars
+                oldest = self.chunks[0]
+                if len(oldest) <= overflow:
+                    self.chunks.pop(0)
+                    self.size -= len(oldest)
+                    self.dropped_chars += len(oldest)
+                    self.total_dropped_chars += len(oldest)
+                else:
+                    self.chunks[0] = oldest[overflow:]
+                    self.size -= overflow
+                    self.dropped_chars += overflow
+                    self.total_dropped_chars += overflow
+        for listener in list(self.listeners):
+            listener(text)
+        return len(text)
+
+    def _value(self):
+        value = "".join(self.chunks)
+        if self.dropped_chars:
+            value = f"[... {self.dropped_chars} characters dropped ...]\n" + value
+        return value
+
+    def drain(self):
+        """Return the buffered text and empty the buffer."""
+        with self._lock:
+            value = self._value()
+            self.chunks = []
+            self.size = 0
+            self.dropped_chars = 0
+        return value
+
+    def getvalue(self):
+        with self._lock:
+            return self._value()
+
+
+class OutputCapture:
+    def __init__(self, max_chars=OUTPUT_CAPTURE_MAX_CHARS):
+        self.stdout = OutputBuffer(max_chars)
+        self.stderr = OutputBuffer(max_chars)
+
+
+class ContextLocalStream:
+    """
+    Installed in place of sys.stdout/sys.stderr. Writes go to the buffer of the job
+    running in the current context, or to the original stream when there is none.
+    """
+
+    def __init__(self, original, stream_name):
+        self.original = original
+        self.stream_name = stream_name
+
+    def _target(self):
+        capture = _current_capture.get()
+        if capture is None:
+            return self.original
+        return getattr(capture, self.stream_name)
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if _current_capture.get() is None:
+            self.original.flush()
+
+    def isatty(self):
+        return False if _current_capture.get() is not None else self.original.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+def install():
+    """
+    Route sys.stdout/sys.stderr through context-local streams. Safe to call repeatedly,
+    streams swapped in by someone else since the last call get wrapped as well.
+    """
+    with _install_lock:
+        if not isinstance(sys.stdout, ContextLocalStream):
+            sys.stdout = ContextLocalStream(sys.stdout, "stdout")
+        if not isinstance(sys.stderr, ContextLocalStream):
+            sys.stderr = ContextLocalStream(sys.stderr, "stderr")
+
+
+def current_capture():
+    return _current_capture.get()
+
+
+@contextlib.contextmanager
+def capture_output(capture=None):
+    """
+    Capture everything the current context (and the threads and tasks it starts with a
+    copy of it) writes to stdout/stderr. Other jobs and background tasks are unaffected.
+    """
+    install()
+    capture = capture or OutputCapture()
+    token = _current_capture.set(capture)
+    try:
+        yield capture
+    finally:
+        _current_capture.reset(token)
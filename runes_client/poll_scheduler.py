@@ -0,0 +1,91 @@
+import asyncio
+import random
+
+from .config import POLL_MIN_INTERVAL, POLL_MAX_INTERVAL
+from .metrics import metrics
+
+
+class AdaptivePollScheduler:
+    """
+    Decides how long the poll loop sleeps between fetches.
+
+    Right after work arrives or finishes the loop polls at `min_interval` for
+    `burst_polls` ticks (burst mode). After that every empty poll grows the interval by
+    `backoff_factor` up to `max_interval`. Each sleep is jittered so that a fleet of
+    idle runes does not poll the hub in lockstep.
+    """
+
+    def __init__(
+        self,
+        min_interval=POLL_MIN_INTERVAL,
+        max_interval=POLL_MAX_INTERVAL,
+        backoff_factor=1.5,
+        jitter=0.2,
+        burst_polls=5,
+        metric_name="poll_interval_seconds",
+    ):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError(
+                f"Invalid poll interval bounds: min={min_interval}, max={max_interval}"
+            )
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.burst_polls = burst_polls
+        self.metric_name = metric_name
+        self.current_interval = min_interval
+        self._burst_remaining = burst_polls
+        self._wake_event = None
+        self._report()
+
+    def set_bounds(self, min_interval, max_interval):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError(
+                f"Invalid poll interval bounds: min={min_interval}, max={max_interval}"
+            )
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.current_interval = min(max(self.current_interval, min_interval), max_interval)
+        self._report()
+
+    def record_activity(self):
+        """Work arrived or finished: poll quickly for the next few ticks."""
+        self.current_interval = self.min_interval
+        self._burst_remaining = self.burst_polls
+        self._report()
+
+    def record_idle(self):
+        """A poll came back empty: back off once the burst window is used up."""
+        if self._burst_remaining > 0:
+            self._burst_remaining -= 1
+        else:
+            self.current_interval = min(
+                self.max_interval, self.current_interval * self.backoff_factor
+            )
+        self._report()
+
+    def next_delay(self) -> float:
+        spread = self.current_interval * self.jitter
+        delay = self.current_interval + random.uniform(-spread, spread)
+        return min(self.max_interval, max(self.min_interval, delay))
+
+    def wake(self):
+        """Cut the current sleep short, e.g. when a job just finished."""
+        self.record_activity()
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    async def wait(self):
+        if self._wake_event is None:
+            self._wake_event = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._wake_event.wait(), timeout=self.next_delay())
+        except asyncio.TimeoutError:
+            pass
+        # Cleared after waking so that a wake() issued mid-poll is not lost
+        self._wake_event.clear()
+
+    def _report(self):
+        metrics.set_gauge(self.metric_name, self.current_interval)
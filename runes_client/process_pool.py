@@ -0,0 +1,232 @@
+import asyncio
+import contextlib
+import contextvars
+import io
+import logging
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .config import PROCESS_WORKERS
+from .metrics import metrics
+
+# Registered methods by key, captured in the parent right before forking so every
+# worker inherits them (and whatever the imports function loaded) copy-on-write
+_farm_methods = {}
+
+# Set while a job runs inside a worker process, see output() and get_daw_bpm()
+_worker_job = contextvars.ContextVar("worker_job", default=None)
+
+
+class _Recorded:
+    """Returned by WorkerResults calls so that `await rune.output().add_file(...)` keeps working."""
+
+    def __await__(self):
+        return iter(())
+
+
+class WorkerResults:
+    """
+    Stand-in for the ResultsHandler inside a worker process. Calls are recorded as result
+    descriptors and replayed by the parent, which does the conversion, upload and reply.
+    """
+
+    def __init__(self):
+        self.ops = []
+
+    def _record(self, op, *args):
+        self.ops.append((op, args))
+        return _Recorded()
+
+    def add_file(self, file_path):
+        return self._record("add_file", file_path)
+
+    def add_file_url(self, file_url: str, file_type: str):
+        return self._record("add_file_url", file_url, file_type)
+
+    def add_message(self, message):
+        return self._record("add_message", message)
+
+    def add_error(self, error):
+        return self._record("add_error", error)
+
+    def add_log(self, log):
+        return self._record("add_log", log)
+
+    def progress(self, fraction: float, note: str = None):
+        # Only the latest value matters, replayed by the parent with the other results
+        self.ops = [op for op in self.ops if op[0] != "progress"]
+        self.ops.append(("progress", (fraction, note)))
+
+
+class WorkerJob:
+    def __init__(self, daw_bpm, daw_sample_rate):
+        self.results = WorkerResults()
+        self.daw_bpm = daw_bpm
+        self.daw_sample_rate = daw_sample_rate
+
+
+def current_worker_job():
+    return _worker_job.get()
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def run_in_worker(method_key, kwargs, daw_bpm, daw_sample_rate):
+    """Entry point executed in a worker process. Returns a picklable result descriptor."""
+    job = WorkerJob(daw_bpm, daw_sample_rate)
+    _worker_job.set(job)
+    stdout_buffer = io.StringIO()
+    stderr_buffer = io.StringIO()
+    error = None
+    try:
+        method = _farm_methods[method_key]
+        with contextlib.redirect_stdout(stdout_buffer), contextlib.redirect_stderr(
+            stderr_buffer
+        ):
+            if asyncio.iscoroutinefunction(method):
+                asyncio.run(method(**kwargs))
+            else:
+                method(**kwargs)
+    except Exception as e:
+        error = str(e)
+    finally:
+        _worker_job.set(None)
+
+    return {
+        "ops": job.results.ops,
+        "stdout": stdout_buffer.getvalue(),
+        "stderr": stderr_buffer.getvalue(),
+        "error": error,
+    }
+
+
+class _Worker:
+    """One forked worker process, behind a single-process executor of its own."""
+
+    def __init__(self, pool, pid):
+        self.pool = pool
+        self.pid = pid
+
+
+class ProcessWorkerFarm:
+    """
+    Pool of forked worker processes for CPU-bound methods.
+
+    The workers are forked only once the imports functions have run, so models and other
+    state loaded there are shared with every worker instead of being loaded again per process.
+    Each worker runs one job at a time, so a cancelled job kills and replaces its own worker
+    only, leaving the jobs of the other workers running.
+    """
+
+    def __init__(self, num_workers=PROCESS_WORKERS):
+        self.num_workers = 0
+        self.workers = None
+        # Workers not running a job right now
+        self.idle = None
+        self.mp_context = multiprocessing.get_context("fork")
+        self.logger = logging.getLogger(__name__)
+        self.set_num_workers(num_workers)
+
+    @property
+    def enabled(self) -> bool:
+        return self.num_workers > 0
+
+    @property
+    def started(self) -> bool:
+        return self.workers is not None
+
+    def set_num_workers(self, num_workers):
+        if num_workers < 0:
+            raise ValueError(
+                f"Invalid number of process workers: '{num_workers}'. Must be 0 or more."
+            )
+        if self.started:
+            raise RuntimeError(
+                "The process workers are already running. Set the number of workers before connect_to_server()."
+            )
+        self.num_workers = num_workers
+
+    @staticmethod
+    def method_key(client, method_name):
+        return f"{client.connection_token}:{method_name}"
+
+    async def start(self, clients):
+        """Fork the workers. Call after every client's imports function has completed."""
+        if not self.enabled or self.started:
+            return
+
+        _farm_methods.clear()
+        for client in clients:
+            for method_name, method in client.method_registry.items():
+                _farm_methods[self.method_key(client, method_name)] = method
+
+        # Forking waits for each worker to come up, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        self.workers = []
+        self.idle = asyncio.Queue()
+        for _ in range(self.num_workers):
+            worker = await loop.run_in_executor(None, self._fork_worker)
+            self.workers.append(worker)
+            self.idle.put_nowait(worker)
+        metrics.set_gauge("process_workers", self.num_workers)
+        print(f"STARTED {self.num_workers} PROCESS WORKERS")
+
+    def _fork_worker(self):
+        # Fork (not spawn) so the worker shares the parent's warmed up memory
+        pool = ProcessPoolExecutor(max_workers=1, mp_context=self.mp_context)
+        # Fork the worker now, before any job needs it
+        pid = pool.submit(_warm_up).result()
+        return _Worker(pool, pid)
+
+    async def _replace(self, worker):
+        """Kill `worker` and fork a fresh one in its place."""
+        try:
+            os.kill(worker.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        worker.pool.shutdown(wait=False, cancel_futures=True)
+        metrics.increment("process_workers_killed_total")
+
+        replacement = await asyncio.get_running_loop().run_in_executor(
+            None, self._fork_worker
+        )
+        if self.workers is None:
+            # Shut down in the meantime
+            replacement.pool.shutdown(wait=False)
+            return
+        self.workers[self.workers.index(worker)] = replacement
+        self.idle.put_nowait(replacement)
+
+    async def run(self, client, method_name, kwargs, daw_bpm=0, daw_sample_rate=0):
+        worker = await self.idle.get()
+        replace = False
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                worker.pool,
+                run_in_worker,
+                self.method_key(client, method_name),
+                kwargs,
+                daw_bpm,
+                daw_sample_rate,
+            )
+        except (asyncio.CancelledError, BrokenProcessPool):
+            # The worker would keep running the method (or died), replace just this one
+            replace = True
+            raise
+        finally:
+            if replace:
+                await asyncio.shield(self._replace(worker))
+            elif self.idle is not None:
+                self.idle.put_nowait(worker)
+
+    def shutdown(self):
+        if self.workers is not None:
+            workers, self.workers, self.idle = self.workers, None, None
+            for worker in workers:
+                worker.pool.shutdown(wait=True)
+            metrics.set_gauge("process_workers", 0)
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import codec
+from .config import (
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_DISK_MAX_BYTES,
+)
+from .metrics import metrics
+
+
+def make_key(key_data):
+    """Stable cache key for JSON serializable `key_data`."""
+    return hashlib.sha256(codec.canonical_dumps(key_data).encode("utf-8")).hexdigest()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two tier cache of job results (uploaded file URLs and messages). The memory tier is
+    an LRU of at most `max_entries`, the optional disk tier in `disk_dir` keeps at most
+    `disk_max_bytes`, dropping the least recently used entries first. Entries of both
+    tiers expire after `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        ttl=RESULT_CACHE_TTL,
+        max_entries=RESULT_CACHE_MAX_ENTRIES,
+        disk_dir=RESULT_CACHE_DIR,
+        disk_max_bytes=RESULT_CACHE_DISK_MAX_BYTES,
+        clock=time.time,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.clock = clock
+        self.memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and self.clock() - stored_at > self.ttl
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def get(self, key):
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._expired(stored_at):
+                    self.memory.move_to_end(key)
+                    metrics.increment("result_cache_hits_total")
+                    return value
+                del self.memory[key]
+
+        value = self._get_from_disk(key)
+        if value is not None:
+            metrics.increment("result_cache_hits_total")
+            return value
+
+        metrics.increment("result_cache_misses_total")
+        return None
+
+    def _get_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = codec.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.warning(f"Dropping unreadable result cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+        if self._expired(entry["stored_at"]):
+            self._remove(path)
+            return None
+
+        # Mark as recently used for the disk LRU and promote to memory
+        os.utime(path)
+        self._put_in_memory(key, entry["stored_at"], entry["value"])
+        return entry["value"]
+
+    def put(self, key, value):
+        stored_at = self.clock()
+        self._put_in_memory(key, stored_at, value)
+        if self.disk_dir:
+            self._put_on_disk(key, stored_at, value)
+
+    def _put_in_memory(self, key, stored_at, value):
+        with self._lock:
+            self.memory[key] = (stored_at, value)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+
+    def _put_on_disk(self, key, stored_at, value):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(codec.dumps_bytes({"stored_at": stored_at, "value": value}))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.logger.warning(f"Could not write result cache entry {path}: {e}")
+            self._remove(tmp_path)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self.memory.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".json"):
+                    self._remove(os.path.join(self.disk_dir, name))
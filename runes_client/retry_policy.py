@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+
+import aiohttp
+
+from .config import (
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_MIN_PER_SECOND,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    HTTP_DEFAULT_TIMEOUT,
+    ENDPOINT_TIMEOUTS,
+)
+from .metrics import metrics
+
+# Responses that mean "the server is struggling, try again later"
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# Of those, the ones a server sends without having acted on the request
+UNPROCESSED_STATUSES = (429, 503)
+
+
+class RetryableStatusError(Exception):
+    def __init__(self, status, body=None):
+        super().__init__(f"HTTP {status}: {body}")
+        self.status = status
+        self.body = body
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def never_processed(error) -> bool:
+    """Whether a failed attempt certainly did not reach the server's handler."""
+    if isinstance(error, aiohttp.ClientConnectorError):
+        return True
+    return isinstance(error, RetryableStatusError) and error.status in UNPROCESSED_STATUSES
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a target after `failure_threshold` consecutive failures. After
+    `reset_timeout` seconds a single trial call is let through (half open); its outcome
+    closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._report()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+            self._report()
+        return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+            if self._state != self.CLOSED:
+                self._state = self.CLOSED
+                self._report()
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if (
+                self._state == self.HALF_OPEN
+                or self.consecutive_failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self.opened_at = self.clock()
+                self._report()
+
+    def release_trial(self):
+        """End a half-open trial call that neither succeeded nor failed against the target."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _report(self):
+        metrics.set_gauge(f"circuit_breaker_state.{self.name}", self._state)
+
+
+class RetryBudget:
+    """
+    Token bucket that limits retries to a fraction of the calls being made, with a small
+    floor per second, so that a degraded hub sees at most `ratio` extra load from retries.
+    """
+
+    def __init__(
+        self,
+        ratio=RETRY_BUDGET_RATIO,
+        min_per_second=RETRY_BUDGET_MIN_PER_SECOND,
+        max_tokens=10.0,
+        clock=time.monotonic,
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.clock = clock
+        self.tokens = max_tokens
+        self._last_refill = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(
+            self.max_tokens, self.tokens + (now - self._last_refill) * self.min_per_second
+        )
+        self._last_refill = now
+
+    def record_call(self):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class RetryPolicy:
+    """
+    Single policy for every outbound hub/storage call: per-endpoint timeouts, jittered
+    exponential backoff, a shared retry budget and one circuit breaker per target.
+    """
+
+    def __init__(
+        self,
+        max_attempts=RETRY_MAX_ATTEMPTS,
+        base_delay=RETRY_BASE_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        default_timeout=HTTP_DEFAULT_TIMEOUT,
+        endpoint_timeouts=None,
+        budget=None,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_timeout = default_timeout
+        self.endpoint_timeouts = dict(
+            ENDPOINT_TIMEOUTS if endpoint_timeouts is None else endpoint_timeouts
+        )
+        self.budget = budget or RetryBudget()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.logger = logging.getLogger(__name__)
+
+    def breaker(self, target) -> CircuitBreaker:
+        if target not in self.breakers:
+            self.breakers[target] = CircuitBreaker(
+                target,
+                failure_threshold=self.failure_threshold,
+                reset_timeout=self.reset_timeout,
+            )
+        return self.breakers[target]
+
+    def set_timeout(self, endpoint, seconds):
+        self.endpoint_timeouts[endpoint] = seconds
+
+    def timeout_for(self, endpoint):
+        return self.endpoint_timeouts.get(endpoint, self.default_timeout)
+
+    def backoff(self, attempt) -> float:
+        # Full jitter keeps replicas from retrying against the hub in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def call(self, endpoint, request_func, target="hub", idempotent=True):
+        """
+        Run `request_func` (a coroutine function performing one attempt) under the policy.
+        Network errors, timeouts and RetryableStatusError are retried; any other exception
+        is passed straight through. A call that is not `idempotent` is only retried when
+        the failed attempt never reached the server (see never_processed).
+        """
+        breaker = self.breaker(target)
+        self.budget.record_call()
+        timeout = self.timeout_for(endpoint)
+
+        for attempt in range(self.max_attempts):
+            if not breaker.allow_request():
+                metrics.increment("circuit_breaker_rejections_total")
+                raise CircuitOpenError(
+                    f"Circuit for '{target}' is open, not calling {endpoint}"
+                )
+
+            try:
+                if timeout is None:
+                    result = await request_func()
+                else:
+                    result = await asyncio.wait_for(request_func(), timeout=timeout)
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                RetryableStatusError,
+            ) as e:
+                breaker.record_failure()
+                self.logger.warning(f"{endpoint} attempt {attempt + 1} failed: {e}")
+
+                if attempt == self.max_attempts - 1:
+                    raise
+                if not idempotent and not never_processed(e):
+                    raise
+                if not self.budget.try_spend():
+                    metrics.increment("retry_budget_exhausted_total")
+                    raise
+                metrics.increment("retry_attempts_total")
+                await asyncio.sleep(self.backoff(attempt))
+            except BaseException:
+                # Not a verdict on the target (a 404, a bug, a cancelled job), but the
+                # half-open trial must not stay in flight forever
+                breaker.release_trial()
+                raise
+            else:
+                breaker.record_success()
+                return result
+
+    def snapshot(self) -> dict:
+        return {
+            "breakers": {name: breaker.state for name, breaker in self.breakers.items()},
+            "retry_budget_tokens": self.budget.tokens,
+        }
+
+
+# Shared by every APIClient and FileUploader in the process
+shared_retry_policy = RetryPolicy()
@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import signal
+import threading
+
+from .config import (
+    WORKER_POOL_SIZE,
+    METHOD_THREAD_POOL_SIZE,
+    SHUTDOWN_GRACE_SECONDS,
+    UVLOOP,
+)
+from .executor import JobExecutor, ContextThreadPoolExecutor
+from .http_session import shared_session_manager
+from .poll_scheduler import AdaptivePollScheduler
+from .process_pool import ProcessWorkerFarm
+
+
+def new_event_loop(use_uvloop=UVLOOP):
+    """The loop connect_to_server() runs on: uvloop's when asked for and installed."""
+    if use_uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            print(
+                "uvloop is not installed (pip install runes-client[uvloop]). Using the default event loop."
+            )
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+class RunesRuntime:
+    """
+    Hosts many WebSocketClient instances (one per connection token) in a single process.
+
+    All clients share one event loop running polling, dispatch and uploads (heartbeats
+    have a thread of their own), one poll scheduler, one job executor, the pooled HTTP session and one worker pool for
+    blocking work, while each client keeps its own registered methods, imports, audio
+    settings and results.
+    """
+
+    HEARTBEAT_INTERVAL = 2
+    # Reply given to jobs still running when the shutdown grace period runs out
+    SHUTDOWN_REASON = "The rune is shutting down"
+    # Longest wait for tracing events to be sent on shutdown
+    TRACER_FLUSH_TIMEOUT = 2
+
+    def __init__(
+        self,
+        poll_scheduler=None,
+        job_executor=None,
+        process_farm=None,
+        worker_pool_size=WORKER_POOL_SIZE,
+        method_thread_pool_size=METHOD_THREAD_POOL_SIZE,
+        shutdown_grace_seconds=SHUTDOWN_GRACE_SECONDS,
+    ):
+        self.clients = []
+        self.poll_scheduler = poll_scheduler or AdaptivePollScheduler()
+        self.job_executor = job_executor or JobExecutor()
+        self.process_farm = process_farm or ProcessWorkerFarm()
+        self.worker_pool_size = worker_pool_size
+        self.worker_pool = None
+        self.method_thread_pool_size = method_thread_pool_size
+        self.method_thread_pool = self._create_method_thread_pool(
+            method_thread_pool_size
+        )
+        self.shutdown_grace_seconds = shutdown_grace_seconds
+        self.use_uvloop = UVLOOP
+        self.heartbeat_thread = None
+        self.heartbeat_loop = None
+        self.heartbeat_task = None
+        self._heartbeat_stopping = threading.Event()
+        self.loop = None
+        self._drain_requested = None
+        self._force_stop = None
+        self._signals = []
+        self.logger = logging.getLogger(__name__)
+
+    def add_client(self, client):
+        if client in self.clients:
+            return
+        # Work arriving or finishing on any token speeds up the shared poll loop, and
+        # jobs of every token compete for the same slots
+        client.poll_scheduler = self.poll_scheduler
+        client.job_executor = self.job_executor
+        client.method_thread_pool = self.method_thread_pool
+        client.process_farm = self.process_farm
+        self.clients.append(client)
+
+    def remove_client(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+
+    def _create_method_thread_pool(self, size):
+        if size < 1:
+            raise ValueError(f"Invalid method thread pool size: '{size}'. Must be at least 1.")
+        return ContextThreadPoolExecutor(max_workers=size, thread_name_prefix="runes-method")
+
+    def set_method_thread_pool_size(self, size):
+        """Resize the pool running plain (non async) methods. Running methods finish on the old pool."""
+        old_pool = self.method_thread_pool
+        self.method_thread_pool = self._create_method_thread_pool(size)
+        self.method_thread_pool_size = size
+        for client in self.clients:
+            client.method_thread_pool = self.method_thread_pool
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+
+    def set_process_workers(self, num_workers):
+        self.process_farm.set_num_workers(num_workers)
+        # Each worker process needs a job slot to be of any use
+        if num_workers > self.job_executor.max_concurrent_jobs:
+            self.job_executor.set_max_concurrent_jobs(num_workers)
+
+    def get_worker_pool(self):
+        if self.worker_pool is None:
+            self.worker_pool = ContextThreadPoolExecutor(
+                max_workers=self.worker_pool_size, thread_name_prefix="runes-worker"
+            )
+        return self.worker_pool
+
+    async def register_clients(self):
+        """
+        Publish the methods of every client. A client that fails to register is logged
+        and dropped so the others are still served.
+        """
+        clients = list(self.clients)
+        results = await asyncio.gather(
+            *(client.send_registered_methods_to_server() for client in clients),
+            return_exceptions=True,
+        )
+        for client, result in zip(clients, results):
+            if isinstance(result, Exception):
+                self.logger.error(
+                    f"Could not register token {client.connection_token}, not serving it: {result}"
+                )
+                self.remove_client(client)
+        if not self.clients:
+            raise RuntimeError("No client could be registered, nothing to serve")
+
+    async def heartbeat(self):
+        while not self._heartbeat_stopping.is_set():
+            await asyncio.gather(
+                *(client.send_heartbeat() for client in list(self.clients)),
+                return_exceptions=True,
+            )
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+
+    def run_heartbeat(self):
+        """
+        Heartbeats run on their own thread and loop, so they keep flowing while an async
+        method blocks the main loop with CPU-bound work.
+        """
+        loop = asyncio.new_event_loop()
+        self.heartbeat_loop = loop
+        self.heartbeat_task = loop.create_task(self.heartbeat())
+        try:
+            loop.run_until_complete(self.heartbeat_task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.run_until_complete(shared_session_manager.close())
+            loop.close()
+
+    def start_heartbeat(self):
+        self._heartbeat_stopping.clear()
+        self.heartbeat_thread = threading.Thread(
+            target=self.run_heartbeat, name="runes-heartbeat", daemon=True
+        )
+        self.heartbeat_thread.start()
+
+    async def stop_heartbeat(self, timeout=5):
+        if self.heartbeat_thread is None:
+            return
+        self._heartbeat_stopping.set()
+        if self.heartbeat_task is not None and not self.heartbeat_loop.is_closed():
+            self.heartbeat_loop.call_soon_threadsafe(self.heartbeat_task.cancel)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.heartbeat_thread.join, timeout
+        )
+        self.heartbeat_thread = None
+        self.heartbeat_loop = None
+        self.heartbeat_task = None
+
+    async def poll_updates(self):
+        while True:
+            polling_clients = [
+                client
+                for client in list(self.clients)
+                if not (client.websocket is not None and client.websocket.connected)
+            ]
+
+            results = await asyncio.gather(
+                *(client.poll_once() for client in polling_clients),
+                return_exceptions=True,
+            )
+
+            found_work = False
+            for client, result in zip(polling_clients, results):
+                if isinstance(result, Exception):
+                    print(
+                        f"An error occurred polling token {client.connection_token}: {result}"
+                    )
+                elif result:
+                    found_work = True
+
+            if found_work:
+                self.poll_scheduler.record_activity()
+            else:
+                self.poll_scheduler.record_idle()
+            await self.poll_scheduler.wait()
+
+    def request_drain(self):
+        """
+        Start a graceful shutdown of run(). Signal handlers call this; a second request
+        fails the jobs still running right away instead of waiting out the grace period.
+        """
+        if self._drain_requested is None:
+            return
+        if self._drain_requested.is_set():
+            self._force_stop.set()
+        self._drain_requested.set()
+
+    def request_shutdown(self):
+        """Thread-safe request_drain(), for stopping run() from outside its loop."""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.request_drain)
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request_drain)
+                self._signals.append(sig)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Not on the main thread, or not supported (e.g. Windows)
+                pass
+
+    def remove_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in self._signals:
+            loop.remove_signal_handler(sig)
+        self._signals = []
+
+    async def run(self, handle_signals=True):
+        """
+        Serve every client until a drain is requested. `handle_signals` drains on
+        SIGTERM/SIGINT; leave it off when the loop belongs to someone else (e.g. Jupyter).
+        """
+        # Blocking work (e.g. audio conversion) of every client lands on the shared pool
+        asyncio.get_running_loop().set_default_executor(self.get_worker_pool())
+        self.loop = asyncio.get_running_loop()
+        self._drain_requested = asyncio.Event()
+        self._force_stop = asyncio.Event()
+        # A previous run() may have drained: claim messages again on a fresh method pool
+        if self.method_thread_pool is None:
+            self.method_thread_pool = self._create_method_thread_pool(
+                self.method_thread_pool_size
+            )
+        for client in self.clients:
+            client.draining = False
+            client.method_thread_pool = self.method_thread_pool
+        if handle_signals:
+            self.install_signal_handlers()
+
+        for client in list(self.clients):
+            if not client.method_registry:
+                # e.g. the default client when every method is served through add_client()
+                self.remove_client(client)
+
+        # Async methods run on this loop and may block it, heartbeats must not wait for them
+        self.start_heartbeat()
+
+        await self.register_clients()
+        # Only fork once every imports function has loaded its models
+        await self.process_farm.start(self.clients)
+
+        tasks = [asyncio.create_task(self.poll_updates())]
+        tasks.extend(
+            asyncio.create_task(client.listen())
+            for client in self.clients
+            if client.delivery_mode == "websocket"
+        )
+        serving = asyncio.gather(*tasks)
+        drain_requested = asyncio.create_task(self._drain_requested.wait())
+
+        await asyncio.wait([serving, drain_requested], return_when=asyncio.FIRST_COMPLETED)
+        if not drain_requested.done():
+            drain_requested.cancel()
+            self.remove_signal_handlers()
+            await self.stop_heartbeat()
+            serving.result()
+            return
+        await self.drain(serving)
+
+    async def drain(self, serving=None):
+        """
+        Stop claiming messages, let in-flight jobs finish within the grace period and
+        fail the rest with an error reply, then release every shared resource.
+        """
+        print("DRAINING: no new messages are claimed")
+        for client in self.clients:
+            client.draining = True
+        if serving is not None:
+            serving.cancel()
+            try:
+                await serving
+            except asyncio.CancelledError:
+                pass
+        await asyncio.gather(*(client.start_draining() for client in self.clients))
+
+        jobs_done = asyncio.create_task(self.job_executor.join())
+        force_stop = asyncio.create_task(self._force_stop.wait())
+        await asyncio.wait(
+            [jobs_done, force_stop],
+            timeout=self.shutdown_grace_seconds,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        force_stop.cancel()
+        if not jobs_done.done():
+            print("DRAINING: grace period over, failing the remaining jobs")
+            for client in self.clients:
+                await client.fail_jobs(self.SHUTDOWN_REASON)
+        await jobs_done
+
+        for client in self.clients:
+            client.finish_draining()
+        await self.stop_heartbeat()
+        loop = asyncio.get_running_loop()
+        for client in self.clients:
+            await loop.run_in_executor(
+                None, client.dn_tracer.flush, self.TRACER_FLUSH_TIMEOUT
+            )
+        self.remove_signal_handlers()
+        await shared_session_manager.close()
+        self.process_farm.shutdown()
+        self.method_thread_pool.shutdown(wait=False)
+        self.method_thread_pool = None
+        print("DRAINED")
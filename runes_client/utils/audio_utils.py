@@ -12,10 +12,9 @@ def process_audio_file(
     target_bit_depth: int = 16,
     target_channels: int = 2,
 ):
-    # Create 'resampled' directory if it doesn't exist
+    # Create 'resampled' directory if it doesn't exist (inputs are converted concurrently)
     resampled_dir = os.path.join(os.path.dirname(file_path), "resampled")
-    if not os.path.exists(resampled_dir):
-        os.makedirs(resampled_dir)
+    os.makedirs(resampled_dir, exist_ok=True)
 
     # Set the output file extension and format
     base_name = os.path.splitext(os.path.basename(file_path))[0]
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import random
+
+import websockets
+
+from . import codec
+
+
+class WebSocketTransport:
+    """
+    Persistent, bidirectional connection to the hub. Jobs are pushed to `on_message` as
+    soon as the hub has them and replies can be sent back on the same socket.
+
+    The connection is re-established with jittered exponential backoff when it drops.
+    While it is down `connected` is False, which callers use to fall back to HTTP polling.
+    """
+
+    def __init__(
+        self,
+        uri,
+        on_message,
+        on_connect=None,
+        min_backoff=1.0,
+        max_backoff=30.0,
+    ):
+        self.uri = uri
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.websocket = None
+        self.consecutive_failures = 0
+        self._closing = False
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def connected(self) -> bool:
+        return self.websocket is not None
+
+    def next_backoff(self) -> float:
+        # Full jitter so that many replicas do not reconnect in lockstep
+        ceiling = min(self.max_backoff, self.min_backoff * 2**self.consecutive_failures)
+        return random.uniform(self.min_backoff, max(self.min_backoff, ceiling))
+
+    async def run(self):
+        """Keep the socket connected and dispatch incoming messages until close() is called."""
+        self._closing = False
+        while not self._closing:
+            try:
+                async with websockets.connect(self.uri) as websocket:
+                    self.websocket = websocket
+                    self.consecutive_failures = 0
+                    self.logger.info(f"WebSocket connected to {self.uri}")
+
+                    if self.on_connect is not None:
+                        await self.on_connect()
+
+                    async for raw_msg in websocket:
+                        try:
+                            msg = codec.loads(raw_msg)
+                        except ValueError:
+                            self.logger.error(f"Ignoring non-JSON message: {raw_msg}")
+                            continue
+
+                        await self.on_message(msg)
+
+                        if self._closing:
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.consecutive_failures += 1
+                self.logger.info(
+                    f"WebSocket connection to {self.uri} failed ({self.consecutive_failures} in a row): {e}"
+                )
+            finally:
+                self.websocket = None
+
+            if not self._closing:
+                await asyncio.sleep(self.next_backoff())
+
+    async def send(self, msg) -> bool:
+        """Send a JSON message on the socket. Returns False if it is not currently connected."""
+        websocket = self.websocket
+        if websocket is None:
+            return False
+        try:
+            await websocket.send(codec.dumps(msg))
+            return True
+        except Exception as e:
+            self.logger.info(f"WebSocket send failed: {e}")
+            return False
+
+    async def close(self):
+        self._closing = True
+        websocket = self.websocket
+        if websocket is not None:
+            await websocket.close()
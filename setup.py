@@ -35,13 +35,20 @@ setup(
     install_requires=[
         "aiohttp",
         "websockets",
-        "nest-asyncio",
         "sentry-sdk",
         "pydub",
         "librosa",
         "pytest-asyncio",
     ],
-    python_requires=">=3.6",
+    extras_require={
+        # Faster JSON encoding/decoding of hub payloads
+        "fast-json": ["orjson"],
+        # Faster event loop, see runes.use_uvloop()
+        "uvloop": ["uvloop"],
+        # CRC32C verification of downloads from Google Cloud Storage
+        "gcs-checksums": ["google-crc32c"],
+    },
+    python_requires=">=3.9",
     entry_points={
         "console_scripts": [
             "runes-client=runes_client.core:main",
@@ -0,0 +1,233 @@
+import time
+import uuid
+
+from aiohttp import web
+from runes_client import RunesRuntime, WebSocketClient
+from runes_client.api_client import APIClient
+from runes_client.poll_scheduler import AdaptivePollScheduler
+
+
+class HubStandIn:
+    """Local stand-in for the hub's HTTP API, used to drive clients end to end in tests."""
+
+    def __init__(self):
+        # Messages by token, each stays pending until its status is updated or replied to
+        self.pending = {}
+        self.statuses = {}
+        self.sequence = 0
+        # Message leases as (replica_id, expires_at) by message id
+        self.leases = {}
+        # Every successful claim as (message_id, replica_id)
+        self.claims = []
+        self.status_updates = []
+        self.replies = []
+        # Streamed log chunks by message id, in arrival order
+        self.log_chunks = {}
+        # Published compute contracts by connection token
+        self.contracts = {}
+        # Latest loaded status reported for each connection token
+        self.loaded = {}
+        # Progress updates by message id, as (progress, note) in arrival order
+        self.progress_updates = {}
+        # Ordered log of ("status", message_id, status) and ("reply", message_id) entries
+        self.events = []
+        self.runner = None
+        self.base_url = None
+
+    def add_pending_message(self, token, message_id, request):
+        self.sequence += 1
+        self.pending.setdefault(token, []).append(
+            (self.sequence, {"id": message_id, "token": token, "request": request})
+        )
+        self.statuses[message_id] = "pending"
+
+    def expire_leases(self):
+        """Messages whose lease ran out become pending again, after every cursor."""
+        now = time.monotonic()
+        for message_id, (_, expires_at) in list(self.leases.items()):
+            if expires_at > now:
+                continue
+            del self.leases[message_id]
+            if self.statuses[message_id] in ("leased", "processing"):
+                self.statuses[message_id] = "pending"
+                for records in self.pending.values():
+                    for i, (_, record) in enumerate(records):
+                        if record["id"] == message_id:
+                            self.sequence += 1
+                            records[i] = (self.sequence, record)
+
+    async def get_pending_messages(self, request):
+        self.expire_leases()
+        token = request.match_info["token"]
+        since = int(request.query.get("since", 0))
+        limit = int(request.query.get("limit", 100))
+        page = [
+            (sequence, record)
+            for sequence, record in self.pending.get(token, [])
+            if sequence > since and self.statuses[record["id"]] == "pending"
+        ][:limit]
+        cursor = page[-1][0] if page else request.query.get("since")
+        return web.json_response(
+            {"results": [record for _, record in page], "next": None, "cursor": cursor}
+        )
+
+    async def update_message_status(self, request):
+        payload = await request.json()
+        message_id = request.match_info["message_id"]
+        self.status_updates.append(
+            (request.match_info["token"], message_id, payload["status"])
+        )
+        self.statuses[message_id] = payload["status"]
+        self.events.append(("status", message_id, payload["status"]))
+        return web.json_response({})
+
+    async def claim_message(self, request):
+        self.expire_leases()
+        payload = await request.json()
+        message_id = request.match_info["message_id"]
+        lease = self.leases.get(message_id)
+        if lease is not None and lease[0] == payload["replica_id"]:
+            # Claiming again is idempotent for the replica holding the lease
+            pass
+        elif lease is not None or self.statuses.get(message_id) != "pending":
+            return web.json_response({}, status=409)
+        else:
+            self.statuses[message_id] = "leased"
+            self.claims.append((message_id, payload["replica_id"]))
+
+        self.leases[message_id] = (
+            payload["replica_id"],
+            time.monotonic() + payload["lease_seconds"],
+        )
+        return web.json_response({"expires_in": payload["lease_seconds"]})
+
+    async def renew_message_lease(self, request):
+        self.expire_leases()
+        payload = await request.json()
+        message_id = request.match_info["message_id"]
+        lease = self.leases.get(message_id)
+        if lease is None or lease[0] != payload["replica_id"]:
+            return web.json_response({}, status=409)
+        self.leases[message_id] = (
+            payload["replica_id"],
+            time.monotonic() + payload["lease_seconds"],
+        )
+        return web.json_response({"expires_in": payload["lease_seconds"]})
+
+    async def reply_to_message(self, request):
+        payload = await request.json()
+        self.replies.append(payload)
+        self.statuses[payload["id"]] = "replied"
+        self.leases.pop(payload["id"], None)
+        self.events.append(("reply", payload["id"]))
+        return web.json_response({})
+
+    async def append_message_logs(self, request):
+        payload = await request.json()
+        message_id = request.match_info["message_id"]
+        self.log_chunks.setdefault(message_id, []).append(
+            (payload["sequence"], payload["logs"])
+        )
+        self.events.append(("logs", message_id))
+        return web.json_response({}, status=201)
+
+    async def update_message_progress(self, request):
+        payload = await request.json()
+        message_id = request.match_info["message_id"]
+        self.progress_updates.setdefault(message_id, []).append(
+            (payload["progress"], payload["note"])
+        )
+        self.events.append(("progress", message_id))
+        return web.json_response({})
+
+    async def create_compute_contract(self, request):
+        payload = await request.json()
+        self.contracts[payload["id"]] = payload["data"]
+        return web.json_response({}, status=201)
+
+    async def update_loaded_status(self, request):
+        payload = await request.json()
+        self.loaded[request.match_info["token"]] = payload["loaded"]
+        return web.json_response({})
+
+    async def created(self, request):
+        return web.json_response({}, status=201)
+
+    async def ok(self, request):
+        return web.json_response({})
+
+    async def start(self):
+        app = web.Application()
+        app.add_routes(
+            [
+                web.get("/api/hub/pending_messages/{token}/", self.get_pending_messages),
+                web.patch(
+                    "/api/hub/update_message_status/{token}/{message_id}/",
+                    self.update_message_status,
+                ),
+                web.post("/api/hub/reply_to_message/", self.reply_to_message),
+                web.post(
+                    "/api/hub/message_lease/{token}/{message_id}/", self.claim_message
+                ),
+                web.put(
+                    "/api/hub/message_lease/{token}/{message_id}/",
+                    self.renew_message_lease,
+                ),
+                web.post(
+                    "/api/hub/message_progress/{token}/{message_id}/",
+                    self.update_message_progress,
+                ),
+                web.post(
+                    "/api/hub/message_logs/{token}/{message_id}/",
+                    self.append_message_logs,
+                ),
+                web.put("/api/hub/connection/compute/{token}/{status}/", self.ok),
+                web.put(
+                    "/api/hub/connections/{token}/loaded/", self.update_loaded_status
+                ),
+                web.post("/api/hub/compute/contract/", self.create_compute_contract),
+                web.post("/api/hub/connection_mappings/", self.created),
+            ]
+        )
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.base_url = f"http://127.0.0.1:{self.runner.addresses[0][1]}/"
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def run_method_request(method_name, bpm=120, sample_rate=44100, **params):
+    """A run_method message of the DAW, calling `method_name` with `params`."""
+    return {
+        "type": "run_method",
+        "bpm": bpm,
+        "sample_rate": sample_rate,
+        "data": {
+            "method_name": method_name,
+            "params": {name: {"value": value} for name, value in params.items()},
+        },
+    }
+
+
+async def make_client(hub, *methods, token=None):
+    """A client of `hub` serving `methods`, under a new token unless one is given."""
+    client = WebSocketClient("127.0.0.1", "1234")
+    client.set_token(token or str(uuid.uuid4()))
+    client.api_client = APIClient(hub.base_url)
+    for method in methods:
+        await client.register_method(method)
+    return client
+
+
+def make_runtime(**kwargs):
+    """A RunesRuntime that polls every few milliseconds and stops without flushing traces."""
+    runtime = RunesRuntime(
+        poll_scheduler=AdaptivePollScheduler(min_interval=0.01, max_interval=0.05),
+        **kwargs,
+    )
+    runtime.TRACER_FLUSH_TIMEOUT = 0
+    return runtime
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from runes_client.api_client import APIClient
+from runes_client.http_session import HTTPSessionManager
+from runes_client.retry_policy import RetryPolicy
+
+
+async def start_hub(routes):
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/"
+
+
+@pytest.mark.asyncio
+async def test_fetch_pending_requests_since_follows_pages():
+    # SETUP
+    seen_queries = []
+    pages = {
+        None: {"results": [{"id": 1}, {"id": 2}], "next": "p2", "cursor": "c2"},
+        "p2": {"results": [{"id": 3}], "next": None, "cursor": "c3"},
+    }
+
+    async def pending(request):
+        seen_queries.append(dict(request.query))
+        return web.json_response(pages[request.query.get("page")])
+
+    runner, base_url = await start_hub(
+        [web.get("/api/hub/pending_messages/{token}/", pending)]
+    )
+    session_manager = HTTPSessionManager()
+    api_client = APIClient(base_url, session_manager=session_manager)
+
+    # EXECUTE
+    records, cursor = await api_client.fetch_pending_requests_since(
+        "token-a", cursor="c1", page_size=2
+    )
+
+    # ASSERTS
+    assert records == [{"id": 1}, {"id": 2}, {"id": 3}]
+    assert cursor == "c3"
+    assert api_client.supports_cursor_fetch is True
+    assert seen_queries[0] == {"limit": "2", "since": "c1"}
+    assert seen_queries[1] == {"limit": "2", "since": "c1", "page": "p2"}
+
+    await session_manager.close()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_fetch_pending_requests_since_falls_back_to_legacy_endpoint():
+    # SETUP
+    legacy_calls = []
+
+    async def legacy(request):
+        legacy_calls.append(request.match_info["token"])
+        return web.json_response(
+            [
+                {"id": 1, "token": "token-a", "request": {}},
+                {"id": 2, "token": "token-b", "request": {}},
+            ]
+        )
+
+    runner, base_url = await start_hub(
+        [web.get("/api/hub/get_latest_pending_messages/{token}/", legacy)]
+    )
+    session_manager = HTTPSessionManager()
+    api_client = APIClient(base_url, session_manager=session_manager)
+
+    # EXECUTE
+    first, first_cursor = await api_client.fetch_pending_requests_since("token-a")
+    second, _ = await api_client.fetch_pending_requests_since("token-a")
+
+    # ASSERTS
+    assert api_client.supports_cursor_fetch is False
+    assert [record["id"] for record in first] == [1]
+    assert [record["id"] for record in second] == [1]
+    assert first_cursor is None
+    assert legacy_calls == ["token-a", "token-a"]
+
+    await session_manager.close()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_timed_out_reply_is_not_sent_twice():
+    # SETUP
+    replies = []
+
+    async def reply(request):
+        replies.append(await request.json())
+        # Recorded, but answered after the client gave up
+        await asyncio.sleep(0.2)
+        return web.json_response({})
+
+    runner, base_url = await start_hub(
+        [web.post("/api/hub/reply_to_message/", reply)]
+    )
+    session_manager = HTTPSessionManager()
+    api_client = APIClient(
+        base_url,
+        session_manager=session_manager,
+        retry_policy=RetryPolicy(
+            base_delay=0, max_delay=0, endpoint_timeouts={"send_message_response": 0.05}
+        ),
+    )
+
+    # EXECUTE
+    with pytest.raises(asyncio.TimeoutError):
+        await api_client.send_message_response("token-a", "m1", "{}")
+
+    # ASSERTS
+    assert [payload["id"] for payload in replies] == ["m1"]
+
+    await session_manager.close()
+    await runner.cleanup()
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+import runes_client as rune
+from runes_client.batcher import MicroBatcher
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+calls = []
+
+
+async def batch_generate(prompt: str, seed: int):
+    calls.append(list(prompt))
+    for results, p, s in zip(rune.outputs(), prompt, seed):
+        await results.add_message(f"{p}-{s}")
+
+
+@pytest.mark.asyncio
+async def test_batcher_flushes_on_size_and_on_window():
+    batches = []
+    batcher = MicroBatcher(batches.append, max_batch_size=3, window=0.05)
+
+    for i in range(4):
+        batcher.add(i)
+    assert batches == [[0, 1, 2]]
+
+    started = time.monotonic()
+    while len(batches) < 2:
+        await asyncio.sleep(0.005)
+
+    assert batches == [[0, 1, 2], [3]]
+    assert time.monotonic() - started < 0.2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_batched_and_fanned_out():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub)
+    await client.register_batch_method(batch_generate, max_batch_size=4, window=0.05)
+    # Room for the second batch to be claimed while the first one runs
+    client.job_executor.set_max_queued_jobs(1)
+    calls.clear()
+
+    token = client.connection_token
+    for i in range(5):
+        hub.add_pending_message(
+            token, f"m{i}", run_method_request("batch_generate", prompt=f"p{i}", seed=i)
+        )
+
+    # EXECUTE
+    await client.poll_once()
+    await asyncio.sleep(0.1)
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert calls == [["p0", "p1", "p2", "p3"], ["p4"]]
+    messages = {reply["id"]: reply["response"]["message"] for reply in hub.replies}
+    assert messages == {f"m{i}": f"p{i}-{i}" for i in range(5)}
+    assert all(status == "processing" for _, _, status in hub.status_updates)
+    assert len(hub.status_updates) == 5
+
+    await hub.stop()
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import time
+
+import pytest
+import runes_client as rune
+from runes_client import deadline
+from runes_client.process_pool import ProcessWorkerFarm
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+started = []
+
+
+async def hanging_method(name: str):
+    started.append(rune.output().message_id)
+    await asyncio.sleep(3600)
+
+
+@deadline(0.1)
+async def slow_method(name: str):
+    started.append(rune.output().message_id)
+    await asyncio.sleep(3600)
+
+
+def worker_method(seconds: float):
+    time.sleep(seconds)
+    rune.output().add_message(f"slept in {os.getpid()}")
+
+
+def abort_request(message_id):
+    return {"type": "abort", "data": {"message_id": message_id}}
+
+
+def reply_errors(hub):
+    return {reply["id"]: reply["response"]["error"] for reply in hub.replies}
+
+
+@pytest.mark.asyncio
+async def test_abort_frees_the_slot_of_a_running_and_a_queued_job():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, hanging_method)
+    client.job_executor.set_max_queued_jobs(1)
+    token = client.connection_token
+    started.clear()
+    hub.add_pending_message(token, "m1", run_method_request("hanging_method", name="a"))
+    hub.add_pending_message(token, "m2", run_method_request("hanging_method", name="b"))
+    await client.poll_once()
+    await asyncio.sleep(0.05)
+    assert started == ["m1"]
+
+    # EXECUTE
+    hub.add_pending_message(token, "a1", abort_request("m2"))
+    hub.add_pending_message(token, "a2", abort_request("m1"))
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert started == ["m1"]
+    assert reply_errors(hub) == {
+        "m1": "Aborted by the plugin",
+        "m2": "Aborted by the plugin",
+    }
+    assert (token, "a1", "completed") in hub.status_updates
+    assert client.jobs == {}
+    assert client.job_executor.free_slots == 1
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_deadline_ends_the_job_with_an_error_and_removes_its_temp_dir():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, slow_method)
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("slow_method", name="a")
+    )
+
+    # EXECUTE
+    job_dirs = []
+    original_execute_job = client.execute_job
+
+    async def execute_job(job, on_start=None):
+        task = asyncio.create_task(original_execute_job(job, on_start))
+        await asyncio.sleep(0.05)
+        job_dirs.append(job.temp_dir)
+        await task
+
+    client.execute_job = execute_job
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert reply_errors(hub) == {"m1": "Deadline of 0.1 seconds exceeded"}
+    assert job_dirs[0] is not None and not os.path.exists(job_dirs[0])
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_message_deadline_applies_to_methods_without_one():
+    hub = await HubStandIn().start()
+    client = await make_client(hub, hanging_method)
+    request = run_method_request("hanging_method", name="a")
+    request["data"]["deadline_seconds"] = 0.05
+    hub.add_pending_message(client.connection_token, "m1", request)
+
+    await client.poll_once()
+    await client.job_executor.join()
+
+    assert reply_errors(hub) == {"m1": "Deadline of 0.05 seconds exceeded"}
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_abort_kills_the_process_worker_and_replaces_it():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, worker_method)
+    client.job_executor.set_max_concurrent_jobs(2)
+    client.process_farm = ProcessWorkerFarm(num_workers=1)
+    await client.process_farm.start([client])
+    token = client.connection_token
+
+    try:
+        hub.add_pending_message(
+            token, "m1", run_method_request("worker_method", seconds=60)
+        )
+        await client.poll_once()
+        await asyncio.sleep(0.3)
+
+        # EXECUTE
+        hub.add_pending_message(token, "a1", abort_request("m1"))
+        await client.poll_once()
+        await client.job_executor.join()
+
+        hub.add_pending_message(
+            token, "m2", run_method_request("worker_method", seconds=0)
+        )
+        await client.poll_once()
+        await client.job_executor.join()
+    finally:
+        client.process_farm.shutdown()
+
+    # ASSERTS
+    assert reply_errors(hub)["m1"] == "Aborted by the plugin"
+    messages = {reply["id"]: reply["response"]["message"] for reply in hub.replies}
+    assert messages["m2"].startswith("slept in")
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_abort_replaces_only_the_worker_of_the_aborted_job():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, worker_method)
+    client.job_executor.set_max_concurrent_jobs(2)
+    client.process_farm = ProcessWorkerFarm(num_workers=2)
+    await client.process_farm.start([client])
+    original_pids = {worker.pid for worker in client.process_farm.workers}
+    token = client.connection_token
+
+    try:
+        hub.add_pending_message(
+            token, "m1", run_method_request("worker_method", seconds=60)
+        )
+        hub.add_pending_message(
+            token, "m2", run_method_request("worker_method", seconds=0.6)
+        )
+        await client.poll_once()
+        await asyncio.sleep(0.3)
+
+        # EXECUTE
+        hub.add_pending_message(token, "a1", abort_request("m1"))
+        await client.poll_once()
+        await client.job_executor.join()
+        pids = {worker.pid for worker in client.process_farm.workers}
+    finally:
+        client.process_farm.shutdown()
+
+    # ASSERTS
+    assert reply_errors(hub)["m1"] == "Aborted by the plugin"
+    messages = {reply["id"]: reply["response"]["message"] for reply in hub.replies}
+    m2_pid = int(messages["m2"].split(" ")[-1])
+    assert m2_pid in original_pids
+    assert m2_pid in pids
+    assert len(pids - original_pids) == 1
+
+    await hub.stop()
@@ -0,0 +1,25 @@
+import json
+
+from runes_client import codec
+
+
+def test_round_trip():
+    payload = {"files": [{"name": "a.wav", "type": "audio"}], "logs": "ünïcode\n", "error": None}
+
+    assert codec.loads(codec.dumps(payload)) == payload
+    assert codec.loads(codec.dumps_bytes(payload)) == payload
+
+
+def test_falls_back_to_stdlib_without_orjson(monkeypatch):
+    monkeypatch.setattr(codec, "orjson", None)
+    payload = {"status": "completed", "files": []}
+
+    assert codec.dumps(payload) == json.dumps(payload)
+    assert codec.loads(b'{"status": "completed"}') == {"status": "completed"}
+
+
+def test_canonical_dumps_matches_stdlib_sorted_output():
+    # Connection tokens are derived from this output, it must never change
+    payload = {"b": 1, "a": [1, 2], "c": "ü"}
+
+    assert codec.canonical_dumps(payload) == json.dumps(payload, sort_keys=True)
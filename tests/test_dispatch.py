@@ -0,0 +1,100 @@
+import uuid
+
+import pytest
+import runes_client as rune
+from runes_client import WebSocketClient
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+imports_loaded = []
+
+
+async def load_model():
+    imports_loaded.append(True)
+
+
+async def generate(prompt: str):
+    await rune.output().add_message(f"generated {prompt}")
+
+
+async def variation(seed: int):
+    await rune.output().add_message(f"variation {seed}")
+
+
+@pytest.mark.asyncio
+async def test_each_registered_method_gets_its_own_contract_and_is_dispatched():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, generate, variation)
+    client.register_imports(load_model)
+    client.job_executor.set_max_queued_jobs(1)
+    imports_loaded.clear()
+
+    # EXECUTE
+    await client.send_registered_methods_to_server()
+
+    generate_token = client.method_tokens["generate"]
+    variation_token = client.method_tokens["variation"]
+    hub.add_pending_message(
+        generate_token, "m1", run_method_request("generate", prompt="drums")
+    )
+    hub.add_pending_message(
+        variation_token, "m2", run_method_request("variation", seed=7)
+    )
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert generate_token != variation_token
+    assert client.connection_token == generate_token
+    assert client.connection_tokens == [generate_token, variation_token]
+    assert hub.contracts[generate_token]["method_name"] == "generate"
+    assert hub.contracts[variation_token]["method_name"] == "variation"
+    assert imports_loaded == [True]
+
+    replies = {reply["id"]: reply for reply in hub.replies}
+    assert replies["m1"]["response"]["message"] == "generated drums"
+    assert replies["m1"]["token"] == generate_token
+    assert replies["m2"]["response"]["message"] == "variation 7"
+    assert replies["m2"]["token"] == variation_token
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_single_method_token_is_unchanged():
+    client = WebSocketClient("127.0.0.1", "1234")
+    client.set_token(str(uuid.uuid4()))
+    await client.register_method(generate)
+    details = client.method_details["generate"]
+
+    assert client.connection_token == client.generate_uuid(
+        str(details)
+        + str(client.master_token)
+        + str(client.name)
+        + str(client.version)
+        + str(client.author)
+        + str(client.description)
+    )
+
+
+@pytest.mark.asyncio
+async def test_messages_without_a_job_leave_pending_when_dispatched():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, generate)
+    token = client.connection_token
+    hub.add_pending_message(token, "m1", {"type": "close_connection", "data": {}})
+    hub.add_pending_message(token, "m2", {"type": "telemetry", "data": {}})
+    hub.add_pending_message(token, "m3", {"data": {}})
+
+    # EXECUTE
+    await client.poll_once()
+    client.message_cursors.clear()
+    found_again = await client.poll_once()
+
+    # ASSERTS
+    statuses = {message_id: status for _, message_id, status in hub.status_updates}
+    assert statuses == {"m1": "completed", "m2": "error", "m3": "error"}
+    assert not found_again
+
+    await hub.stop()
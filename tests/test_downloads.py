@@ -0,0 +1,143 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+import runes_client as rune
+from runes_client import WebSocketClient
+
+BUCKET = "https://storage.googleapis.com/bucket"
+
+
+class RecordingClient(WebSocketClient):
+    """Downloads nothing, but records which URLs were fetched and how many at once."""
+
+    def __init__(self, active):
+        super().__init__("127.0.0.1", "1234")
+        self.active = active
+        self.fetched = []
+
+    async def download_file(self, url, session, temp_dir=None, local_filename=None):
+        self.fetched.append(url)
+        self.active["now"] += 1
+        self.active["peak"] = max(self.active["peak"], self.active["now"])
+        # Later URLs finish first, the replaced paths must not depend on it
+        await asyncio.sleep(0.05 / (len(self.fetched) + 1))
+        self.active["now"] -= 1
+        return f"{temp_dir}/{local_filename}"
+
+
+def message():
+    return {
+        "type": "run_method",
+        "data": {
+            "method_name": "mix",
+            "params": {
+                "stem": {"value": f"{BUCKET}/a/drums.wav"},
+                "reference": {"value": f"{BUCKET}/b/drums.wav"},
+                "midi": {"value": f"{BUCKET}/melody.mid"},
+                "stems": {
+                    "value": [
+                        {"url": f"{BUCKET}/bass.wav"},
+                        {"url": f"{BUCKET}/a/drums.wav"},
+                    ]
+                },
+                "prompt": {"value": "no download"},
+            },
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_downloads_run_concurrently_once_per_url_with_stable_paths():
+    # SETUP
+    active = {"now": 0, "peak": 0}
+    client = RecordingClient(active)
+    client.download_concurrency = 2
+    msg = message()
+
+    # EXECUTE
+    await client.download_gcp_files(msg, session=None, temp_dir="/tmp/job")
+
+    # ASSERTS
+    params = msg["data"]["params"]
+    assert sorted(client.fetched) == sorted(
+        [
+            f"{BUCKET}/a/drums.wav",
+            f"{BUCKET}/b/drums.wav",
+            f"{BUCKET}/melody.mid",
+            f"{BUCKET}/bass.wav",
+        ]
+    )
+    assert active["peak"] == 2
+    assert params["stem"]["value"] == "/tmp/job/drums.wav"
+    assert params["reference"]["value"] == "/tmp/job/1_drums.wav"
+    assert params["midi"]["value"] == "/tmp/job/melody.mid"
+    assert params["stems"]["value"] == [
+        {"url": "/tmp/job/bass.wav"},
+        {"url": "/tmp/job/drums.wav"},
+    ]
+    assert params["prompt"]["value"] == "no download"
+
+
+@pytest.mark.asyncio
+async def test_total_limit_is_shared_by_every_message():
+    # SETUP
+    active = {"now": 0, "peak": 0}
+    clients = [RecordingClient(active), RecordingClient(active)]
+    rune.set_download_concurrency(total=3)
+
+    # EXECUTE
+    try:
+        await asyncio.gather(
+            *(
+                client.download_gcp_files(message(), session=None, temp_dir="/tmp/job")
+                for client in clients
+            )
+        )
+    finally:
+        rune.set_download_concurrency(total=8)
+
+    # ASSERTS
+    assert active["peak"] == 3
+    assert len(clients[0].fetched) == len(clients[1].fetched) == 4
+
+
+class WritingDownloader:
+    """Writes a short tone instead of fetching, longer for each URL."""
+
+    def __init__(self, retry_policy=None):
+        pass
+
+    async def download(self, url, local_path, session=None):
+        seconds = 0.1 if url.endswith(".wav") else 0.2
+        tone = np.zeros(int(8000 * seconds), dtype=np.float32)
+        sf.write(local_path, tone, 8000, format=os.path.splitext(local_path)[1][1:].upper())
+
+
+@pytest.mark.asyncio
+async def test_same_stem_audio_inputs_are_converted_side_by_side(tmp_path, monkeypatch):
+    # SETUP
+    monkeypatch.setattr(rune.core, "FileDownloader", WritingDownloader)
+    client = WebSocketClient("127.0.0.1", "1234")
+    client.input_sample_rate = 8000
+    msg = {
+        "data": {
+            "params": {
+                "dry": {"value": f"{BUCKET}/a.wav"},
+                "wet": {"value": f"{BUCKET}/a.flac"},
+            }
+        }
+    }
+
+    # EXECUTE
+    await client.download_gcp_files(msg, session=None, temp_dir=str(tmp_path))
+
+    # ASSERTS
+    params = msg["data"]["params"]
+    dry, wet = params["dry"]["value"], params["wet"]["value"]
+    assert os.path.dirname(dry) == os.path.dirname(wet) == str(tmp_path / "resampled")
+    assert dry != wet
+    assert sf.info(dry).frames == 800
+    assert sf.info(wet).frames == 1600
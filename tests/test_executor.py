@@ -0,0 +1,180 @@
+import asyncio
+import uuid
+
+import pytest
+import runes_client as rune
+from runes_client.executor import JobExecutor
+from runes_client.metrics import metrics
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+
+@pytest.mark.asyncio
+async def test_never_runs_more_than_max_concurrent_jobs():
+    executor = JobExecutor(max_concurrent_jobs=2)
+    running = []
+    peak = []
+
+    async def job():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    for _ in range(6):
+        executor.submit(job)
+    await executor.join()
+
+    assert len(peak) == 6
+    assert max(peak) == 2
+
+
+@pytest.mark.asyncio
+async def test_queued_jobs_wait_and_run_in_order():
+    executor = JobExecutor(max_concurrent_jobs=1)
+    release = asyncio.Event()
+    order = []
+
+    async def blocking_job():
+        order.append("first")
+        await release.wait()
+
+    async def queued_job(name):
+        order.append(name)
+
+    executor.submit(blocking_job)
+    executor.submit(lambda: queued_job("second"))
+    executor.submit(lambda: queued_job("third"))
+    await asyncio.sleep(0.01)
+
+    assert order == ["first"]
+    assert executor.free_slots == 0
+    assert metrics.get("jobs_queued") == 2
+
+    release.set()
+    await executor.join()
+
+    assert order == ["first", "second", "third"]
+    assert executor.free_slots == 1
+
+
+def test_invalid_slot_count_raises():
+    with pytest.raises(ValueError):
+        JobExecutor(max_concurrent_jobs=0)
+
+
+async def slow_method(a: int):
+    await asyncio.sleep(0.05)
+    await rune.output().add_message(f"done {a}")
+
+
+@pytest.mark.asyncio
+async def test_message_moves_to_processing_only_when_a_slot_is_taken():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, slow_method)
+    client.job_executor = JobExecutor(max_concurrent_jobs=1, max_queued_jobs=1)
+
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("slow_method", a=1)
+    )
+    hub.add_pending_message(
+        client.connection_token, "m2", run_method_request("slow_method", a=2)
+    )
+
+    # EXECUTE
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert hub.events == [
+        ("status", "m1", "processing"),
+        ("reply", "m1"),
+        ("status", "m2", "processing"),
+        ("reply", "m2"),
+    ]
+    messages = {reply["id"]: reply["response"]["message"] for reply in hub.replies}
+    assert messages == {"m1": "done 1", "m2": "done 2"}
+
+    await hub.stop()
+
+
+def test_claimable_counts_free_slots_and_queue_depth():
+    executor = JobExecutor(max_concurrent_jobs=2, max_queued_jobs=1)
+    assert executor.claimable == 3
+
+    executor.set_max_queued_jobs(0)
+    assert executor.claimable == 2
+
+    with pytest.raises(ValueError):
+        executor.set_max_queued_jobs(-1)
+
+
+@pytest.mark.asyncio
+async def test_poll_claims_only_free_slots_and_leaves_the_rest_pending():
+    # SETUP
+    hub = await HubStandIn().start()
+    master_token = str(uuid.uuid4())
+    replicas = []
+    for _ in range(2):
+        client = await make_client(hub, slow_method, token=master_token)
+        client.job_executor = JobExecutor(max_concurrent_jobs=1)
+        replicas.append(client)
+    first, second = replicas
+    assert first.connection_token == second.connection_token
+
+    for i in range(1, 4):
+        hub.add_pending_message(
+            first.connection_token, f"m{i}", run_method_request("slow_method", a=i)
+        )
+
+    # EXECUTE
+    await first.poll_once()
+    await asyncio.sleep(0.01)
+    claimed_by_first = set(first.jobs)
+    await second.poll_once()
+    await asyncio.sleep(0.01)
+    claimed_by_second = set(second.jobs)
+    await asyncio.gather(first.job_executor.join(), second.job_executor.join())
+    await first.poll_once()
+    await first.job_executor.join()
+
+    # ASSERTS
+    assert claimed_by_first == {"m1"}
+    assert claimed_by_second == {"m2"}
+    assert hub.statuses["m1"] == "replied"
+    assert hub.statuses["m2"] == "replied"
+    assert hub.statuses["m3"] == "replied"
+    processing = [message_id for _, message_id, status in hub.status_updates if status == "processing"]
+    assert sorted(processing) == ["m1", "m2", "m3"]
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_malformed_run_method_is_errored_and_the_poll_goes_on():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, slow_method)
+    client.job_executor = JobExecutor(max_concurrent_jobs=1, max_queued_jobs=0)
+
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("slow_method", a=1)
+    )
+    hub.add_pending_message(client.connection_token, "m2", {"type": "run_method", "data": {}})
+    hub.add_pending_message(
+        client.connection_token, "m3", run_method_request("slow_method", a=3)
+    )
+
+    # EXECUTE
+    # m1 takes the only slot, so m2 reaches the batch and single-flight checks of can_claim
+    await client.poll_once()
+    statuses_while_busy = (hub.statuses["m2"], hub.statuses["m3"])
+    await client.job_executor.join()
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert statuses_while_busy == ("error", "pending")
+    assert hub.statuses == {"m1": "replied", "m2": "error", "m3": "replied"}
+
+    await hub.stop()
@@ -0,0 +1,154 @@
+import base64
+import hashlib
+import os
+
+import pytest
+from aiohttp import web
+from runes_client.file_downloader import FileDownloader, IntegrityError, parse_goog_hash
+from runes_client.http_session import HTTPSessionManager
+from runes_client.retry_policy import RetryPolicy
+
+CONTENT = os.urandom(300 * 1024)
+MD5 = base64.b64encode(hashlib.md5(CONTENT).digest()).decode("ascii")
+
+
+class StorageStandIn:
+    """Serves CONTENT like GCS, optionally dropping the first connection mid-body."""
+
+    def __init__(self, drop_after=None, honour_range=True, md5=MD5):
+        self.drop_after = drop_after
+        self.honour_range = honour_range
+        self.md5 = md5
+        self.ranges = []
+        self.runner = None
+        self.url = None
+
+    async def serve(self, request):
+        requested = request.headers.get("Range")
+        self.ranges.append(requested)
+        start = 0
+        status = 200
+        headers = {"x-goog-hash": f"md5={self.md5}"}
+        if requested and self.honour_range:
+            start = int(requested.split("=")[1].rstrip("-"))
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}"
+
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(CONTENT) - start
+        await response.prepare(request)
+        if self.drop_after is not None and len(self.ranges) == 1:
+            await response.write(CONTENT[: self.drop_after])
+            request.transport.close()
+            return response
+        await response.write(CONTENT[start:])
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.add_routes([web.get("/bucket/stem.wav", self.serve)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{self.runner.addresses[0][1]}/bucket/stem.wav"
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def make_downloader():
+    return FileDownloader(
+        session_manager=HTTPSessionManager(),
+        retry_policy=RetryPolicy(base_delay=0.01, max_delay=0.01),
+        chunk_size=64 * 1024,
+    )
+
+
+def test_parse_goog_hash():
+    assert parse_goog_hash(["crc32c=n03x6A==,md5=Ojk9c3dhfxgoKVVHYwFbHQ=="]) == {
+        "crc32c": "n03x6A==",
+        "md5": "Ojk9c3dhfxgoKVVHYwFbHQ==",
+    }
+
+
+@pytest.mark.asyncio
+async def test_streams_to_disk_and_returns_the_content_hash(tmp_path):
+    # SETUP
+    storage = await StorageStandIn().start()
+    downloader = make_downloader()
+    local_path = str(tmp_path / "stem.wav")
+
+    # EXECUTE
+    digest = await downloader.download(storage.url, local_path)
+
+    # ASSERTS
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    with open(local_path, "rb") as f:
+        assert f.read() == CONTENT
+    assert storage.ranges == [None]
+
+    await downloader.session_manager.close()
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_dropped_connection_resumes_with_a_range_request(tmp_path):
+    # SETUP
+    storage = await StorageStandIn(drop_after=100 * 1024).start()
+    downloader = make_downloader()
+    local_path = str(tmp_path / "stem.wav")
+
+    # EXECUTE
+    digest = await downloader.download(storage.url, local_path)
+
+    # ASSERTS
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    with open(local_path, "rb") as f:
+        assert f.read() == CONTENT
+    assert storage.ranges[0] is None
+    resumed_at = int(storage.ranges[1].split("=")[1].rstrip("-"))
+    assert 0 < resumed_at <= 100 * 1024
+
+    await downloader.session_manager.close()
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_server_ignoring_the_range_restarts_the_file(tmp_path):
+    # SETUP
+    storage = await StorageStandIn(drop_after=100 * 1024, honour_range=False).start()
+    downloader = make_downloader()
+    local_path = str(tmp_path / "stem.wav")
+
+    # EXECUTE
+    digest = await downloader.download(storage.url, local_path)
+
+    # ASSERTS
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    with open(local_path, "rb") as f:
+        assert f.read() == CONTENT
+
+    await downloader.session_manager.close()
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_checksum_mismatch_raises_and_removes_the_file(tmp_path):
+    # SETUP
+    wrong_md5 = base64.b64encode(hashlib.md5(b"other").digest()).decode("ascii")
+    storage = await StorageStandIn(md5=wrong_md5).start()
+    downloader = make_downloader()
+    local_path = str(tmp_path / "stem.wav")
+
+    # EXECUTE
+    with pytest.raises(IntegrityError):
+        await downloader.download(storage.url, local_path)
+
+    # ASSERTS
+    assert not os.path.exists(local_path)
+
+    await downloader.session_manager.close()
+    await storage.stop()
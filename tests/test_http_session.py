@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from runes_client.http_session import HTTPSessionManager
+
+
+@pytest.mark.asyncio
+async def test_get_session_is_reused_within_loop():
+    manager = HTTPSessionManager(limit=7, limit_per_host=3)
+
+    session_one = await manager.get_session()
+    session_two = await manager.get_session()
+
+    assert session_one is session_two
+    assert session_one.connector.limit == 7
+    assert session_one.connector.limit_per_host == 3
+
+    await manager.close()
+    assert session_one.closed
+
+
+@pytest.mark.asyncio
+async def test_closed_session_is_recreated():
+    manager = HTTPSessionManager()
+
+    session_one = await manager.get_session()
+    await manager.close()
+    session_two = await manager.get_session()
+
+    assert session_one is not session_two
+    assert not session_two.closed
+
+    await manager.close()
+
+
+def test_separate_loops_get_separate_sessions():
+    manager = HTTPSessionManager()
+
+    async def get_and_close():
+        session = await manager.get_session()
+        await manager.close()
+        return session
+
+    session_one = asyncio.run(get_and_close())
+    session_two = asyncio.run(get_and_close())
+
+    assert session_one is not session_two
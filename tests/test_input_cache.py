@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import os
+import stat
+
+import pytest
+from aiohttp import web
+from runes_client.file_downloader import FileDownloader
+from runes_client.http_session import HTTPSessionManager
+from runes_client.input_cache import InputCache, _FileLock, url_key
+from runes_client.retry_policy import RetryPolicy
+
+
+class StorageStandIn:
+    """Serves named objects with an ETag and answers If-None-Match like GCS."""
+
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+        self.runner = None
+        self.base_url = None
+
+    def put(self, name, content):
+        self.objects[name] = content
+
+    async def serve(self, request):
+        name = request.match_info["name"]
+        content = self.objects[name]
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        self.requests.append((name, request.headers.get("If-None-Match")))
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        # Slow enough for concurrent fetches to overlap
+        await asyncio.sleep(0.02)
+        return web.Response(body=content, headers={"ETag": etag})
+
+    async def start(self):
+        app = web.Application()
+        app.add_routes([web.get("/bucket/{name}", self.serve)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.base_url = f"http://127.0.0.1:{self.runner.addresses[0][1]}/bucket"
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def make_downloader():
+    return FileDownloader(
+        session_manager=HTTPSessionManager(),
+        retry_policy=RetryPolicy(base_delay=0.01, max_delay=0.01),
+    )
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_signed_urls_of_one_object_share_a_key():
+    url = "https://storage.googleapis.com/bucket/stem.wav"
+    assert url_key(f"{url}?X-Goog-Signature=abc&X-Goog-Date=1") == url_key(
+        f"{url}?X-Goog-Date=2&X-Goog-Signature=def"
+    )
+    assert url_key(f"{url}?generation=1") != url_key(f"{url}?generation=2")
+
+
+@pytest.mark.asyncio
+async def test_known_url_is_revalidated_and_handed_out_as_a_read_only_hardlink(tmp_path):
+    # SETUP
+    storage = await StorageStandIn().start()
+    storage.put("stem.wav", b"drums" * 1000)
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    downloader = make_downloader()
+    (tmp_path / "job1").mkdir()
+    (tmp_path / "job2").mkdir()
+
+    # EXECUTE
+    first = await cache.fetch(
+        f"{storage.base_url}/stem.wav", str(tmp_path / "job1" / "stem.wav"), downloader
+    )
+    second = await cache.fetch(
+        f"{storage.base_url}/stem.wav", str(tmp_path / "job2" / "stem.wav"), downloader
+    )
+
+    # ASSERTS
+    assert first == second == hashlib.sha256(b"drums" * 1000).hexdigest()
+    assert storage.requests[0] == ("stem.wav", None)
+    assert storage.requests[1][1] is not None
+    job1 = os.stat(tmp_path / "job1" / "stem.wav")
+    job2 = os.stat(tmp_path / "job2" / "stem.wav")
+    assert job1.st_ino == job2.st_ino
+    assert not job1.st_mode & stat.S_IWUSR
+    assert read(tmp_path / "job2" / "stem.wav") == b"drums" * 1000
+
+    await downloader.session_manager.close()
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_changed_object_is_downloaded_again(tmp_path):
+    # SETUP
+    storage = await StorageStandIn().start()
+    storage.put("stem.wav", b"take 1")
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    downloader = make_downloader()
+    url = f"{storage.base_url}/stem.wav"
+    await cache.fetch(url, str(tmp_path / "first.wav"), downloader)
+
+    # EXECUTE
+    storage.put("stem.wav", b"take 2")
+    await cache.fetch(url, str(tmp_path / "second.wav"), downloader)
+
+    # ASSERTS
+    assert read(tmp_path / "first.wav") == b"take 1"
+    assert read(tmp_path / "second.wav") == b"take 2"
+
+    await downloader.session_manager.close()
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_url_pinned_to_a_generation_is_not_revalidated(tmp_path):
+    # SETUP
+    storage = await StorageStandIn().start()
+    storage.put("stem.wav", b"drums")
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    downloader = make_downloader()
+    url = f"{storage.base_url}/stem.wav?generation=7"
+
+    # EXECUTE
+    await cache.fetch(f"{url}&X-Goog-Signature=a", str(tmp_path / "first.wav"), downloader)
+    await cache.fetch(f"{url}&X-Goog-Signature=b", str(tmp_path / "second.wav"), downloader)
+
+    # ASSERTS
+    assert storage.requests == [("stem.wav", None)]
+    assert read(tmp_path / "second.wav") == b"drums"
+
+    await downloader.session_manager.close()
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_files_are_evicted_beyond_the_size_limit(tmp_path):
+    # SETUP
+    storage = await StorageStandIn().start()
+    for name in ("a", "b", "c"):
+        storage.put(name, name.encode() * 100)
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=250)
+    downloader = make_downloader()
+
+    # EXECUTE
+    await cache.fetch(f"{storage.base_url}/a", str(tmp_path / "a1"), downloader)
+    await asyncio.sleep(0.01)
+    await cache.fetch(f"{storage.base_url}/b", str(tmp_path / "b1"), downloader)
+    await asyncio.sleep(0.01)
+    # Using "a" again makes "b" the least recently used
+    await cache.fetch(f"{storage.base_url}/a", str(tmp_path / "a2"), downloader)
+    await asyncio.sleep(0.01)
+    await cache.fetch(f"{storage.base_url}/c", str(tmp_path / "c1"), downloader)
+
+    # ASSERTS
+    blobs = os.listdir(tmp_path / "cache" / "blobs")
+    assert sorted(blobs) == sorted(
+        hashlib.sha256(name.encode() * 100).hexdigest() for name in ("a", "c")
+    )
+    # A job holding an evicted file keeps its copy
+    assert read(tmp_path / "b1") == b"b" * 100
+
+    await downloader.session_manager.close()
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_fetches_of_one_url_download_it_once(tmp_path):
+    # SETUP
+    storage = await StorageStandIn().start()
+    storage.put("stem.wav", b"drums" * 1000)
+    # Two caches on one directory stand in for two processes of the host
+    caches = [InputCache(str(tmp_path / "cache"), max_bytes=1024 * 1024) for _ in range(2)]
+    downloader = make_downloader()
+    url = f"{storage.base_url}/stem.wav"
+
+    # EXECUTE
+    digests = await asyncio.gather(
+        *(
+            caches[i % 2].fetch(url, str(tmp_path / f"job{i}.wav"), downloader)
+            for i in range(6)
+        )
+    )
+
+    # ASSERTS
+    assert len(set(digests)) == 1
+    assert [if_none_match for _, if_none_match in storage.requests].count(None) == 1
+    for i in range(6):
+        assert read(tmp_path / f"job{i}.wav") == b"drums" * 1000
+
+    await downloader.session_manager.close()
+    await storage.stop()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_wait_for_another_process_leaves_the_url_unlocked(tmp_path):
+    # SETUP
+    storage = await StorageStandIn().start()
+    storage.put("stem.wav", b"drums")
+    caches = [InputCache(str(tmp_path / "cache"), max_bytes=1024 * 1024) for _ in range(2)]
+    downloader = make_downloader()
+    url = f"{storage.base_url}/stem.wav"
+    # Another process holds the lock of the URL
+    other_process = _FileLock(
+        os.path.join(str(tmp_path / "cache"), "locks", f"{url_key(url)}.lock")
+    )
+    assert other_process.try_acquire()
+
+    # EXECUTE
+    waiting = asyncio.ensure_future(caches[0].fetch(url, str(tmp_path / "a.wav"), downloader))
+    await asyncio.sleep(0.1)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    other_process.release()
+    await asyncio.wait_for(
+        caches[1].fetch(url, str(tmp_path / "b.wav"), downloader), timeout=2
+    )
+
+    # ASSERTS
+    assert not os.path.exists(tmp_path / "a.wav")
+    assert read(tmp_path / "b.wav") == b"drums"
+    assert caches[0]._url_locks == {}
+
+    await downloader.session_manager.close()
+    await storage.stop()
@@ -0,0 +1,136 @@
+import asyncio
+import uuid
+
+import pytest
+import runes_client as rune
+from runes_client.executor import JobExecutor
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+runs = []
+
+
+async def render(take: int, seconds: float = 0.02):
+    runs.append(take)
+    await asyncio.sleep(seconds)
+    await rune.output().add_message(f"rendered {take}")
+
+
+async def make_replicas(hub, master_token, count, lease_seconds=5):
+    replicas = []
+    for _ in range(count):
+        client = await make_client(hub, render, token=master_token)
+        client.job_executor = JobExecutor(max_concurrent_jobs=2, max_queued_jobs=2)
+        client.lease_seconds = lease_seconds
+        replicas.append(client)
+    runs.clear()
+    return replicas
+
+
+async def stop(hub, replicas):
+    for client in replicas:
+        if client.lease_task is not None:
+            client.lease_task.cancel()
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_replicas_process_every_message_exactly_once():
+    # SETUP
+    hub = await HubStandIn().start()
+    replicas = await make_replicas(hub, str(uuid.uuid4()), 3)
+    token = replicas[0].connection_token
+    for take in range(12):
+        hub.add_pending_message(
+            token, f"m{take}", run_method_request("render", take=take)
+        )
+
+    # EXECUTE
+    for _ in range(20):
+        await asyncio.gather(*(client.poll_once() for client in replicas))
+        await asyncio.sleep(0.01)
+        if len(hub.replies) == 12:
+            break
+    await asyncio.gather(*(client.job_executor.join() for client in replicas))
+
+    # ASSERTS
+    assert sorted(runs) == list(range(12))
+    assert sorted(reply["id"] for reply in hub.replies) == sorted(f"m{i}" for i in range(12))
+    assert len(hub.claims) == 12
+    assert len({replica_id for _, replica_id in hub.claims}) > 1
+
+    await stop(hub, replicas)
+
+
+@pytest.mark.asyncio
+async def test_lease_is_renewed_while_a_long_job_runs():
+    # SETUP
+    hub = await HubStandIn().start()
+    first, second = await make_replicas(hub, str(uuid.uuid4()), 2, lease_seconds=0.15)
+    hub.add_pending_message(
+        first.connection_token, "m1", run_method_request("render", take=1, seconds=0.4)
+    )
+
+    # EXECUTE
+    await first.poll_once()
+    await asyncio.sleep(0.3)
+    await second.poll_once()
+    await first.job_executor.join()
+
+    # ASSERTS
+    assert runs == [1]
+    assert second.jobs == {}
+    assert hub.claims == [("m1", first.replica_id)]
+    assert [reply["id"] for reply in hub.replies] == ["m1"]
+
+    await stop(hub, [first, second])
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_of_a_dead_replica_goes_back_to_pending():
+    # SETUP
+    hub = await HubStandIn().start()
+    (client,) = await make_replicas(hub, str(uuid.uuid4()), 1)
+    token = client.connection_token
+    hub.add_pending_message(token, "m1", run_method_request("render", take=1))
+    # A replica that claims the message and dies before renewing its lease
+    assert await client.api_client.claim_message(token, "m1", "dead-replica", 0.1) is True
+
+    # EXECUTE
+    await client.poll_once()
+    claimed_while_leased = dict(client.jobs)
+    await asyncio.sleep(0.15)
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert claimed_while_leased == {}
+    assert runs == [1]
+    assert hub.claims == [("m1", "dead-replica"), ("m1", client.replica_id)]
+    assert [reply["id"] for reply in hub.replies] == ["m1"]
+
+    await stop(hub, [client])
+
+
+@pytest.mark.asyncio
+async def test_job_is_abandoned_without_reply_once_its_lease_is_lost():
+    # SETUP
+    hub = await HubStandIn().start()
+    (client,) = await make_replicas(hub, str(uuid.uuid4()), 1, lease_seconds=0.15)
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("render", take=1, seconds=5)
+    )
+    await client.poll_once()
+    await asyncio.sleep(0.02)
+    assert list(client.jobs) == ["m1"]
+
+    # EXECUTE
+    # The lease expired and another replica claimed the message in the meantime
+    hub.leases["m1"] = ("other-replica", float("inf"))
+    await asyncio.sleep(0.1)
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert client.jobs == {}
+    assert hub.replies == []
+
+    await stop(hub, [client])
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+import runes_client as rune
+from runes_client.api_client import APIClient
+from runes_client.log_streamer import LogStreamer
+from runes_client.metrics import metrics
+from runes_client.output_capture import capture_output
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+
+async def long_method(steps: int):
+    for i in range(steps):
+        print(f"step {i}")
+        await asyncio.sleep(0.03)
+    await rune.output().add_message("done")
+
+
+@pytest.mark.asyncio
+async def test_logs_are_streamed_while_the_method_runs():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, long_method)
+    client.log_streaming = True
+    client.log_stream_interval = 0.05
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("long_method", steps=6)
+    )
+
+    # EXECUTE
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    chunks = hub.log_chunks["m1"]
+    assert len(chunks) > 1
+    assert [sequence for sequence, _ in chunks] == list(range(len(chunks)))
+    assert "".join(logs for _, logs in chunks) == "".join(
+        f"step {i}\n" for i in range(6)
+    )
+    # Chunks arrived before the job finished and the reply
+    assert hub.events.index(("logs", "m1")) < hub.events.index(("reply", "m1"))
+    assert hub.replies[0]["response"]["message"] == "done"
+
+    await hub.stop()
+
+
+class RejectingAPIClient:
+    supports_log_streaming = None
+
+    async def append_message_logs(self, token, message_id, logs, sequence):
+        self.supports_log_streaming = False
+        return False
+
+
+@pytest.mark.asyncio
+async def test_reply_keeps_full_logs_when_the_hub_cannot_stream():
+    streamer = LogStreamer(RejectingAPIClient(), "token", "m1", interval=0.01)
+    with capture_output() as captured:
+        streamer.start(captured)
+        print("x" * 5000)
+        await asyncio.sleep(0.05)
+    await streamer.close()
+
+    logs = captured.stdout.getvalue()
+    assert not streamer.delivered
+    assert streamer.reply_logs(logs) == logs
+
+
+@pytest.mark.asyncio
+async def test_reply_carries_only_the_tail_once_streamed():
+    hub = await HubStandIn().start()
+    streamer = LogStreamer(APIClient(hub.base_url), "token", "m1", max_chunk_chars=1000)
+    with capture_output() as captured:
+        streamer.start(captured)
+        print("x" * 5000)
+    await streamer.close()
+
+    logs = captured.stdout.getvalue()
+    assert len(hub.log_chunks["m1"]) == 6
+    assert streamer.reply_logs(logs).endswith("x" * 3999 + "\n")
+    assert len(streamer.reply_logs(logs)) < len(logs)
+
+    await hub.stop()
+
+
+class SlowAPIClient:
+    def __init__(self):
+        self.chunks = []
+
+    async def append_message_logs(self, token, message_id, logs, sequence):
+        await asyncio.sleep(0.1)
+        self.chunks.append(logs)
+        return True
+
+
+@pytest.mark.asyncio
+async def test_text_dropped_while_the_hub_lags_is_marked_in_the_stream():
+    api_client = SlowAPIClient()
+    streamer = LogStreamer(
+        api_client, "token", "m1", interval=0.01, max_chunk_chars=100, max_pending_chars=50
+    )
+    dropped_before = metrics.get("log_stream_dropped_chars_total", 0)
+    with capture_output() as captured:
+        streamer.start(captured)
+        print("a" * 20)
+        # The first chunk is on its way, the rest piles up behind it
+        await asyncio.sleep(0.02)
+        for i in range(10):
+            print(str(i) * 19)
+    await streamer.close()
+
+    streamed = "".join(api_client.chunks)
+    marker = "[... 150 characters dropped ...]\n"
+    # The newest 50 characters are kept behind the marker
+    kept = "7" * 9 + "\n" + "8" * 19 + "\n" + "9" * 19 + "\n"
+    assert streamed == "a" * 20 + "\n" + marker + kept
+    assert streamer.dropped_chars == 150
+    assert metrics.get("log_stream_dropped_chars_total") - dropped_before == 150
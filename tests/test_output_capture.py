@@ -0,0 +1,89 @@
+import asyncio
+import sys
+
+import pytest
+import runes_client as rune
+from runes_client.executor import ContextThreadPoolExecutor
+from runes_client.output_capture import OutputBuffer, capture_output
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+
+@pytest.mark.asyncio
+async def test_concurrent_captures_do_not_interleave():
+    async def job(name):
+        with capture_output() as captured:
+            for i in range(3):
+                print(f"{name} {i}")
+                await asyncio.sleep(0)
+        return captured.stdout.getvalue()
+
+    first, second = await asyncio.gather(job("a"), job("b"))
+
+    assert first == "a 0\na 1\na 2\n"
+    assert second == "b 0\nb 1\nb 2\n"
+
+
+@pytest.mark.asyncio
+async def test_writes_from_worker_threads_follow_the_job():
+    pool = ContextThreadPoolExecutor(max_workers=1)
+    with capture_output() as captured:
+        await asyncio.get_running_loop().run_in_executor(
+            pool, lambda: print("from thread", file=sys.stderr)
+        )
+    pool.shutdown()
+
+    assert captured.stderr.getvalue() == "from thread\n"
+
+
+def test_capture_is_released_when_the_body_raises():
+    with pytest.raises(RuntimeError):
+        with capture_output() as captured:
+            print("inside")
+            raise RuntimeError("boom")
+    print("outside")
+
+    assert captured.stdout.getvalue() == "inside\n"
+
+
+def test_buffer_keeps_only_the_most_recent_output():
+    buffer = OutputBuffer(max_chars=10)
+    seen = []
+    buffer.add_listener(seen.append)
+
+    buffer.write("0123456789")
+    buffer.write("abcde")
+
+    assert buffer.size == 10
+    assert buffer.getvalue() == "[... 5 characters dropped ...]\n56789abcde"
+    assert seen == ["0123456789", "abcde"]
+
+
+async def chatty_method(name: str):
+    for i in range(3):
+        print(f"{name} {i}")
+        await asyncio.sleep(0.01)
+    await rune.output().add_message(name)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_jobs_get_their_own_logs():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, chatty_method)
+    client.job_executor.set_max_concurrent_jobs(2)
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("chatty_method", name="one")
+    )
+    hub.add_pending_message(
+        client.connection_token, "m2", run_method_request("chatty_method", name="two")
+    )
+
+    # EXECUTE
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    logs = {reply["id"]: reply["response"]["logs"] for reply in hub.replies}
+    assert logs == {"m1": "one 0\none 1\none 2\n", "m2": "two 0\ntwo 1\ntwo 2\n"}
+
+    await hub.stop()
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from runes_client.metrics import metrics
+from runes_client.poll_scheduler import AdaptivePollScheduler
+
+
+def test_backs_off_after_burst_window_and_respects_max():
+    scheduler = AdaptivePollScheduler(
+        min_interval=1, max_interval=4, backoff_factor=2, burst_polls=2
+    )
+
+    scheduler.record_idle()
+    scheduler.record_idle()
+    assert scheduler.current_interval == 1
+
+    scheduler.record_idle()
+    assert scheduler.current_interval == 2
+
+    for _ in range(10):
+        scheduler.record_idle()
+    assert scheduler.current_interval == 4
+
+
+def test_activity_returns_to_min_interval():
+    scheduler = AdaptivePollScheduler(min_interval=1, max_interval=8, burst_polls=0)
+    for _ in range(10):
+        scheduler.record_idle()
+
+    scheduler.record_activity()
+
+    assert scheduler.current_interval == 1
+
+
+def test_jittered_delay_stays_within_bounds():
+    scheduler = AdaptivePollScheduler(
+        min_interval=1, max_interval=2, jitter=0.5, burst_polls=0
+    )
+    for _ in range(10):
+        scheduler.record_idle()
+
+    delays = [scheduler.next_delay() for _ in range(200)]
+
+    assert all(1 <= delay <= 2 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_current_interval_is_reported_in_metrics():
+    scheduler = AdaptivePollScheduler(
+        min_interval=1, max_interval=8, backoff_factor=2, burst_polls=0,
+        metric_name="test_poll_interval_seconds",
+    )
+
+    scheduler.record_idle()
+
+    assert metrics.get("test_poll_interval_seconds") == 2
+
+
+def test_invalid_bounds_raise():
+    with pytest.raises(ValueError):
+        AdaptivePollScheduler(min_interval=5, max_interval=1)
+
+
+@pytest.mark.asyncio
+async def test_wake_cuts_sleep_short():
+    scheduler = AdaptivePollScheduler(min_interval=10, max_interval=10)
+
+    waiter = asyncio.create_task(scheduler.wait())
+    await asyncio.sleep(0.01)
+    scheduler.wake()
+
+    await asyncio.wait_for(waiter, timeout=1)
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+import runes_client as rune
+from runes_client.process_pool import ProcessWorkerFarm
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+# Loaded by the imports function in the parent, inherited by the forked workers
+warm_model = None
+
+
+async def load_model():
+    global warm_model
+    warm_model = {"loaded_in": os.getpid()}
+
+
+def cpu_method(a: int):
+    print("working")
+    rune.output().add_message(
+        f"{a * a} pid={os.getpid()} model_from={warm_model['loaded_in']}"
+    )
+
+
+@pytest.mark.asyncio
+async def test_methods_run_in_workers_forked_after_imports():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, cpu_method)
+    client.register_imports(load_model)
+    client.process_farm = ProcessWorkerFarm(num_workers=2)
+
+    await client.initialize_dependencies()
+    await client.process_farm.start([client])
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("cpu_method", a=7)
+    )
+
+    # EXECUTE
+    try:
+        await client.poll_once()
+        await client.job_executor.join()
+    finally:
+        client.process_farm.shutdown()
+
+    # ASSERTS
+    assert len(hub.replies) == 1
+    response = hub.replies[0]["response"]
+    result, pid, model_from = response["message"].split(" ")
+    assert result == "49"
+    assert pid != f"pid={os.getpid()}"
+    assert model_from == f"model_from={os.getpid()}"
+    assert "working" in response["logs"]
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_count_is_fixed_once_started():
+    farm = ProcessWorkerFarm(num_workers=1)
+    await farm.start([])
+    try:
+        with pytest.raises(RuntimeError):
+            farm.set_num_workers(2)
+    finally:
+        farm.shutdown()
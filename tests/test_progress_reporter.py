@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import runes_client as rune
+from runes_client.output.progress_reporter import ProgressReporter
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+
+@pytest.mark.asyncio
+async def test_reports_are_coalesced_and_the_latest_is_delivered():
+    sent = []
+
+    async def send(fraction, note):
+        sent.append((fraction, note))
+
+    reporter = ProgressReporter(send, asyncio.get_running_loop(), max_updates_per_second=10)
+    started = time.monotonic()
+    for i in range(10001):
+        reporter.report(i / 10000, f"step {i}")
+        if i % 2000 == 0:
+            await asyncio.sleep(0.05)
+    await reporter.flush()
+    elapsed = time.monotonic() - started
+
+    assert sent[-1] == (1.0, "step 10000")
+    assert len(sent) <= elapsed * 10 + 2
+
+
+@pytest.mark.asyncio
+async def test_reports_from_threads_never_block():
+    sent = []
+    release = asyncio.Event()
+
+    async def slow_send(fraction, note):
+        await release.wait()
+        sent.append(fraction)
+
+    reporter = ProgressReporter(slow_send, asyncio.get_running_loop())
+
+    def report_from_thread():
+        for i in range(1000):
+            reporter.report(i / 999)
+
+    thread = threading.Thread(target=report_from_thread)
+    thread.start()
+    # The thread finishes even though no send can complete yet
+    await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+    release.set()
+    await reporter.flush()
+    assert sent[-1] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_stops_sending_when_the_hub_rejects_progress():
+    calls = []
+
+    async def rejected(fraction, note):
+        calls.append(fraction)
+        return False
+
+    reporter = ProgressReporter(rejected, asyncio.get_running_loop())
+    reporter.report(0.1)
+    await reporter.flush()
+    reporter.report(0.2)
+    await reporter.flush()
+
+    assert calls == [0.1]
+
+
+def progress_method(steps: int):
+    for i in range(steps):
+        rune.output().progress((i + 1) / steps, f"{i + 1}/{steps}")
+        time.sleep(0.001)
+    rune.output().add_message("done")
+
+
+@pytest.mark.asyncio
+async def test_progress_reaches_the_hub_before_the_reply():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, progress_method)
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("progress_method", steps=200)
+    )
+
+    # EXECUTE
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    updates = hub.progress_updates["m1"]
+    assert updates[-1] == (1.0, "200/200")
+    assert len(updates) < 20
+    assert hub.events.index(("progress", "m1")) < hub.events.index(("reply", "m1"))
+
+    await hub.stop()
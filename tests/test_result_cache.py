@@ -0,0 +1,133 @@
+import os
+
+import pytest
+import runes_client as rune
+from runes_client import no_result_cache
+from runes_client.file_uploader import object_name
+from runes_client.result_cache import ResultCache
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_tier_evicts_least_recently_used_and_expired_entries():
+    clock = FakeClock()
+    cache = ResultCache(ttl=10, max_entries=2, disk_dir=None, clock=clock)
+
+    cache.put("a", {"messages": ["a"]})
+    cache.put("b", {"messages": ["b"]})
+    assert cache.get("a") == {"messages": ["a"]}
+    cache.put("c", {"messages": ["c"]})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+    clock.now += 11
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+def test_disk_tier_survives_restarts_and_is_size_bounded(tmp_path):
+    clock = FakeClock()
+    cache = ResultCache(ttl=10, max_entries=10, disk_dir=str(tmp_path), clock=clock)
+    cache.put("a", {"messages": ["a"]})
+
+    restarted = ResultCache(ttl=10, max_entries=10, disk_dir=str(tmp_path), clock=clock)
+    assert restarted.get("a") == {"messages": ["a"]}
+
+    entry_size = os.path.getsize(tmp_path / "a.json")
+    small = ResultCache(
+        ttl=10, max_entries=10, disk_dir=str(tmp_path), disk_max_bytes=entry_size * 2, clock=clock
+    )
+    os.utime(tmp_path / "a.json", (0, 0))
+    small.put("b", {"messages": ["b"]})
+    small.put("c", {"messages": ["c"]})
+
+    assert sorted(os.listdir(tmp_path)) == ["b.json", "c.json"]
+
+
+runs = []
+
+
+async def deterministic(prompt: str):
+    runs.append(prompt)
+    await rune.output().add_message(f"out {prompt}")
+
+
+@no_result_cache
+async def random_method(prompt: str):
+    runs.append(prompt)
+    await rune.output().add_message(f"out {prompt}")
+
+
+async def run_messages(hub, client, method_name, prompts, bpm=120, first_id=0):
+    for i, prompt in enumerate(prompts, start=first_id):
+        hub.add_pending_message(
+            client.method_tokens[method_name],
+            f"{method_name}-{i}",
+            run_method_request(method_name, bpm=bpm, prompt=prompt),
+        )
+        await client.poll_once()
+        await client.job_executor.join()
+
+
+@pytest.mark.asyncio
+async def test_repeated_requests_are_answered_from_the_cache():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, deterministic, random_method)
+    client.result_cache = ResultCache(disk_dir=None)
+    runs.clear()
+
+    # EXECUTE
+    await run_messages(hub, client, "deterministic", ["x", "x", "y"])
+    await run_messages(hub, client, "random_method", ["x", "x"])
+
+    # ASSERTS
+    assert runs == ["x", "y", "x", "x"]
+    messages = {reply["id"]: reply["response"]["message"] for reply in hub.replies}
+    assert messages["deterministic-0"] == messages["deterministic-1"] == "out x"
+    assert messages["deterministic-2"] == "out y"
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_results_rendered_at_another_tempo_are_not_reused():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, deterministic)
+    client.result_cache = ResultCache(disk_dir=None)
+    runs.clear()
+
+    # EXECUTE
+    await run_messages(hub, client, "deterministic", ["x"], bpm=120)
+    await run_messages(hub, client, "deterministic", ["x"], bpm=90, first_id=1)
+    await run_messages(hub, client, "deterministic", ["x"], bpm=90, first_id=2)
+
+    # ASSERTS
+    assert runs == ["x", "x"]
+
+    await hub.stop()
+
+
+def test_uploads_of_same_named_files_get_their_own_objects(tmp_path):
+    # Cached results keep pointing at their object after another job writes output.wav
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "output.wav").write_bytes(b"first take")
+    (tmp_path / "b" / "output.wav").write_bytes(b"second take")
+
+    first = object_name(str(tmp_path / "a" / "output.wav"))
+    second = object_name(str(tmp_path / "b" / "output.wav"))
+
+    assert first != second
+    assert first.startswith("output-") and first.endswith(".wav")
+    (tmp_path / "b" / "output.wav").write_bytes(b"first take")
+    assert object_name(str(tmp_path / "b" / "output.wav")) == first
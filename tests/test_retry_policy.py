@@ -0,0 +1,197 @@
+import asyncio
+
+import aiohttp
+import pytest
+from runes_client.metrics import metrics
+from runes_client.retry_policy import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryableStatusError,
+    RetryBudget,
+    RetryPolicy,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_policy(**kwargs):
+    kwargs.setdefault("base_delay", 0)
+    kwargs.setdefault("max_delay", 0)
+    return RetryPolicy(**kwargs)
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors_then_succeeds():
+    policy = make_policy(max_attempts=3)
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RetryableStatusError(503)
+        return "ok"
+
+    assert await policy.call("endpoint", attempt) == "ok"
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_attempts():
+    policy = make_policy(max_attempts=2)
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        raise aiohttp.ClientError("boom")
+
+    with pytest.raises(aiohttp.ClientError):
+        await policy.call("endpoint", attempt)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_errors_pass_straight_through():
+    policy = make_policy(max_attempts=3)
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        await policy.call("endpoint", attempt)
+    assert len(calls) == 1
+    assert policy.breaker("hub").state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_per_endpoint_timeout_is_applied():
+    policy = make_policy(max_attempts=1, endpoint_timeouts={"slow": 0.01})
+
+    async def attempt():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await policy.call("slow", attempt)
+
+
+@pytest.mark.asyncio
+async def test_non_idempotent_call_is_retried_only_when_never_processed():
+    policy = make_policy(max_attempts=3, endpoint_timeouts={"reply": 0.01})
+    errors = [RetryableStatusError(503), asyncio.TimeoutError()]
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        raise errors.pop(0)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await policy.call("reply", attempt, idempotent=False)
+    # The 503 was retried, the timeout may have been processed and was not
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_exhausted_budget_stops_retries():
+    budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+    policy = make_policy(max_attempts=5, budget=budget)
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        raise RetryableStatusError(500)
+
+    with pytest.raises(RetryableStatusError):
+        await policy.call("endpoint", attempt)
+    # One first attempt plus the single retry the budget allowed
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_rejects_calls():
+    policy = make_policy(max_attempts=1, failure_threshold=2)
+
+    async def failing():
+        raise RetryableStatusError(502)
+
+    for _ in range(2):
+        with pytest.raises(RetryableStatusError):
+            await policy.call("endpoint", failing)
+
+    async def healthy():
+        return "ok"
+
+    with pytest.raises(CircuitOpenError):
+        await policy.call("endpoint", healthy)
+    assert metrics.get("circuit_breaker_state.hub") == CircuitBreaker.OPEN
+
+
+def test_breaker_half_opens_after_reset_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        "test-target", failure_threshold=1, reset_timeout=10, clock=clock
+    )
+
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    clock.now = 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    # Only one trial call while half open
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert metrics.get("circuit_breaker_state.test-target") == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker("trial", failure_threshold=3, reset_timeout=5, clock=clock)
+    for _ in range(3):
+        breaker.record_failure()
+
+    clock.now = 5
+    assert breaker.allow_request()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_or_cancelled_trial_does_not_wedge_the_circuit():
+    clock = FakeClock()
+    policy = make_policy(max_attempts=1)
+    breaker = CircuitBreaker("hub", failure_threshold=1, reset_timeout=5, clock=clock)
+    policy.breakers["hub"] = breaker
+    breaker.record_failure()
+    clock.now = 5
+
+    async def not_found():
+        raise Exception("HTTP 404")
+
+    with pytest.raises(Exception, match="HTTP 404"):
+        await policy.call("endpoint", not_found)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    task = asyncio.ensure_future(policy.call("endpoint", slow))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    async def healthy():
+        return "ok"
+
+    assert await policy.call("endpoint", healthy) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
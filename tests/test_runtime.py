@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+import pytest
+import runes_client as rune
+from runes_client import WebSocketClient
+from runes_client.runtime import new_event_loop
+from tests.hub_stand_in import HubStandIn, make_client, make_runtime, run_method_request
+
+
+async def generate(a: int):
+    await rune.output().add_message(f"generate {a}")
+
+
+async def variation(a: int):
+    await rune.output().add_message(f"variation {a}")
+
+
+@pytest.mark.asyncio
+async def test_runtime_serves_several_tokens_with_isolated_results():
+    # SETUP
+    hub = await HubStandIn().start()
+    client_one = await make_client(hub, generate)
+    client_two = await make_client(hub, variation)
+
+    runtime = make_runtime()
+    runtime.add_client(client_one)
+    runtime.add_client(client_two)
+
+    hub.add_pending_message(
+        client_one.connection_token, "m1", run_method_request("generate", a=1)
+    )
+    hub.add_pending_message(
+        client_two.connection_token, "m2", run_method_request("variation", a=2)
+    )
+
+    # EXECUTE
+    poll_task = asyncio.create_task(runtime.poll_updates())
+    for _ in range(200):
+        if len(hub.replies) == 2:
+            break
+        await asyncio.sleep(0.01)
+    poll_task.cancel()
+
+    # ASSERTS
+    replies = {reply["id"]: reply for reply in hub.replies}
+    assert replies["m1"]["token"] == client_one.connection_token
+    assert replies["m1"]["response"]["message"] == "generate 1"
+    assert replies["m2"]["token"] == client_two.connection_token
+    assert replies["m2"]["response"]["message"] == "variation 2"
+    assert client_one.poll_scheduler is client_two.poll_scheduler
+
+    await hub.stop()
+
+
+def test_importing_the_client_leaves_asyncio_unpatched():
+    assert asyncio.run.__module__ == "asyncio.runners"
+    assert asyncio.get_event_loop_policy().__class__.__module__.startswith("asyncio")
+
+
+def test_new_event_loop_falls_back_without_uvloop():
+    loop = new_event_loop(use_uvloop=True)
+    try:
+        assert isinstance(loop, asyncio.AbstractEventLoop)
+    finally:
+        loop.close()
+
+
+@pytest.mark.asyncio
+async def test_attach_serves_from_the_running_loop_until_shutdown():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, generate)
+    client.delivery_mode = "poll"
+    runtime = make_runtime()
+    runtime.add_client(client)
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("generate", a=3)
+    )
+
+    # EXECUTE
+    rune.core._runtime, previous = runtime, rune.core._runtime
+    try:
+        with pytest.raises(RuntimeError):
+            rune.connect_to_server()
+        serving = rune.attach_to_running_loop()
+        for _ in range(200):
+            if hub.replies:
+                break
+            await asyncio.sleep(0.01)
+        heartbeat_loop = runtime.heartbeat_loop
+        installed_signals = list(runtime._signals)
+        rune.request_shutdown()
+        await asyncio.wait_for(serving, 5)
+    finally:
+        rune.core._runtime = previous
+
+    # ASSERTS
+    assert hub.replies[0]["response"]["message"] == "generate 3"
+    # Heartbeats keep their own loop, so a blocking async method cannot stall them
+    assert heartbeat_loop is not None
+    assert heartbeat_loop is not asyncio.get_running_loop()
+    assert installed_signals == []
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_clients_without_methods_or_failing_to_register_are_not_served():
+    # SETUP
+    hub = await HubStandIn().start()
+    serving_client = await make_client(hub, generate)
+    failing_client = await make_client(hub, variation)
+    failing_client.master_token = None
+    idle_client = WebSocketClient("127.0.0.1", "1234")
+    runtime = make_runtime()
+    for client in (idle_client, failing_client, serving_client):
+        runtime.add_client(client)
+    hub.add_pending_message(
+        serving_client.connection_token, "m1", run_method_request("generate", a=3)
+    )
+
+    # EXECUTE
+    serving = asyncio.create_task(runtime.run(handle_signals=False))
+    for _ in range(200):
+        if hub.replies:
+            break
+        await asyncio.sleep(0.01)
+    runtime.request_drain()
+    await asyncio.wait_for(serving, 5)
+
+    # ASSERTS
+    assert runtime.clients == [serving_client]
+    assert hub.replies[0]["response"]["message"] == "generate 3"
+
+    await hub.stop()
+
+
+async def cpu_bound(a: int):
+    # An async method that never yields, blocking the main loop
+    time.sleep(0.4)
+    await rune.output().add_message(f"cpu bound {a}")
+
+
+@pytest.mark.asyncio
+async def test_heartbeats_keep_flowing_while_an_async_method_blocks_the_loop():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, cpu_bound)
+    heartbeats = []
+
+    async def send_heartbeat():
+        heartbeats.append(time.monotonic())
+
+    client.send_heartbeat = send_heartbeat
+    runtime = make_runtime()
+    runtime.HEARTBEAT_INTERVAL = 0.05
+    runtime.add_client(client)
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("cpu_bound", a=1)
+    )
+
+    # EXECUTE
+    serving = asyncio.create_task(runtime.run(handle_signals=False))
+    for _ in range(200):
+        if hub.replies:
+            break
+        await asyncio.sleep(0.01)
+    runtime.request_drain()
+    await asyncio.wait_for(serving, 5)
+
+    # ASSERTS
+    assert hub.replies[0]["response"]["message"] == "cpu bound 1"
+    gaps = [later - earlier for earlier, later in zip(heartbeats, heartbeats[1:])]
+    assert max(gaps) < 0.3
+    assert runtime.heartbeat_thread is None
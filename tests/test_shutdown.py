@@ -0,0 +1,124 @@
+import asyncio
+import os
+import signal
+
+import pytest
+import runes_client as rune
+from runes_client import RunesRuntime
+from tests.hub_stand_in import HubStandIn, make_client, make_runtime, run_method_request
+
+started = []
+
+
+async def render(seconds: float):
+    started.append(seconds)
+    await asyncio.sleep(seconds)
+    await rune.output().add_message(f"rendered in {seconds}")
+
+
+async def start_runtime(hub, grace):
+    client = await make_client(hub, render)
+    client.delivery_mode = "poll"
+    runtime = make_runtime(shutdown_grace_seconds=grace)
+    runtime.add_client(client)
+    started.clear()
+    run_task = asyncio.create_task(runtime.run())
+    return runtime, client, run_task
+
+
+async def wait_for(condition):
+    for _ in range(300):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+@pytest.mark.asyncio
+async def test_sigterm_drains_in_flight_jobs_before_stopping():
+    # SETUP
+    hub = await HubStandIn().start()
+    runtime, client, run_task = await start_runtime(hub, grace=5)
+    token = client.connection_token
+    await wait_for(lambda: hub.loaded.get(token) is True)
+    hub.add_pending_message(token, "m1", run_method_request("render", seconds=0.2))
+    await wait_for(lambda: started)
+
+    # EXECUTE
+    os.kill(os.getpid(), signal.SIGTERM)
+    # Arrives after the drain started, so it is never claimed
+    hub.add_pending_message(token, "m2", run_method_request("render", seconds=0))
+    await asyncio.wait_for(run_task, 5)
+
+    # ASSERTS
+    assert started == [0.2]
+    assert [reply["id"] for reply in hub.replies] == ["m1"]
+    assert hub.replies[0]["response"]["message"] == "rendered in 0.2"
+    assert hub.statuses["m2"] == "pending"
+    assert hub.loaded[token] is False
+    assert runtime.heartbeat_task is None
+    assert client.jobs == {}
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_jobs_still_running_after_the_grace_period_get_an_error_reply():
+    # SETUP
+    hub = await HubStandIn().start()
+    runtime, client, run_task = await start_runtime(hub, grace=0.1)
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("render", seconds=30)
+    )
+    await wait_for(lambda: started)
+
+    # EXECUTE
+    rune.core._runtime, previous = runtime, rune.core._runtime
+    try:
+        rune.request_shutdown()
+        await asyncio.wait_for(run_task, 5)
+    finally:
+        rune.core._runtime = previous
+
+    # ASSERTS
+    assert len(hub.replies) == 1
+    assert hub.replies[0]["response"]["error"] == RunesRuntime.SHUTDOWN_REASON
+    assert client.jobs == {}
+    assert client.job_executor.tasks == set()
+
+    await hub.stop()
+
+
+def plain_render(seconds: float):
+    rune.output().add_message(f"plain render in {seconds}")
+
+
+@pytest.mark.asyncio
+async def test_runtime_serves_again_after_a_drain():
+    # SETUP
+    hub = await HubStandIn().start()
+    runtime, client, run_task = await start_runtime(hub, grace=1)
+    await wait_for(lambda: hub.loaded.get(client.connection_token) is True)
+    runtime.request_drain()
+    await asyncio.wait_for(run_task, 5)
+    await client.register_method(plain_render)
+
+    # EXECUTE
+    run_task = asyncio.create_task(runtime.run(handle_signals=False))
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("render", seconds=0)
+    )
+    hub.add_pending_message(
+        client.method_tokens["plain_render"],
+        "m2",
+        run_method_request("plain_render", seconds=0),
+    )
+    await wait_for(lambda: len(hub.replies) == 2)
+    runtime.request_drain()
+    await asyncio.wait_for(run_task, 5)
+
+    # ASSERTS
+    messages = {reply["id"]: reply["response"]["message"] for reply in hub.replies}
+    assert messages == {"m1": "rendered in 0", "m2": "plain render in 0"}
+
+    await hub.stop()
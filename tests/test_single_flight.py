@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+import runes_client as rune
+from runes_client import WebSocketClient
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+runs = []
+
+
+async def render(prompt: str):
+    runs.append(prompt)
+    await asyncio.sleep(0.05)
+    await rune.output().add_message(f"rendered {prompt}")
+
+
+async def single_flight_client(hub):
+    client = await make_client(hub, render)
+    client.single_flight = True
+    runs.clear()
+    return client
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_in_flight_share_one_run():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await single_flight_client(hub)
+    client.job_executor.set_max_queued_jobs(1)
+    token = client.connection_token
+    for message_id in ["m1", "m2", "m3"]:
+        hub.add_pending_message(
+            token, message_id, run_method_request("render", prompt="kick")
+        )
+    hub.add_pending_message(token, "m4", run_method_request("render", prompt="snare"))
+
+    # EXECUTE
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert runs == ["kick", "snare"]
+    messages = {reply["id"]: reply["response"]["message"] for reply in hub.replies}
+    assert messages == {
+        "m1": "rendered kick",
+        "m2": "rendered kick",
+        "m3": "rendered kick",
+        "m4": "rendered snare",
+    }
+    processing = {message_id for _, message_id, status in hub.status_updates if status == "processing"}
+    assert processing == {"m1", "m2", "m3", "m4"}
+    assert client.in_flight == {}
+    assert client.jobs == {}
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_aborting_the_running_request_hands_the_work_to_a_duplicate():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await single_flight_client(hub)
+    token = client.connection_token
+    for message_id in ["m1", "m2", "m3"]:
+        hub.add_pending_message(
+            token, message_id, run_method_request("render", prompt="kick")
+        )
+    await client.poll_once()
+    await asyncio.sleep(0.01)
+
+    # EXECUTE
+    assert await client.cancel_job("m3", reason="Aborted")
+    assert await client.cancel_job("m1", reason="Aborted")
+    await asyncio.sleep(0.01)
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert runs == ["kick", "kick"]
+    replies = {reply["id"]: reply["response"] for reply in hub.replies}
+    assert replies["m1"]["error"] == "Aborted"
+    assert replies["m3"]["error"] == "Aborted"
+    assert replies["m2"]["message"] == "rendered kick"
+    assert replies["m2"]["error"] is None
+
+    await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_requests_from_another_tempo_or_with_single_flight_off_run_separately():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await single_flight_client(hub)
+    client.job_executor.set_max_queued_jobs(2)
+    token = client.connection_token
+    hub.add_pending_message(
+        token, "m1", run_method_request("render", bpm=120, prompt="kick")
+    )
+    hub.add_pending_message(
+        token, "m2", run_method_request("render", bpm=90, prompt="kick")
+    )
+
+    # EXECUTE
+    await client.poll_once()
+    await client.job_executor.join()
+    client.single_flight = WebSocketClient("127.0.0.1", "1234").single_flight
+    hub.add_pending_message(token, "m3", run_method_request("render", prompt="snare"))
+    hub.add_pending_message(token, "m4", run_method_request("render", prompt="snare"))
+    await client.poll_once()
+    await client.job_executor.join()
+
+    # ASSERTS
+    assert runs == ["kick", "kick", "snare", "snare"]
+    assert client.in_flight == {}
+
+    await hub.stop()
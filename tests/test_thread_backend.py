@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import runes_client as rune
+from runes_client.output import ThreadSafeResults
+from tests.hub_stand_in import HubStandIn, make_client, run_method_request
+
+
+def blocking_method(a: int):
+    # Blocks its thread; the event loop must keep running meanwhile
+    time.sleep(0.2)
+    results = rune.output()
+    assert isinstance(results, ThreadSafeResults)
+    results.add_message(f"{a} from {threading.current_thread().name}")
+
+
+@pytest.mark.asyncio
+async def test_plain_method_runs_off_the_event_loop():
+    # SETUP
+    hub = await HubStandIn().start()
+    client = await make_client(hub, blocking_method)
+    hub.add_pending_message(
+        client.connection_token, "m1", run_method_request("blocking_method", a=3)
+    )
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+
+    # EXECUTE
+    await client.poll_once()
+    await client.job_executor.join()
+    ticker_task.cancel()
+
+    # ASSERTS
+    assert ticks >= 5
+    assert len(hub.replies) == 1
+    assert hub.replies[0]["id"] == "m1"
+    assert hub.replies[0]["response"]["message"].startswith("3 from runes-method")
+
+    client.method_thread_pool.shutdown()
+    await hub.stop()
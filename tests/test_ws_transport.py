@@ -0,0 +1,149 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+import websockets
+from runes_client import WebSocketClient
+from runes_client.ws_transport import WebSocketTransport
+
+
+async def start_server(handler):
+    server = await websockets.serve(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"ws://127.0.0.1:{port}"
+
+
+@pytest.mark.asyncio
+async def test_transport_receives_pushed_messages_and_replies():
+    # SETUP
+    replies = asyncio.Queue()
+
+    async def handler(websocket, *args):
+        await websocket.send(json.dumps({"type": "run_method", "message_id": "m1"}))
+        replies.put_nowait(json.loads(await websocket.recv()))
+
+    server, uri = await start_server(handler)
+    received = []
+
+    async def on_message(msg):
+        received.append(msg)
+        await transport.send({"type": "results", "message_id": msg["message_id"]})
+
+    transport = WebSocketTransport(uri, on_message=on_message)
+
+    # EXECUTE
+    task = asyncio.create_task(transport.run())
+    reply = await asyncio.wait_for(replies.get(), timeout=5)
+
+    # ASSERTS
+    assert received == [{"type": "run_method", "message_id": "m1"}]
+    assert reply == {"type": "results", "message_id": "m1"}
+
+    await transport.close()
+    await asyncio.wait_for(task, timeout=5)
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_transport_reconnects_after_drop():
+    # SETUP
+    connections = []
+
+    async def handler(websocket, *args):
+        connections.append(websocket)
+        if len(connections) == 1:
+            await websocket.close()
+            return
+        await websocket.wait_closed()
+
+    server, uri = await start_server(handler)
+    connected = asyncio.Event()
+
+    async def on_connect():
+        if len(connections) >= 2:
+            connected.set()
+
+    transport = WebSocketTransport(
+        uri, on_message=None, on_connect=on_connect, min_backoff=0.01, max_backoff=0.05
+    )
+
+    # EXECUTE
+    task = asyncio.create_task(transport.run())
+    await asyncio.wait_for(connected.wait(), timeout=5)
+
+    # ASSERTS
+    assert len(connections) == 2
+    assert transport.connected
+
+    await transport.close()
+    await asyncio.wait_for(task, timeout=5)
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_transport_not_connected_when_server_unreachable():
+    transport = WebSocketTransport("ws://127.0.0.1:1", on_message=None)
+
+    assert not transport.connected
+    assert await transport.send({"type": "results"}) is False
+
+
+async def echo_method(a: int):
+    print(f"Input A: {a}")
+
+
+@pytest.mark.asyncio
+async def test_client_runs_pushed_job_and_replies_on_socket():
+    # SETUP
+    received = asyncio.Queue()
+
+    async def handler(websocket, *args):
+        async for raw_msg in websocket:
+            msg = json.loads(raw_msg)
+            received.put_nowait(msg)
+            if msg["type"] == "register":
+                await websocket.send(
+                    json.dumps(
+                        {
+                            "type": "run_method",
+                            "message_id": "m1",
+                            "bpm": 120,
+                            "sample_rate": 44100,
+                            "data": {
+                                "method_name": "echo_method",
+                                "params": {"a": {"value": 3}},
+                            },
+                        }
+                    )
+                )
+
+    server, uri = await start_server(handler)
+    host, port = uri.rsplit(":", 1)
+
+    client = WebSocketClient("127.0.0.1", port)
+    client.set_token(str(uuid.uuid4()))
+    await client.register_method(echo_method)
+
+    # EXECUTE
+    task = asyncio.create_task(client.listen())
+    messages = {}
+    while "results" not in messages:
+        msg = await asyncio.wait_for(received.get(), timeout=10)
+        messages[msg["type"]] = msg
+
+    # ASSERTS
+    assert messages["register"]["token"] == client.connection_token
+    assert messages["update_message_status"]["message_id"] == "m1"
+    assert messages["update_message_status"]["status"] == "processing"
+    response = messages["results"]["data"]["response"]
+    assert response["id"] == "m1"
+    assert response["status"] == "completed"
+    assert "Input A: 3" in response["logs"]
+
+    await client.websocket.close()
+    await asyncio.wait_for(task, timeout=5)
+    server.close()
+    await server.wait_closed()